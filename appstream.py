@@ -1,7 +1,27 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import os
+import hashlib
+import tempfile
+from datetime import date
+
+from motor import simular_mes, simular_curva_meses, precios_mes, ESTRATEGIAS
+from optimo import brecha_heuristica, limite_discretizacion
+from perfiles import perfil_mensual, SECTORES, SECTOR_POR_DEFECTO
+from barrido import barrido_dimensionado
+from curvas import cargar_curva
+from montecarlo import montecarlo_facturas
+from ciclovida import ciclo_vida, SALUD_FIN_VIDA
+from tarifas import PERIODOS
+from potencia import optimizar_potencia_contratada
+from precios import importar_precios, series_disponibles, firma_serie
+from dias_tipo import cotizar_curva, conviene_cotizacion_rapida, dias_completos, K_POR_DEFECTO
+from linea_temporal import simular_linea_temporal, fechar_periodos
+from traza import crear_traza, ventana, columnas as columnas_traza
+from instrumentacion import medir, etapa
+from graficas import png_operacion, png_barrido, png_abanico, png_ciclo_vida
+from exportar import exportar, hoja_registros, hoja_barrido, hoja_matriz, hoja_traza
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(
@@ -19,113 +39,243 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- FUNCIÓN DE SIMULACIÓN (MOTOR MATEMÁTICO) ---
-@st.cache_data # Cacheamos para que no recalcule si no cambias los inputs
-def ejecutar_simulacion(datos_df, cap_bat, pot_bat, eficiencia, precio_excedente):
-    
+# Caché por mes en vez de por tabla completa: la clave es la fila normalizada + los parámetros
+# de la batería (+ SOC de partida si se arrastra entre meses). Al editar una celda solo se
+# vuelve a simular esa fila; con SOC arrastrado, además los meses siguientes cuyo SOC de
+# partida haya cambiado (la clave de cada mes encadena el SOC final del anterior).
+TAMANO_CACHE_MESES = 512
+DECIMALES_CLAVE = 6
+DIAS_MES = 30  # Perfil sintético de cada fila de factura (simular_mes)
+PASOS_MES = DIAS_MES * 24
+RUTA_PERFIL_APP = os.path.join('resultados', 'perfil_app.prof')
+MIME_EXPORTACION = {'.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.csv': 'text/csv'}
+VENTANAS_DETALLE = {'48 horas': 2, '1 semana': 7, 'Mes completo': 31, 'Todos los meses': None}  # Días (recortados al mes)
+
+@st.cache_data(max_entries=TAMANO_CACHE_MESES, show_spinner=False)
+def simular_mes_cacheado(fila, cap_bat, pot_bat, eficiencia, sector, estrategia, soc_inicial):
+    consumo, excedente, precio_valle, precio_punta, precio_venta, precios_periodo, inicio = fila
+    mes = {
+        'mes': '',
+        'consumo_total_kwh': consumo,
+        'excedente_total_kwh': excedente,
+        'precio_valle': precio_valle,
+        'precio_punta': precio_punta,
+        'precio_venta_excedente': precio_venta,
+    }
+    if precios_periodo:
+        mes.update(precios_periodo=list(precios_periodo), inicio=inicio)
+    # La caché guarda solo el bloque float32 de traza del mes (5 columnas x 720 pasos)
+    traza_mes = crear_traza(PASOS_MES)
+    res_mes = simular_mes(mes, cap_bat, pot_bat, eficiencia, sector, estrategia, dias=DIAS_MES,
+                          soc_inicial=soc_inicial, traza=traza_mes)
+    return {
+        'ahorro': res_mes['ahorro'],
+        'ahorro_heuristica': res_mes['ahorro_heuristica'],
+        'soc_final': res_mes['resultado']['soc_final'],
+        'traza': traza_mes,
+    }
+
+def clave_mes(mes):
+    """
+    Valores de la fila que afectan al cálculo, como floats redondeados (el nombre del mes no cuenta),
+    más los precios P1..P6 y la fecha de inicio si la tabla usa la tarifa 3.0TD.
+    """
+    valores = tuple(round(float(mes[c]), DECIMALES_CLAVE) for c in
+                    ('consumo_total_kwh', 'excedente_total_kwh', 'precio_valle', 'precio_punta', 'precio_venta_excedente'))
+    if mes.get('precios_periodo'):
+        return valores + (tuple(mes['precios_periodo']), mes['inicio'])
+    return valores + (None, None)
+
+def ejecutar_simulacion(datos_df, cap_bat, pot_bat, eficiencia, precio_excedente, sector=SECTOR_POR_DEFECTO,
+                        estrategia='heuristica', arrastrar_soc=False, primer_inicio=None, tarifa=None):
+    """
+    Simula todas las filas y devuelve (tabla mensual, ahorro total, traza, inicios). La traza es
+    un único búfer float32 (5, pasos totales) con el detalle paso a paso de todos los meses: el
+    mes i ocupa los pasos [inicios[i], inicios[i + 1]) (bloques de PASOS_MES por defecto).
+    Con primer_inicio, línea temporal continua con días reales de calendario (simular_linea_temporal):
+    los puntos de control quedan en la sesión y al editar una fila se reanuda desde ella.
+    tarifa: (precios P1..P6, inicio de la primera factura) para simular las filas con la tarifa 3.0TD.
+    """
+    if primer_inicio is not None:
+        return ejecutar_linea_temporal(datos_df, cap_bat, pot_bat, eficiencia, precio_excedente, sector,
+                                       estrategia, primer_inicio, tarifa)
     resultados_mensuales = []
-    detalle_horario_ejemplo = None # Guardaremos un mes para ver el detalle hora a hora
     ahorro_total = 0
+    soc_inicial = 0.0
+    meses = filas_a_meses(datos_df, precio_excedente, tarifa)
+    traza = crear_traza(len(meses) * PASOS_MES)
     
-    # Iteramos por cada fila del editor de datos
-    for index, row in datos_df.iterrows():
-        nombre = row['Mes']
-        dias = 30
-        horas_totales = dias * 24
-        
-        # 1. GENERAR PERFIL SINTÉTICO (Igual que en el script anterior)
-        df = pd.DataFrame(index=range(horas_totales))
-        df['hora_dia'] = df.index % 24
-        
-        # Perfil Consumo Hostelería 
-        condiciones = [
-            (df['hora_dia'] < 8),
-            (df['hora_dia'] >= 8) & (df['hora_dia'] < 12),
-            (df['hora_dia'] >= 12) & (df['hora_dia'] < 17),
-            (df['hora_dia'] >= 17) & (df['hora_dia'] < 20),
-            (df['hora_dia'] >= 20)
-        ]
-        pesos = [0.4, 0.8, 2.0, 0.8, 1.2] 
-        df['perfil_base'] = np.select(condiciones, pesos)
+    # Iteramos por cada fila del editor de datos (mismo motor que el script de consola)
+    for i, mes in enumerate(meses):
+        # Con la caché caliente esta etapa es solo la búsqueda; si falla, dentro aparecen perfil/precios/despacho
+        with etapa('meses', PASOS_MES):
+            res_mes = simular_mes_cacheado(clave_mes(mes), float(cap_bat), float(pot_bat), float(eficiencia),
+                                           sector, estrategia, round(soc_inicial, DECIMALES_CLAVE))
+        ventana(traza, i * PASOS_MES, PASOS_MES)[:] = res_mes['traza']
+        if arrastrar_soc:
+            soc_inicial = res_mes['soc_final']
+        ahorro_mes = res_mes['ahorro']
         
-        factor_cons = row['Consumo (kWh)'] / df['perfil_base'].sum()
-        df['consumo_kwh'] = df['perfil_base'] * factor_cons
-        
-        # Perfil Solar
-        df['perfil_solar'] = np.where(
-            (df['hora_dia'] > 7) & (df['hora_dia'] < 20),
-            np.sin((df['hora_dia'] - 7) * np.pi / 13), 0
-        )
-        factor_solar = row['Excedente (kWh)'] / df['perfil_solar'].sum() if df['perfil_solar'].sum() > 0 else 0
-        df['solar_kwh'] = df['perfil_solar'] * factor_solar
-        
-        # Precios (Simulamos tarifa con discriminación horaria simple)
-        df['precio_compra'] = np.where(df['hora_dia'] < 8, row['Precio Valle (€)'], row['Precio Punta (€)'])
-        df['es_valle'] = df['hora_dia'] < 8
-        
-        # 2. SIMULACIÓN BATERÍA
-        soc = 0.0
-        ahorro_mes = 0.0
-        lista_soc = []
-        lista_ahorro_hora = []
-        
-        for i in range(len(df)):
-            cons = df.loc[i, 'consumo_kwh']
-            solar = df.loc[i, 'solar_kwh']
-            precio_actual = df.loc[i, 'precio_compra']
-            es_valle = df.loc[i, 'es_valle']
-            
-            energia_entrada = 0.0
-            coste_carga = 0.0
-            
-            # A) Carga Solar
-            if solar > 0:
-                espacio = cap_bat - soc
-                carga = min(solar, espacio, pot_bat)
-                soc += carga * np.sqrt(eficiencia)
-                coste_carga += carga * precio_excedente # Coste oportunidad
-                energia_entrada += carga
-            
-            # B) Carga Red (Arbitraje)
-            if es_valle and solar == 0:
-                espacio = cap_bat - soc
-                # Margen mínimo para operar (Spread)
-                precio_salida_real = row['Precio Valle (€)'] / (eficiencia)
-                margen = row['Precio Punta (€)'] - precio_salida_real
-                
-                if margen > 0.02 and espacio > 0: # Si ganamos >2 céntimos
-                    carga = min(espacio, pot_bat)
-                    soc += carga * np.sqrt(eficiencia)
-                    coste_carga += carga * row['Precio Valle (€)']
-                    energia_entrada += carga
-            
-            # C) Descarga (Ahorro)
-            ahorro_bruto = 0.0
-            if not es_valle and soc > 0 and cons > 0:
-                energia_disponible_ac = soc * np.sqrt(eficiencia)
-                descarga = min(cons, energia_disponible_ac, pot_bat)
-                
-                soc -= descarga / np.sqrt(eficiencia)
-                ahorro_bruto = descarga * precio_actual
-            
-            balance = ahorro_bruto - coste_carga
-            ahorro_mes += balance
-            lista_soc.append(soc)
-            lista_ahorro_hora.append(balance)
-            
         resultados_mensuales.append({
-            'Mes': nombre,
+            'Mes': mes['mes'],
             'Ahorro (€)': round(ahorro_mes, 2),
-            'Consumo Red (kWh)': int(row['Consumo (kWh)']),
-            'Excedente FV (kWh)': int(row['Excedente (kWh)'])
+            'Ahorro heurística (€)': round(res_mes['ahorro_heuristica'], 2),
+            'Consumo Red (kWh)': int(mes['consumo_total_kwh']),
+            'Excedente FV (kWh)': int(mes['excedente_total_kwh'])
         })
         ahorro_total += ahorro_mes
         
-        # Guardamos el último mes completo para graficar detalle
-        df['soc'] = lista_soc
-        df['ahorro_acum'] = np.cumsum(lista_ahorro_hora)
-        detalle_horario_ejemplo = df
-        
-    return pd.DataFrame(resultados_mensuales), ahorro_total, detalle_horario_ejemplo
+    with etapa('tabla', len(resultados_mensuales)):
+        df_resultados = pd.DataFrame(resultados_mensuales)
+    return df_resultados, ahorro_total, traza, [i * PASOS_MES for i in range(len(meses) + 1)]
+
+def ejecutar_linea_temporal(datos_df, cap_bat, pot_bat, eficiencia, precio_excedente, sector, estrategia, primer_inicio,
+                            tarifa=None):
+    """Rama continua de ejecutar_simulacion (puntos de control en st.session_state['linea_temporal'])."""
+    meses = fechar_periodos(filas_a_meses(datos_df, precio_excedente, tarifa), primer_inicio)
+    with etapa('linea_temporal'):
+        linea = simular_linea_temporal(meses, float(cap_bat), float(pot_bat), float(eficiencia), sector, estrategia,
+                                       anterior=st.session_state.get('linea_temporal'), traza=True)
+    st.session_state['linea_temporal'] = linea
+    puntos = linea['puntos_control']
+    with etapa('tabla', len(puntos)):
+        df_resultados = pd.DataFrame([{
+            'Mes': mes['mes'],
+            'Días': punto['dias'],
+            'SOC inicial (kWh)': round(punto['soc_inicial'], 1),
+            'Ahorro (€)': round(punto['ahorro'], 2),
+            'Ahorro heurística (€)': round(punto['ahorro_heuristica'], 2),
+            'Consumo Red (kWh)': int(mes['consumo_total_kwh']),
+            'Excedente FV (kWh)': int(mes['excedente_total_kwh'])
+        } for mes, punto in zip(meses, puntos)])
+    inicios = [p['paso_inicio'] for p in puntos] + [linea['pasos_totales']]
+    return df_resultados, linea['ahorro_total'], linea['traza'], inicios
+
+def detalle_ventana(meses, traza, inicios, inicio, n_pasos, sector=SECTOR_POR_DEFECTO):
+    """
+    Ventana [inicio, inicio + n_pasos) de la traza de todos los meses para graficar: cortes sin
+    copia de la traza + precio de compra de los meses que toca (perfiles de la caché de plantillas).
+    inicios: paso en que empieza cada mes (y el total al final), como lo devuelve ejecutar_simulacion.
+    """
+    primero = int(np.searchsorted(inicios, inicio, side='right')) - 1
+    ultimo = int(np.searchsorted(inicios, inicio + n_pasos - 1, side='right')) - 1
+    precios = []
+    for i in range(primero, ultimo + 1):
+        dias = (inicios[i + 1] - inicios[i]) // 24
+        hora_dia, _, _ = perfil_mensual(meses[i]['consumo_total_kwh'], meses[i]['excedente_total_kwh'], dias, sector=sector)
+        precios.append(precios_mes(meses[i], hora_dia, dias)[0])
+    desde = inicio - inicios[primero]
+    detalle = columnas_traza(ventana(traza, inicio, n_pasos))
+    detalle['precio_compra'] = np.concatenate(precios)[desde:desde + n_pasos]
+    return detalle
+
+def filas_a_meses(datos_df, precio_excedente, tarifa=None):
+    """
+    Convierte la tabla del editor al formato de meses de los scripts de consola. Con tarifa
+    (precios P1..P6, inicio de la primera factura) cada mes lleva 'precios_periodo' e 'inicio'
+    en meses naturales consecutivos (calendario 3.0TD real en precios_mes).
+    """
+    meses = [{
+        'mes': row['Mes'],
+        'consumo_total_kwh': row['Consumo (kWh)'],
+        'excedente_total_kwh': row['Excedente (kWh)'],
+        'precio_valle': row['Precio Valle (€)'],
+        'precio_punta': row['Precio Punta (€)'],
+        'precio_venta_excedente': precio_excedente
+    } for row in datos_df.to_dict('records')]
+    if tarifa is None:
+        return meses
+    precios_periodo, inicio = tarifa
+    return fechar_periodos([{**mes, 'precios_periodo': list(precios_periodo)} for mes in meses], inicio)
+
+@st.cache_data
+def ejecutar_barrido(datos_df, capacidades, potencias, eficiencia, precio_excedente, coste_kwh, sector=SECTOR_POR_DEFECTO,
+                     tarifa=None):
+    return barrido_dimensionado(
+        filas_a_meses(datos_df, precio_excedente, tarifa), list(capacidades), list(potencias),
+        eficiencia=eficiencia, coste_kwh=coste_kwh, sector=sector
+    )
+
+@st.cache_data
+def ejecutar_montecarlo(datos_df, n_escenarios, cap_bat, pot_bat, eficiencia, precio_excedente, inversion,
+                        sector=SECTOR_POR_DEFECTO, semilla=None):
+    return montecarlo_facturas(
+        filas_a_meses(datos_df, precio_excedente), n_escenarios, cap_bat, pot_bat, eficiencia,
+        sector, inversion, semilla=semilla
+    )
+
+@st.cache_data
+def ejecutar_ciclo_vida(datos_df, anios, cap_bat, pot_bat, eficiencia, precio_excedente, inversion, tasa_descuento,
+                        escalado_precios, sector=SECTOR_POR_DEFECTO, estrategia='heuristica', tarifa=None):
+    return ciclo_vida(
+        filas_a_meses(datos_df, precio_excedente, tarifa), anios, cap_bat, pot_bat, eficiencia, sector, estrategia,
+        inversion, tasa_descuento, escalado_precios
+    )
+
+def contenido_exportado(hojas, extension):
+    """
+    Callable para st.download_button: al pulsar el botón (en otro hilo, sin rerun) escribe las
+    hojas en streaming a un temporal (exportar.py) y devuelve los bytes del fichero.
+    hojas es una función sin argumentos que crea los generadores de filas en ese momento.
+    """
+    def generar():
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'exportacion' + extension)
+            exportar(ruta, hojas())
+            with open(ruta, 'rb') as f:
+                return f.read()
+    return generar
+
+def guardar_curva_subida(fichero, carpeta='curvas'):
+    """
+    Guarda el fichero subido en disco (nombre = hash del contenido) para que cargar_curva
+    deje su caché .npy al lado y los reruns no vuelvan a parsear el CSV/Excel.
+    """
+    contenido = fichero.getvalue()
+    extension = os.path.splitext(fichero.name)[1].lower()
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, hashlib.sha1(contenido).hexdigest()[:16] + extension)
+    if not os.path.exists(ruta):
+        with open(ruta, 'wb') as f:
+            f.write(contenido)
+    return ruta
+
+@st.cache_data(show_spinner=False)
+def importar_serie_subida(ruta, serie):
+    # La ruta lleva el hash del contenido: cada fichero distinto se importa una sola vez
+    return importar_precios(ruta, serie)
+
+@st.cache_data
+def ejecutar_simulacion_curva(ruta, contador, cap_bat, pot_bat, eficiencia, precio_excedente, precio_valle, precio_punta,
+                              precios_periodo=None, serie_precios=None, firma_precios=None):
+    # firma_precios solo forma parte de la clave de caché: cambia al reimportar la serie
+    meses = simular_curva_meses(cargar_curva(ruta), contador, cap_bat, pot_bat, eficiencia, precio_excedente,
+                                precio_valle, precio_punta, precios_periodo, serie_precios)
+    resultados = []
+    for mes in meses:
+        fila = {
+            'Mes': mes['mes'],
+            'Ahorro (€)': round(mes['ahorro'], 2),
+            'Consumo Red (kWh)': int(mes['consumo_kwh']),
+            'Excedente FV (kWh)': int(mes['excedente_kwh'])
+        }
+        if serie_precios:
+            fila['Ahorro indexado (€)'] = round(mes['ahorro_indexado'], 2)
+            fila['Precio medio indexado (€/kWh)'] = round(mes['precio_medio_indexado'], 4)
+        resultados.append(fila)
+    return pd.DataFrame(resultados)
+
+@st.cache_data(show_spinner="Cotizando con días tipo...")
+def ejecutar_cotizacion_rapida(ruta, contador, cap_bat, pot_bat, eficiencia, precio_excedente, precio_valle, precio_punta,
+                               precios_periodo, k, estrategia, comparar):
+    return cotizar_curva(cargar_curva(ruta), contador, precio_valle, precio_punta, precios_periodo, k, cap_bat, pot_bat,
+                         eficiencia, precio_excedente, estrategia, comparar=comparar)
+
+@st.cache_data(show_spinner="Optimizando potencia contratada...")
+def ejecutar_potencia(ruta, contador, cap_bat, pot_bat, eficiencia):
+    curva = cargar_curva(ruta)
+    return optimizar_potencia_contratada(curva['consumo'][contador], curva['tiempo'], curva['horas_paso'],
+                                         cap_bat, pot_bat, eficiencia)
 
 # --- INTERFAZ DE USUARIO ---
 
@@ -135,11 +285,35 @@ with st.sidebar:
     capacidad = st.number_input("Capacidad Batería (kWh)", value=100, step=10)
     potencia = st.number_input("Potencia Inversor (kW)", value=50, step=5)
     eficiencia = st.slider("Eficiencia Global (%)", 80, 100, 90) / 100
+    estrategia = st.radio("Estrategia de despacho", ESTRATEGIAS,
+                          format_func=lambda e: {'heuristica': 'Reglas (Solar + Valle)', 'optima': 'Óptima (programación dinámica)'}[e])
+    sector = st.selectbox("Perfil de consumo (sector)", list(SECTORES), index=list(SECTORES).index(SECTOR_POR_DEFECTO),
+                          format_func=lambda s: s.replace('_', ' ').capitalize())
+    continuo = st.checkbox("Línea temporal continua (días reales)", value=False,
+                           help="Todas las filas como una sola serie con la duración real de cada mes y el SOC arrastrado; "
+                                "al editar una fila se recalcula solo desde ella")
+    primer_inicio = st.date_input("Inicio de la primera factura", value=date(2025, 3, 1)) if continuo else None
+    arrastrar_soc = st.checkbox("Arrastrar carga de la batería entre meses", value=False, disabled=continuo,
+                                help="Cada mes empieza con el SOC final del anterior (por defecto, batería vacía)")
     
     st.divider()
     st.header("💰 Datos Económicos")
     inversion = st.number_input("Coste Instalación (€)", value=30000, step=1000)
     precio_excedente = st.number_input("Precio Venta Excedente (€/kWh)", value=0.10, format="%.3f")
+    # Tarifa 3.0TD para las filas de la tabla (la curva real tiene su propia opción)
+    tarifa_facturas = None
+    if st.checkbox("Tarifa 3.0TD en las facturas (6 periodos)", value=False,
+                   help="Calendario real (temporadas, fines de semana y festivos) en lugar de Valle/Punta; "
+                        "las filas son meses naturales consecutivos desde la fecha de inicio"):
+        inicio_facturas = primer_inicio or st.date_input("Inicio de la primera factura", value=date(2025, 3, 1),
+                                                         key="inicio_facturas")
+        por_defecto = (0.180, 0.160, 0.145, 0.130, 0.120, 0.092)
+        tarifa_facturas = (tuple(st.number_input(f"{p} (€/kWh)", value=v, format="%.3f", key=f"factura_{p}")
+                                 for p, v in zip(PERIODOS, por_defecto)), inicio_facturas.isoformat())
+    
+    with st.expander("⏱️ Rendimiento"):
+        medir_memoria = st.checkbox("Pico de memoria por etapa (tracemalloc, más lento)", value=False)
+        perfilar = st.checkbox("Perfil cProfile de la simulación", value=False)
     
     # st.info("💡 Consejo: Prueba a bajar el 'Precio Valle' en la tabla de datos a 0.05€ para simular una tarifa Indexada.")
 
@@ -161,74 +335,305 @@ datos_iniciales = pd.DataFrame([
 # Editor interactivo
 df_input = st.data_editor(datos_iniciales, num_rows="dynamic", use_container_width=True)
 
-# Botón de Cálculo
+# Botón de Cálculo: una vez pulsado los resultados siguen visibles al mover los selectores de la
+# gráfica (los meses ya simulados salen de la caché)
 if st.button("🚀 Calcular rentabilidad", type="primary"):
+    st.session_state['calculado'] = True
+
+if st.session_state.get('calculado'):
+    # medir() cierra la medición (cProfile, tracemalloc) aunque la ejecución se corte con una
+    # excepción o con el RerunException/StopException de Streamlit
+    with medir(memoria=medir_memoria, ruta_perfil=RUTA_PERFIL_APP if perfilar else None) as medicion:
+        # Ejecutar lógica
+        df_resultados, ahorro_total, traza, inicios = ejecutar_simulacion(
+            df_input, capacidad, potencia, eficiencia, precio_excedente, sector, estrategia, arrastrar_soc, primer_inicio,
+            tarifa_facturas
+        )
     
-    # Ejecutar lógica
-    df_resultados, ahorro_total, df_detalle = ejecutar_simulacion(
-        df_input, capacidad, potencia, eficiencia, precio_excedente
-    )
+        # Proyecciones
+        meses_simulados = len(df_input)
+        ahorro_anual_est = (ahorro_total / meses_simulados) * 12
+        roi_years = inversion / ahorro_anual_est if ahorro_anual_est > 0 else 999
     
-    # Proyecciones
-    meses_simulados = len(df_input)
-    ahorro_anual_est = (ahorro_total / meses_simulados) * 12
-    roi_years = inversion / ahorro_anual_est if ahorro_anual_est > 0 else 999
+        st.divider()
     
-    st.divider()
+        # Sección 2: KPIs Principales
+        st.subheader("2. Resultados económicos")
+        col1, col2, col3 = st.columns(3)
     
-    # Sección 2: KPIs Principales
-    st.subheader("2. Resultados económicos")
-    col1, col2, col3 = st.columns(3)
+        col1.metric("Ahorro total (Periodo)", f"{ahorro_total:,.2f} €", delta="Simulado")
+        col2.metric("Proyección ahorro anual", f"{ahorro_anual_est:,.2f} €", delta_color="normal")
+        col3.metric("Retorno Inversión (ROI)", f"{roi_years:.1f} Años", delta=f"- Coste: {inversion/1000}k€", delta_color="inverse")
     
-    col1.metric("Ahorro total (Periodo)", f"{ahorro_total:,.2f} €", delta="Simulado")
-    col2.metric("Proyección ahorro anual", f"{ahorro_anual_est:,.2f} €", delta_color="normal")
-    col3.metric("Retorno Inversión (ROI)", f"{roi_years:.1f} Años", delta=f"- Coste: {inversion/1000}k€", delta_color="inverse")
+        if estrategia != 'heuristica':
+            ahorro_heuristica = df_resultados['Ahorro heurística (€)'].sum()
+            brecha, capturado = brecha_heuristica(ahorro_heuristica, ahorro_total)
+            if brecha is None:
+                st.warning(f"📐 **Brecha al óptimo:** {limite_discretizacion(ahorro_heuristica, ahorro_total)}.")
+            else:
+                st.info(f"📐 **Brecha al óptimo:** la estrategia por reglas obtiene {ahorro_heuristica:,.2f} € "
+                        f"frente a {ahorro_total:,.2f} € del despacho óptimo ({capturado:.1f}% capturado, "
+                        f"{brecha:,.2f} € por debajo).")
     
-    if roi_years > 10:
-        st.warning("⚠️ **Atención:** El retorno es superior a 10 años. Revisa si la diferencia entre Precio Valle y Punta es suficiente para el arbitraje. **Simula una tarifa Indexada (Valle ~0.05€).**")
-    else:
-        st.success("✅ **Proyecto viable:** El retorno está dentro de parámetros rentables.")
+        if roi_years > 10:
+            st.warning("⚠️ **Atención:** El retorno es superior a 10 años. Revisa si la diferencia entre Precio Valle y Punta es suficiente para el arbitraje. **Simula una tarifa Indexada (Valle ~0.05€).**")
+        else:
+            st.success("✅ **Proyecto viable:** El retorno está dentro de parámetros rentables.")
 
-    # Sección 3: Gráficas
-    st.subheader("3. Análisis Visual")
+        # Sección 3: Gráficas
+        st.subheader("3. Análisis Visual")
     
-    tab1, tab2 = st.tabs(["📊 Ahorro Mensual", "📈 Detalle Operación (48h)"])
+        tab1, tab2 = st.tabs(["📊 Ahorro Mensual", "📈 Detalle Operación"])
     
-    with tab1:
-        st.bar_chart(df_resultados, x="Mes", y="Ahorro (€)", color="#4CAF50")
-        st.dataframe(df_resultados, use_container_width=True)
-        
-    with tab2:
-        st.write("Visualización del comportamiento de la batería durante 2 días tipo (Verano/Alta demanda).")
+        with tab1, etapa('grafica_mensual', len(df_resultados)):
+            st.bar_chart(df_resultados, x="Mes", y="Ahorro (€)", color="#4CAF50")
+            st.dataframe(df_resultados, use_container_width=True)
         
-        # Filtramos solo 48 horas del detalle para que se vea bien
-        subset = df_detalle.iloc[240:288] # Unas 48h del medio del mes
+        with tab2:
+            st.write("Visualización del comportamiento de la batería en cualquier ventana de cualquier mes.")
         
-        fig, ax1 = plt.subplots(figsize=(10, 4))
+            # Ventana elegida sobre la traza de todos los meses (cortes sin copia del búfer). La imagen
+            # sale de la caché de graficas.py si los datos y la ventana no han cambiado; las ventanas
+            # largas se diezman a la envolvente mín/máx por píxel.
+            meses = filas_a_meses(df_input, precio_excedente, tarifa_facturas)
+            if primer_inicio is not None:
+                meses = fechar_periodos(meses, primer_inicio)
+            col_a, col_b, col_c = st.columns(3)
+            duracion = col_a.selectbox("Ventana", list(VENTANAS_DETALLE))
+            n_dias = VENTANAS_DETALLE[duracion]
+            if n_dias is None:
+                inicio, n_pasos, origen = 0, traza.shape[1], 0
+            else:
+                indice_mes = col_b.selectbox("Mes", range(len(meses)), index=len(meses) - 1,
+                                             format_func=lambda i: str(meses[i]['mes']))
+                dias_mes = (inicios[indice_mes + 1] - inicios[indice_mes]) // 24
+                n_dias = min(n_dias, dias_mes)
+                dia_inicio = col_c.slider("Día de inicio", 0, dias_mes - n_dias, min(10, dias_mes - n_dias)) if n_dias < dias_mes else 0
+                inicio, n_pasos, origen = inicios[indice_mes] + dia_inicio * 24, n_dias * 24, dia_inicio * 24
+            subset = detalle_ventana(meses, traza, inicios, inicio, n_pasos, sector)
+            horas = np.arange(origen, origen + n_pasos)
         
-        # Eje Y1: Precios y SOC
-        ax1.set_xlabel('Hora Simulada')
-        ax1.set_ylabel('Carga Batería (kWh)', color='green')
-        line1 = ax1.plot(subset['soc'], color='green', label='SOC Batería (kWh)', linewidth=2)
-        ax1.tick_params(axis='y', labelcolor='green')
-        ax1.set_ylim(0, capacidad * 1.1)
+            with etapa('grafica_detalle', n_pasos):
+                st.image(png_operacion(horas, subset['soc'], subset['precio_compra'], capacidad))
+            st.caption("Observa cómo la línea verde (Batería) sube cuando la línea roja punteada (Precio) es baja (Carga nocturna) o cuando hay sol, y baja cuando el precio es alto.")
+            st.caption(f"En esta ventana: carga {subset['carga'].sum():,.0f} kWh | descarga {subset['descarga'].sum():,.0f} kWh | "
+                       f"compra de red {subset['red'].sum():,.0f} kWh | balance {subset['balance'].sum():,.2f} €")
+
+        # Exportación: el fichero se genera fila a fila solo al pulsar el botón
+        col_a, col_b = st.columns(2)
+        registros = df_resultados.to_dict('records')
+        col_a.download_button("📥 Excel (resultados + traza)", on_click='ignore', file_name='simulacion.xlsx',
+                              mime=MIME_EXPORTACION['.xlsx'],
+                              data=contenido_exportado(lambda: [hoja_registros('Resultados', registros),
+                                                                hoja_traza(traza)], '.xlsx'))
+        col_b.download_button("📥 CSV (traza paso a paso)", on_click='ignore', file_name='traza.csv',
+                              mime=MIME_EXPORTACION['.csv'], data=contenido_exportado(lambda: [hoja_traza(traza)], '.csv'))
+
+    # Panel de rendimiento: dónde se va el tiempo de esta ejecución
+    resumen = medicion['resumen']
+    with st.expander("⏱️ Rendimiento"):
+        st.dataframe(pd.DataFrame(resumen['etapas']).rename(columns={
+            'etapa': 'Etapa', 'segundos': 'Tiempo (s)', 'porcentaje': '%', 'llamadas': 'Llamadas', 'pasos': 'Pasos',
+            'pasos_por_segundo': 'Pasos/s', 'pico_memoria_mb': 'Pico memoria (MB)'}), hide_index=True)
+        rss = f" | memoria residente máxima {resumen['rss_max_mb']:.0f} MB" if resumen['rss_max_mb'] else ""
+        st.caption(f"Total de la ejecución: {resumen['total_s'] * 1000:.0f} ms{rss}. "
+                   "Las etapas perfil/precios/despacho solo aparecen cuando un mes no está en caché.")
+        if resumen['perfil']:
+            st.code(resumen['perfil_texto'])
+            with open(resumen['perfil'], 'rb') as f:
+                st.download_button("Descargar perfil (.prof)", f.read(), file_name='perfil_app.prof')
+
+else:
+    st.info("Modifica los datos en la tabla de arriba y pulsa 'Calcular' para ver los resultados.")
+
+# Curva de carga real (Datadis / distribuidora) en lugar del perfil sintético
+with st.expander("📂 Curva de carga real (CSV Datadis / Excel)"):
+    fichero_curva = st.file_uploader("Curva horaria o cuarto-horaria de consumo y vertido", type=['csv', 'xlsx'])
+    if fichero_curva is not None:
+        ruta_curva = guardar_curva_subida(fichero_curva)
+        curva = cargar_curva(ruta_curva)
+        col_a, col_b, col_c = st.columns(3)
+        contador = col_a.selectbox("CUPS", range(len(curva['contadores'])),
+                                   format_func=lambda i: curva['contadores'][i] or "(único)")
+        precio_valle_curva = col_b.number_input("Precio Valle (€/kWh)", value=0.092, format="%.3f")
+        precio_punta_curva = col_c.number_input("Precio Punta (€/kWh)", value=0.129, format="%.3f")
+        precios_periodo = None
+        if st.checkbox("Tarifa 3.0TD (6 periodos con calendario real)", value=False,
+                       help="Temporadas, fines de semana y festivos nacionales según las fechas de la curva"):
+            cols_periodos = st.columns(len(PERIODOS))
+            por_defecto = (0.180, 0.160, 0.145, 0.130, 0.120, 0.092)
+            precios_periodo = tuple(col.number_input(f"{p} (€/kWh)", value=v, format="%.3f", key=f"precio_{p}")
+                                    for col, p, v in zip(cols_periodos, PERIODOS, por_defecto))
+        st.caption(f"{curva['consumo'].shape[1]:,} pasos de {60 // curva['pasos_por_hora']} min "
+                   f"({curva['tiempo'][0]} → {curva['tiempo'][-1]})")
+
+        # Cotización rápida solo donde compensa (despacho óptimo o curvas de varios años): con la
+        # heurística y un año de curva el cálculo exacto ya tarda unas decenas de ms
+        n_dias_curva = dias_completos(curva['tiempo'], curva['pasos_por_hora'])[1]
+        if conviene_cotizacion_rapida(n_dias_curva, estrategia):
+            modo_curva = st.radio("Modo de cálculo", ("Exacto", "Cotización rápida (días tipo)"), horizontal=True,
+                                  index=1, help="La cotización rápida agrupa los días en k días tipo y solo simula esos")
+        else:
+            modo_curva = "Exacto"
+        if modo_curva != "Exacto":
+            col_a, col_b = st.columns([2, 1])
+            k_dias = col_a.slider("Días tipo (k)", 4, 48, K_POR_DEFECTO, help="Más días tipo: más precisión y más tiempo")
+            comparar_exacto = col_b.checkbox("Comparar con el cálculo exacto", value=False)
+            cotizacion = ejecutar_cotizacion_rapida(ruta_curva, contador, capacidad, potencia, eficiencia,
+                                                    precio_excedente, precio_valle_curva, precio_punta_curva,
+                                                    precios_periodo, k_dias, estrategia, comparar_exacto)
+            ahorro_anual_rapido = cotizacion['ahorro_estimado'] / cotizacion['n_dias'] * 365
+            roi_rapido = inversion / ahorro_anual_rapido if ahorro_anual_rapido > 0 else 999
+            col_a, col_b, col_c = st.columns(3)
+            col_a.metric("Ahorro estimado (días tipo)", f"{cotizacion['ahorro_estimado']:,.2f} €",
+                         delta=f"± {cotizacion['cota_error']:,.2f} € ({cotizacion['cota_error_pct']:.1f}%)",
+                         delta_color="off")
+            col_b.metric("Proyección ahorro anual", f"{ahorro_anual_rapido:,.2f} €")
+            col_c.metric("Retorno Inversión (ROI)", f"{roi_rapido:.1f} Años")
+            st.caption(f"{cotizacion['dias_simulados']} de {cotizacion['n_dias']} días simulados "
+                       f"en {cotizacion['tiempo_s'] * 1000:.0f} ms. ± = banda al 95% estimada con días de "
+                       f"validación de cada grupo" + (" (no incluye el corte diario del despacho óptimo)"
+                                                      if estrategia == 'optima' else ""))
+            if comparar_exacto:
+                col_a, col_b, col_c = st.columns(3)
+                col_a.metric("Ahorro exacto", f"{cotizacion['ahorro_exacto']:,.2f} €")
+                col_b.metric("Error real", f"{cotizacion['error_real_pct']:+.2f} %")
+                col_c.metric("Aceleración", f"{cotizacion['aceleracion']:.1f}x",
+                             help=f"Cálculo exacto: {cotizacion['tiempo_exacto_s'] * 1000:.0f} ms")
+            st.bar_chart(pd.DataFrame({'Día tipo': np.arange(1, len(cotizacion['pesos']) + 1),
+                                       'Días representados': cotizacion['pesos']}),
+                         x='Día tipo', y='Días representados', color="#2196F3")
+        else:
+            # Contrato indexado: series del almacén local de precios (OMIE / PVPC)
+            fichero_precios = st.file_uploader("Importar serie de precios (CSV fecha;precio u OMIE marginalpdbc)",
+                                               type=['csv', 'txt', '1'], key="precios_subidos")
+            if fichero_precios is not None:
+                serie_subida = os.path.splitext(fichero_precios.name)[0]
+                meta = importar_serie_subida(guardar_curva_subida(fichero_precios, carpeta='precios_subidos'), serie_subida)
+                st.caption(f"Serie '{serie_subida}': años {meta['anios']} | {meta['pasos_por_hora']} pasos/hora")
+            series = series_disponibles()
+            serie_precios = st.selectbox("Comparar con contrato indexado", [None] + series,
+                                         format_func=lambda s: "(no comparar)" if s is None else s) if series else None
+
+            df_curva = ejecutar_simulacion_curva(ruta_curva, contador, capacidad, potencia, eficiencia,
+                                                 precio_excedente, precio_valle_curva, precio_punta_curva,
+                                                 precios_periodo, serie_precios, firma_serie(serie_precios) if serie_precios else None)
+            ahorro_curva = df_curva['Ahorro (€)'].sum()
+            ahorro_anual_curva = ahorro_curva / len(df_curva) * 12
+            roi_curva = inversion / ahorro_anual_curva if ahorro_anual_curva > 0 else 999
+            col_a, col_b, col_c = st.columns(3)
+            col_a.metric("Ahorro total (curva real)", f"{ahorro_curva:,.2f} €")
+            col_b.metric("Proyección ahorro anual", f"{ahorro_anual_curva:,.2f} €")
+            col_c.metric("Retorno Inversión (ROI)", f"{roi_curva:.1f} Años")
+            if serie_precios:
+                ahorro_anual_ind = df_curva['Ahorro indexado (€)'].sum() / len(df_curva) * 12
+                roi_ind = inversion / ahorro_anual_ind if ahorro_anual_ind > 0 else 999
+                col_a, col_b, col_c = st.columns(3)
+                col_a.metric("Ahorro total (indexado)", f"{df_curva['Ahorro indexado (€)'].sum():,.2f} €")
+                col_b.metric("Proyección anual (indexado)", f"{ahorro_anual_ind:,.2f} €",
+                             delta=f"{ahorro_anual_ind - ahorro_anual_curva:,.2f} € vs fijo")
+                col_c.metric("Retorno (indexado)", f"{roi_ind:.1f} Años")
+                st.bar_chart(df_curva, x="Mes", y=["Ahorro (€)", "Ahorro indexado (€)"], color=["#4CAF50", "#FF9800"],
+                             stack=False)
+                st.dataframe(df_curva, hide_index=True)
+            else:
+                st.bar_chart(df_curva, x="Mes", y="Ahorro (€)", color="#4CAF50")
+
+        # Recorte de picos: potencia contratada 3.0TD óptima con y sin batería
+        if st.checkbox("Optimizar potencia contratada 3.0TD (recorte de picos)", value=False):
+            if curva['pasos_por_hora'] == 1:
+                st.warning("Curva horaria: los máximos son medias horarias y subestiman los picos cuarto-horarios.")
+            res_pot = ejecutar_potencia(ruta_curva, contador, capacidad, potencia, eficiencia)
+            st.dataframe(pd.DataFrame({
+                'Periodo': PERIODOS,
+                'Máx. demanda (kW)': np.round(np.nanmax(res_pot['maximos'], axis=0), 1),
+                'Óptima sin batería (kW)': res_pot['sin_bateria']['potencias'],
+                'Máx. con batería (kW)': np.round(np.nanmax(res_pot['maximos_con_bateria'], axis=0), 1),
+                'Óptima con batería (kW)': res_pot['con_bateria']['potencias'],
+            }), hide_index=True)
+            col_a, col_b, col_c = st.columns(3)
+            col_a.metric("Coste potencia sin batería", f"{res_pot['sin_bateria']['coste_total']:,.2f} €/año")
+            col_b.metric("Coste potencia con batería", f"{res_pot['con_bateria']['coste_total']:,.2f} €/año")
+            col_c.metric("Ahorro en potencia", f"{res_pot['ahorro_anual']:,.2f} €/año")
+
+# Sección 4: Dimensionado óptimo (barrido de capacidad x potencia)
+with st.expander("🔎 Dimensionado óptimo (barrido capacidad x potencia)"):
+    col_a, col_b, col_c = st.columns(3)
+    rango_cap = col_a.slider("Capacidad (kWh)", 10, 1000, (20, 500), step=10)
+    paso_cap = col_a.number_input("Paso capacidad (kWh)", value=10, min_value=1)
+    rango_pot = col_b.slider("Potencia (kW)", 5, 500, (10, 250), step=5)
+    paso_pot = col_b.number_input("Paso potencia (kW)", value=5, min_value=1)
+    coste_kwh = col_c.number_input("Coste por kWh instalado (€)", value=float(inversion / capacidad) if capacidad else 300.0, step=10.0)
+    
+    if st.button("Calcular barrido"):
+        capacidades = tuple(range(rango_cap[0], rango_cap[1] + 1, int(paso_cap)))
+        potencias = tuple(range(rango_pot[0], rango_pot[1] + 1, int(paso_pot)))
+        res = ejecutar_barrido(df_input, capacidades, potencias, eficiencia, precio_excedente, coste_kwh, sector,
+                               tarifa_facturas)
+        opt = res['optimo']
         
-        # Eje Y2: Precios
-        ax2 = ax1.twinx()
-        ax2.set_ylabel('Precio Luz (€/kWh)', color='red')
-        line2 = ax2.plot(subset['precio_compra'], color='red', linestyle='--', label='Precio Luz', alpha=0.5)
-        ax2.tick_params(axis='y', labelcolor='red')
+        st.success(f"**Óptimo:** {opt['cap_bat']:.0f} kWh / {opt['pot_bat']:.0f} kW · "
+                   f"Inversión {opt['inversion']:,.0f} € · Ahorro anual {opt['ahorro_anual']:,.2f} € · "
+                   f"Retorno {opt['retorno_anios']:.1f} años")
         
-        # Relleno para visualizar zonas de carga/descarga
-        ax2.fill_between(subset.index, 0, subset['precio_compra'], color='red', alpha=0.1)
+        st.image(png_barrido(capacidades, potencias, res['retorno_anios'], opt['cap_bat'], opt['pot_bat']))
         
-        # Leyenda combinada
-        lines = line1 + line2
-        labels = [l.get_label() for l in lines]
-        ax1.legend(lines, labels, loc='upper left')
+        st.dataframe(pd.DataFrame(res['ahorro_anual'], index=capacidades, columns=potencias).round(0),
+                     use_container_width=True)
+        st.caption(f"{len(capacidades) * len(potencias)} configuraciones simuladas en un único recorrido temporal. Filas: kWh, columnas: kW, valores: ahorro anual (€).")
+        col_a, col_b = st.columns(2)
+        col_a.download_button("📥 Excel (rejilla + matrices)", on_click='ignore', file_name='barrido.xlsx',
+                              mime=MIME_EXPORTACION['.xlsx'],
+                              data=contenido_exportado(lambda: [hoja_barrido(res),
+                                                                hoja_matriz(res, 'ahorro_anual', 'Ahorro anual'),
+                                                                hoja_matriz(res, 'retorno_anios', 'Retorno')], '.xlsx'))
+        col_b.download_button("📥 CSV (una fila por configuración)", on_click='ignore', file_name='barrido.csv',
+                              mime=MIME_EXPORTACION['.csv'], data=contenido_exportado(lambda: [hoja_barrido(res)], '.csv'))
+
+# Sección 5: Incertidumbre (Monte Carlo sobre precios y consumo)
+with st.expander("🎲 Incertidumbre del ahorro (Monte Carlo P10 / P50 / P90)"):
+    col_a, col_b = st.columns(2)
+    n_escenarios = col_a.number_input("Escenarios", value=5000, min_value=100, max_value=20000, step=500)
+    semilla = col_b.number_input("Semilla", value=42, min_value=0, step=1)
+    st.caption("Cada escenario es un año: cada mes toma una factura de la tabla al azar y perturba consumo, "
+               "excedente y precios (±10-25%). Todos los escenarios se simulan a la vez con el motor por lotes."
+               + (" Usa siempre los precios Valle/Punta de la tabla, también con la tarifa 3.0TD activada."
+                  if tarifa_facturas else ""))
+    
+    if st.button("Calcular incertidumbre"):
+        res_mc = ejecutar_montecarlo(df_input, int(n_escenarios), capacidad, potencia, eficiencia,
+                                     precio_excedente, inversion, sector, int(semilla))
+        col_a, col_b, col_c = st.columns(3)
+        for col, (p, valores) in zip((col_a, col_b, col_c), res_mc['percentiles'].items()):
+            col.metric(f"P{p} ahorro anual", f"{valores['ahorro_anual']:,.2f} €",
+                       delta=f"Retorno P{p}: {valores['retorno_anios']:.1f} años", delta_color="off")
         
-        st.pyplot(fig)
-        st.caption("Observa cómo la línea verde (Batería) sube cuando la línea roja punteada (Precio) es baja (Carga nocturna) o cuando hay sol, y baja cuando el precio es alto.")
+        # Gráfico de abanico: ahorro acumulado a lo largo del año
+        st.image(png_abanico(res_mc['abanico']))
+        st.caption(f"{res_mc['n_escenarios']:,} escenarios. El retorno P10 es el caso optimista "
+                   f"(ahorro alto) y el P90 el pesimista.")
 
-else:
-    st.info("Modifica los datos en la tabla de arriba y pulsa 'Calcular' para ver los resultados.")
\ No newline at end of file
+# Sección 6: Ciclo de vida (degradación, VAN, TIR, LCOS)
+with st.expander("📉 Ciclo de vida (degradación, VAN, TIR, LCOS)"):
+    col_a, col_b, col_c = st.columns(3)
+    anios_vida = col_a.slider("Años de vida útil", 10, 20, 15)
+    tasa_descuento = col_b.number_input("Tasa de descuento (%)", value=5.0, step=0.5) / 100
+    escalado_precios = col_c.number_input("Subida anual energía (%)", value=2.0, step=0.5) / 100
+    
+    if st.button("Calcular ciclo de vida"):
+        res_cv = ejecutar_ciclo_vida(df_input, anios_vida, capacidad, potencia, eficiencia, precio_excedente,
+                                     inversion, tasa_descuento, escalado_precios, sector, estrategia, tarifa_facturas)
+        col_a, col_b, col_c, col_d = st.columns(4)
+        col_a.metric("VAN", f"{res_cv['van']:,.0f} €")
+        col_b.metric("TIR", f"{res_cv['tir']:.1%}" if np.isfinite(res_cv['tir']) else "n/d")
+        col_c.metric("LCOS", f"{res_cv['lcos']:.3f} €/kWh")
+        col_d.metric("Retorno descontado", f"{res_cv['retorno_descontado']:.1f} Años")
+        
+        df_cv = pd.DataFrame(res_cv['anios'])
+        st.image(png_ciclo_vida(df_cv['Anio'].to_numpy(), df_cv['Flujo_Desc_Acum_Eur'].to_numpy(),
+                                df_cv['Salud_Pct'].to_numpy(), SALUD_FIN_VIDA))
+        
+        st.dataframe(df_cv, use_container_width=True)
+        fin_vida = f"año {res_cv['anio_fin_vida']}" if res_cv['anio_fin_vida'] else "no se alcanza"
+        st.caption(f"Fin de vida ({SALUD_FIN_VIDA:.0%} de capacidad): {fin_vida}. Despachos simulados: "
+                   f"{res_cv['redespachos']} de {res_cv['meses_simulables']} meses-año (el resto se reutiliza).")
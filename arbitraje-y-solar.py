@@ -1,216 +1,654 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import sys
+import json
+import time
+import argparse
 
-def simular_arbitraje_y_solar(datos_facturas, cap_bat=100, pot_bat=50, eficiencia=0.90):
+from motor import simular_mes, simular_curva_meses, ESTRATEGIAS
+from optimo import brecha_heuristica, limite_discretizacion
+from perfiles import SECTORES, SECTOR_POR_DEFECTO
+from barrido import barrido_dimensionado, barrido_fv_bateria
+from curvas import cargar_curva
+from montecarlo import montecarlo_facturas, montecarlo_curva
+from ciclovida import ciclo_vida, SALUD_FIN_VIDA
+from tarifas import con_tarifa, PERIODOS
+from potencia import optimizar_potencia_contratada
+from precios import importar_precios, con_precios_indexados, ALMACEN_POR_DEFECTO
+from dias_tipo import cotizar_curva, conviene_cotizacion_rapida, DIAS_MINIMOS_HEURISTICA
+from linea_temporal import simular_linea_temporal, cargar_puntos_control, guardar_puntos_control
+from traza import crear_traza
+from instrumentacion import iniciar, finalizar, etapa, informe
+from exportar import exportar, hoja_registros, hoja_barrido, hoja_barrido_fv, hoja_matriz, hoja_traza
+from fotovoltaica import instalacion, con_fotovoltaica, resumen_fotovoltaico, CIELOS
+from graficas import en_segundo_plano, esperar_graficas, guardar_png, png_ahorro_mensual
+from datos_cliente import datos_reales_cliente
+
+# pandas (tablas por consola) y matplotlib (gráfica) se importan solo cuando se usan:
+# con --json el arranque carga únicamente NumPy y el motor.
+
+def calcular_arbitraje_y_solar(datos_facturas, cap_bat=100, pot_bat=50, eficiencia=0.90, sector=SECTOR_POR_DEFECTO,
+                               estrategia='heuristica', continuo=False, anio=None, ruta_puntos_control=None,
+                               ruta_exportar=None, pasos_por_hora=1):
+    """
+    Parte numérica de simular_arbitraje_y_solar (sin pandas, sin gráficas, sin imprimir).
+    Devuelve un dict serializable a JSON con los resultados por mes y los totales.
+    Con continuo=True las facturas forman una sola línea temporal con sus días reales de
+    calendario (anio para fecharlas por la etiqueta) y el SOC arrastrado (linea_temporal.py);
+    con ruta_puntos_control se reanuda desde los puntos de control guardados y se actualizan.
+    Las facturas con 'fotovoltaica' (con_fotovoltaica) añaden la producción, el autoconsumo y
+    el excedente modelados de cada periodo.
+    ruta_exportar (.xlsx o .csv): guarda los resultados por periodo (exportar.py) sin imprimir
+    nada; los ficheros escritos quedan en resultado['exportado'].
+    pasos_por_hora: resolución del perfil sintético (1 horaria, 4 cuarto-horaria: 96 pasos/día).
+    """
+    resultados_mes = []
+    
+    ahorro_total = 0
+    ahorro_heuristica_total = 0
+    linea = None
+    
+    if continuo or ruta_puntos_control:
+        anterior = cargar_puntos_control(ruta_puntos_control) if ruta_puntos_control else None
+        linea = simular_linea_temporal(datos_facturas, cap_bat, pot_bat, eficiencia, sector, estrategia,
+                                       anio=anio, pasos_por_hora=pasos_por_hora, anterior=anterior)
+        if ruta_puntos_control:
+            guardar_puntos_control(ruta_puntos_control, linea)
+        for mes, punto in zip(datos_facturas, linea['puntos_control']):
+            fila = {
+                'Mes': mes['mes'],
+                'Dias': punto['dias'],
+                'SOC_Inicial': round(punto['soc_inicial'], 1),
+                'Ahorro_Eur': round(punto['ahorro'], 2),
+                'Ahorro_Heuristica_Eur': round(punto['ahorro_heuristica'], 2),
+                'Consumo_Total': int(mes['consumo_total_kwh']),
+                'Precio_Punta': mes['precio_punta'],
+                'Precio_Valle': mes['precio_valle']
+            }
+            if mes.get('fotovoltaica'):
+                fila.update(resumen_fotovoltaico(mes, punto['dias'], pasos_por_hora, sector))
+            resultados_mes.append(fila)
+        ahorro_total = linea['ahorro_total']
+        ahorro_heuristica_total = linea['ahorro_heuristica_total']
+    else:
+        for mes in datos_facturas:
+            # Perfil sintético del sector + precios valle/punta + despacho (motor compartido)
+            res_mes = simular_mes(mes, cap_bat, pot_bat, eficiencia, sector, estrategia, pasos_por_hora=pasos_por_hora)
+            ahorro_acumulado_mes = res_mes['ahorro']
+            ahorro_heuristica_mes = res_mes['ahorro_heuristica']
+
+            # Fin del mes
+            fila = {
+                'Mes': mes['mes'],
+                'Ahorro_Eur': round(ahorro_acumulado_mes, 2),
+                'Ahorro_Heuristica_Eur': round(ahorro_heuristica_mes, 2),
+                'Consumo_Total': int(mes['consumo_total_kwh']),
+                'Precio_Punta': mes['precio_punta'],
+                'Precio_Valle': mes['precio_valle']
+            }
+            if mes.get('fotovoltaica'):
+                fila.update(resumen_fotovoltaico(mes, pasos_por_hora=pasos_por_hora, sector=sector))
+            resultados_mes.append(fila)
+            ahorro_total += ahorro_acumulado_mes
+            ahorro_heuristica_total += ahorro_heuristica_mes
+
+    # Proyección anual simple (x3 si son 4 meses; con línea continua, por días reales)
+    factor_anual = 12 / len(datos_facturas)
+    if linea is not None:
+        factor_anual = 365 * 24 * pasos_por_hora / linea['pasos_totales']
+    proyeccion = ahorro_total * factor_anual
+    roi_years = 30000 / proyeccion if proyeccion > 0 else 999
+    
+    resultado = {
+        'bateria': {'cap_bat': cap_bat, 'pot_bat': pot_bat, 'eficiencia': eficiencia},
+        'sector': sector,
+        'estrategia': estrategia,
+        'pasos_por_hora': pasos_por_hora,
+        'meses': resultados_mes,
+        'ahorro_total': ahorro_total,
+        'ahorro_heuristica_total': ahorro_heuristica_total,
+        'proyeccion_anual': proyeccion,
+        'retorno_anios': roi_years,
+    }
+    if linea is not None:
+        resultado['linea_temporal'] = {
+            'reanudado_desde': linea['reanudado_desde'],
+            'pasos_simulados': linea['pasos_simulados'],
+            'pasos_totales': linea['pasos_totales'],
+            'soc_final': linea['soc_final'],
+        }
+    if ruta_exportar:
+        resultado['exportado'] = exportar(ruta_exportar, [hoja_registros('Resultados', resultados_mes)])
+    return resultado
+
+def simular_arbitraje_y_solar(datos_facturas, cap_bat=100, pot_bat=50, eficiencia=0.90, sector=SECTOR_POR_DEFECTO,
+                              estrategia='heuristica', graficar=True, continuo=False, anio=None,
+                              ruta_puntos_control=None, ruta_exportar=None, pasos_por_hora=1):
     """
     Simula el ahorro combinando autoconsumo de excedentes y arbitraje de precios de red.
-    Genera perfiles horarios a partir de datos mensuales.
+    Genera perfiles horarios (o de 60 / pasos_por_hora minutos) a partir de datos mensuales
+    (plantilla de consumo del sector).
+    Con estrategia='optima' usa el despacho óptimo (DP) e informa de la brecha de la heurística.
+    continuo / anio / ruta_puntos_control: línea temporal continua (ver calcular_arbitraje_y_solar).
+    ruta_exportar (.xlsx o .csv): guarda también los resultados por periodo (exportar.py).
+    Con graficar=False no se importa matplotlib ni se guarda la gráfica; con True se encola en
+    segundo plano (graficas.en_segundo_plano) y la función vuelve sin esperarla.
     """
+    import pandas as pd
+    
     print(f"\n--- INICIO SIMULACIÓN: SOLAR + ARBITRAJE ---")
-    print(f"Batería: {cap_bat} kWh | Potencia: {pot_bat} kW | Eficiencia: {int(eficiencia*100)}%")
+    print(f"Batería: {cap_bat} kWh | Potencia: {pot_bat} kW | Eficiencia: {int(eficiencia*100)}% | Estrategia: {estrategia}"
+          + (f" | Pasos de {60 // pasos_por_hora} min" if pasos_por_hora != 1 else ""))
     print("-" * 60)
     
-    resultados_mes = []
+    res = calcular_arbitraje_y_solar(datos_facturas, cap_bat, pot_bat, eficiencia, sector, estrategia,
+                                     continuo, anio, ruta_puntos_control, ruta_exportar, pasos_por_hora)
+    ahorro_total = res['ahorro_total']
+    ahorro_heuristica_total = res['ahorro_heuristica_total']
+
+    # --- 3. RESULTADOS Y VISUALIZACIÓN ---
+    with etapa('tabla', len(res['meses'])):
+        df_res = pd.DataFrame(res['meses'])
+        
+        print("\nRESULTADOS POR PERIODO:")
+        columnas = ['Mes', 'Consumo_Total', 'Precio_Punta', 'Ahorro_Eur']
+        if 'linea_temporal' in res:
+            columnas[1:1] = ['Dias', 'SOC_Inicial']
+        if 'Produccion_FV' in df_res:
+            columnas[-1:-1] = ['Produccion_FV', 'Excedente_FV']
+        if estrategia != 'heuristica':
+            columnas.append('Ahorro_Heuristica_Eur')
+        print(df_res[columnas].to_string(index=False))
+    print("-" * 60)
+    print(f"AHORRO TOTAL ({len(datos_facturas)} meses): {ahorro_total:,.2f} €")
+    if 'linea_temporal' in res:
+        linea = res['linea_temporal']
+        print(f"Línea temporal continua: {linea['pasos_totales'] // (24 * pasos_por_hora)} días | SOC final {linea['soc_final']:.1f} kWh | "
+              f"simulados {linea['pasos_simulados']:,} de {linea['pasos_totales']:,} pasos "
+              + (f"(reanudado desde el periodo {linea['reanudado_desde'] + 1})" if linea['pasos_simulados']
+                 else "(todo de los puntos de control)"))
+    if estrategia != 'heuristica':
+        brecha, capturado = brecha_heuristica(ahorro_heuristica_total, ahorro_total)
+        if brecha is None:
+            print(f"[AVISO] Brecha heurística vs óptimo: {limite_discretizacion(ahorro_heuristica_total, ahorro_total)}")
+        else:
+            print(f"Brecha heurística vs óptimo:   {brecha:,.2f} € (la heurística captura el {capturado:.1f}%)")
     
-    ahorro_total = 0
+    print(f"PROYECCIÓN AHORRO ANUAL:       {res['proyeccion_anual']:,.2f} €")
+    print(f"Retorno Inversión (Est. 30k€):   {res['retorno_anios']:.1f} años")
+    print("-" * 60)
+    if ruta_exportar:
+        informar_exportacion(res['exportado'])
+
+    if graficar:
+        # La gráfica se dibuja en el hilo de gráficas: los resultados ya están impresos y el
+        # script solo la espera al terminar (esperar_graficas en __main__)
+        with etapa('grafica'):
+            en_segundo_plano(guardar_grafica, df_res['Mes'].tolist(), df_res['Ahorro_Eur'].tolist(), cap_bat)
+    return df_res
+
+def informar_exportacion(ficheros):
+    """Una línea de consola por fichero exportado (salida de exportar.exportar)."""
+    for fichero, filas in ficheros:
+        print(f"[INFO] Exportado: {fichero} ({filas:,} filas)")
+
+def guardar_grafica(meses, ahorros, cap_bat):
+    """
+    Gráfica de barras del ahorro mensual en resultados/ (matplotlib sin pyplot: sin pantalla,
+    válido en Docker y desde el hilo de gráficas). Devuelve (ruta, segundos de dibujo).
+    """
+    # Guardado seguro en Docker
+    output_dir = '/app/resultados'
     
-    for mes in datos_facturas:
-        nombre = mes['mes']
-        dias = 30
-        horas_totales = dias * 24
-        
-        # --- 1. GENERAR PERFIL SINTÉTICO HORARIO (Hora a Hora) ---
-        df = pd.DataFrame(index=range(horas_totales))
-        df['hora_dia'] = df.index % 24
-        
-        # A) Perfil de Consumo (Hostelería: alto mediodía y noche)
-        # Pesos: Madrugada(0.4), Mañana(0.8), Comida(1.5), Tarde(0.8), Cena(1.6)
-        condiciones = [
-            (df['hora_dia'] < 8),
-            (df['hora_dia'] >= 8) & (df['hora_dia'] < 12),
-            (df['hora_dia'] >= 12) & (df['hora_dia'] < 17),
-            (df['hora_dia'] >= 17) & (df['hora_dia'] < 20),
-            (df['hora_dia'] >= 20)
-        ]
-        pesos = [0.4, 0.8, 2, 0.8, 1.2] 
-        df['perfil_base'] = np.select(condiciones, pesos)
-        
-        # Ajustamos al consumo real de la factura
-        factor_consumo = mes['consumo_total_kwh'] / df['perfil_base'].sum()
-        df['consumo_kwh'] = df['perfil_base'] * factor_consumo
-        
-        # B) Perfil Solar (Campana de Gauss 08:00 - 19:00)
-        df['perfil_solar'] = np.where(
-            (df['hora_dia'] > 7) & (df['hora_dia'] < 20),
-            np.sin((df['hora_dia'] - 7) * np.pi / 13),
-            0
-        )
-        # Ajustar al excedente real de la factura
-        factor_solar = mes['excedente_total_kwh'] / df['perfil_solar'].sum() if df['perfil_solar'].sum() > 0 else 0
-        df['solar_disponible_kwh'] = df['perfil_solar'] * factor_solar
-        
-        # C) Precios Horarios (Simplificación P1/P6 de la factura)
-        # 00-08h: Valle (Precio P6) | 08-00h: Punta (Precio P1/P4 según mes)
-        df['precio_compra'] = np.where(df['hora_dia'] < 8, mes['precio_valle'], mes['precio_punta'])
-        df['es_hora_valle'] = df['hora_dia'] < 8
-        
-        # --- 2. SIMULACIÓN DE LA BATERÍA ---
-        soc = 0.0 # Estado de carga (kWh)
-        ahorro_acumulado_mes = 0.0
-        
-        # Listas para guardar datos de la gráfica (solo usamos un mes de ejemplo luego)
-        historial_soc = []
-        
-        for i in range(len(df)):
-            cons = df.loc[i, 'consumo_kwh']
-            solar = df.loc[i, 'solar_disponible_kwh']
-            precio_actual = df.loc[i, 'precio_compra']
-            es_valle = df.loc[i, 'es_hora_valle']
-            
-            # --- ESTRATEGIA DE CARGA ---
-            energia_entrada = 0.0
-            coste_carga = 0.0
-            
-            # 1. Carga Solar (Prioridad Absoluta) -> Coste oportunidad = Precio venta excedente
-            if solar > 0:
-                espacio_libre = cap_bat - soc
-                carga_solar = min(solar, espacio_libre, pot_bat)
-                
-                soc += carga_solar * np.sqrt(eficiencia) # Pérdida en la entrada
-                coste_carga += carga_solar * mes['precio_venta_excedente'] 
-                energia_entrada += carga_solar
-            
-            # 2. Carga de Red (Arbitraje) -> Solo en Valle y si hay margen económico
-            # Solo cargamos si la batería no se ha llenado con sol y si el "spread" vale la pena
-            if es_valle and energia_entrada == 0:
-                espacio_libre = cap_bat - soc
-                # Margen: Precio Punta vs (Precio Valle / Eficiencia)
-                precio_descarga_efectivo = mes['precio_valle'] / eficiencia
-                margen = mes['precio_punta'] - precio_descarga_efectivo
-                
-                if margen > 0.02 and espacio_libre > 0: # Solo si ganamos >2 céntimos/kWh
-                    carga_red = min(espacio_libre, pot_bat)
-                    soc += carga_red * np.sqrt(eficiencia)
-                    coste_carga += carga_red * mes['precio_valle']
-                    energia_entrada += carga_red
-
-            # --- ESTRATEGIA DE DESCARGA ---
-            ahorro_hora = 0.0
-            
-            # Descargamos solo en horas CARAS (No valle) para cubrir consumo
-            if not es_valle and soc > 0 and cons > 0:
-                # Energía necesaria para cubrir el consumo
-                energia_necesaria_red = cons
-                
-                # Lo que la batería puede dar (limitado por potencia y carga actual)
-                # OJO: soc está en DC. Para dar 1 kWh AC, necesito sacar 1/sqrt(eff) DC aprox.
-                # Simplificamos: Energía AC disponible = SOC * sqrt(eff)
-                energia_ac_disponible = soc * np.sqrt(eficiencia)
-                
-                descarga_ac_util = min(energia_necesaria_red, energia_ac_disponible, pot_bat)
-                
-                # Actualizamos SOC (restamos lo que sale en DC)
-                soc_restar = descarga_ac_util / np.sqrt(eficiencia)
-                soc -= soc_restar
-                
-                # Dinero ahorrado (lo que NO pagamos a la comercializadora)
-                ahorro_hora = descarga_ac_util * precio_actual
-            
-            # Balance Neto de la Hora
-            balance_hora = ahorro_hora - coste_carga
-            ahorro_acumulado_mes += balance_hora
-            historial_soc.append(soc)
-
-        # Fin del mes
-        resultados_mes.append({
-            'Mes': nombre,
-            'Ahorro_Eur': round(ahorro_acumulado_mes, 2),
-            'Consumo_Total': int(mes['consumo_total_kwh']),
-            'Precio_Punta': mes['precio_punta'],
-            'Precio_Valle': mes['precio_valle']
+    # Si no estamos en Docker (ej. ejecución local), guardamos en carpeta local
+    if not os.path.exists('/app'):
+        output_dir = 'resultados'
+    
+    titulo = f'Ahorro Estimado - Batería {cap_bat}kWh (Cliente: Bar de Jimmy)'
+    return guardar_png(os.path.join(output_dir, 'grafica_ahorro.png'),
+                       lambda: png_ahorro_mensual(meses, ahorros, titulo))
+
+def ejecutar_barrido(datos_facturas, capacidades, potencias, eficiencia=0.90, coste_kwh=300, coste_kw=0,
+                     sector=SECTOR_POR_DEFECTO, ruta_exportar=None):
+    """
+    Barrido de dimensionado: simula toda la rejilla capacidad x potencia de una vez
+    y muestra la configuración con menor retorno de inversión. Con ruta_exportar guarda la
+    rejilla completa (una fila por configuración) y las matrices de ahorro anual y retorno.
+    """
+    import pandas as pd
+    
+    print(f"\n--- BARRIDO DE DIMENSIONADO: {len(capacidades)} capacidades x {len(potencias)} potencias ---")
+    res = barrido_dimensionado(datos_facturas, capacidades, potencias, eficiencia, coste_kwh, coste_kw, sector)
+    
+    # Tabla resumen: mejor potencia para cada capacidad
+    filas = []
+    for i, cap in enumerate(res['capacidades']):
+        j = int(np.argmin(res['retorno_anios'][i]))
+        filas.append({
+            'Capacidad_kWh': int(cap),
+            'Mejor_Potencia_kW': int(res['potencias'][j]),
+            'Ahorro_Anual_Eur': round(res['ahorro_anual'][i, j], 2),
+            'Retorno_Anios': round(res['retorno_anios'][i, j], 1)
         })
-        ahorro_total += ahorro_acumulado_mes
+    print(pd.DataFrame(filas).to_string(index=False))
+    
+    opt = res['optimo']
+    print("-" * 60)
+    print(f"ÓPTIMO (menor retorno): {opt['cap_bat']:.0f} kWh | {opt['pot_bat']:.0f} kW")
+    print(f"Inversión: {opt['inversion']:,.0f} € | Ahorro anual: {opt['ahorro_anual']:,.2f} € | Retorno: {opt['retorno_anios']:.1f} años")
+    print("-" * 60)
+    if ruta_exportar:
+        informar_exportacion(exportar(ruta_exportar, [
+            hoja_barrido(res),
+            hoja_matriz(res, 'ahorro_anual', 'Ahorro anual'),
+            hoja_matriz(res, 'retorno_anios', 'Retorno'),
+        ]))
+    return res
 
-    # --- 3. RESULTADOS Y VISUALIZACIÓN ---
-    df_res = pd.DataFrame(resultados_mes)
+def ejecutar_barrido_fv(datos_facturas, potencias_fv, capacidades, potencias, eficiencia=0.90, coste_kwh=300,
+                        coste_kw=0, coste_kwp=900, sector=SECTOR_POR_DEFECTO, ruta_exportar=None):
+    """
+    Barrido conjunto FV + batería (barrido_fv_bateria): para cada kWp muestra el retorno de la FV
+    sola y la mejor batería, y al final la combinación con menor retorno. Las facturas deben
+    traer la instalación (con_fotovoltaica). Con ruta_exportar guarda la rejilla completa.
+    """
+    import pandas as pd
     
-    print("\nRESULTADOS POR PERIODO:")
-    print(df_res[['Mes', 'Consumo_Total', 'Precio_Punta', 'Ahorro_Eur']].to_string(index=False))
+    print(f"\n--- BARRIDO FV + BATERÍA: {len(potencias_fv)} potencias FV x {len(capacidades)} capacidades "
+          f"x {len(potencias)} potencias ---")
+    res = barrido_fv_bateria(datos_facturas, potencias_fv, capacidades, potencias, eficiencia,
+                             coste_kwh, coste_kw, coste_kwp, sector)
+    
+    # Tabla resumen: FV sola y mejor batería para cada kWp
+    filas = []
+    for k, kwp in enumerate(res['potencias_fv']):
+        ahorro_fv = res['ahorro_fv_anual'][k]
+        i, j = np.unravel_index(int(np.argmin(res['retorno_anios'][k])), res['retorno_anios'][k].shape)
+        filas.append({
+            'FV_kWp': round(float(kwp), 1),
+            'Ahorro_FV_Eur': round(ahorro_fv, 2),
+            'Retorno_FV_Anios': round(kwp * coste_kwp / ahorro_fv, 1) if ahorro_fv > 0 else float('inf'),
+            'Mejor_Bateria': f"{res['capacidades'][i]:.0f} kWh / {res['potencias'][j]:.0f} kW",
+            'Ahorro_Anual_Eur': round(res['ahorro_anual'][k, i, j], 2),
+            'Retorno_Anios': round(res['retorno_anios'][k, i, j], 1)
+        })
+    print(pd.DataFrame(filas).to_string(index=False))
+    
+    opt = res['optimo']
     print("-" * 60)
-    print(f"AHORRO TOTAL ({len(datos_facturas)} meses): {ahorro_total:,.2f} €")
+    print(f"ÓPTIMO (menor retorno): FV {opt['kwp']:.1f} kWp | Batería {opt['cap_bat']:.0f} kWh | {opt['pot_bat']:.0f} kW")
+    print(f"Inversión: {opt['inversion']:,.0f} € | Ahorro anual: {opt['ahorro_anual']:,.2f} € | Retorno: {opt['retorno_anios']:.1f} años")
+    print("-" * 60)
+    if ruta_exportar:
+        informar_exportacion(exportar(ruta_exportar, [hoja_barrido_fv(res)]))
+    return res
+
+def simular_curva_real(ruta_curva, precio_valle, precio_punta, precio_venta_excedente=0.10,
+                       cap_bat=100, pot_bat=50, eficiencia=0.90, contador=0, precios_periodo=None,
+                       serie_precios=None, almacen_precios=ALMACEN_POR_DEFECTO, ruta_traza=None, ruta_exportar=None):
+    """
+    Simula Solar + Arbitraje sobre la curva real horaria/cuarto-horaria del cliente
+    (CSV de Datadis/distribuidora o Excel) en lugar del perfil sintético, mes natural a mes natural.
+    Con precios_periodo (P1..P6) se usa el calendario 3.0TD de las fechas reales de la curva.
+    Con serie_precios (almacén de precios.py) simula además el contrato indexado sobre la misma
+    curva y añade la columna 'Ahorro_Indexado_Eur'.
+    Con ruta_traza guarda el detalle paso a paso de toda la curva (SOC, carga, descarga, red,
+    balance) en un .npy float32 mapeado en memoria (ver traza.py).
+    Con ruta_exportar (.xlsx o .csv) guarda los resultados por mes y la traza con su hora.
+    """
+    import pandas as pd
     
-    # Proyección anual simple (x3 si son 4 meses)
-    factor_anual = 12 / len(datos_facturas)
-    proyeccion = ahorro_total * factor_anual
-    print(f"PROYECCIÓN AHORRO ANUAL:       {proyeccion:,.2f} €")
+    curva = cargar_curva(ruta_curva)
+    traza = crear_traza(len(curva['tiempo']), ruta_traza) if ruta_traza or ruta_exportar else None
+    print(f"\n--- SIMULACIÓN CON CURVA REAL: {os.path.basename(ruta_curva)} ---")
+    print(f"Contador: {curva['contadores'][contador] or '-'} | Pasos/hora: {curva['pasos_por_hora']} | "
+          f"Batería: {cap_bat} kWh | Potencia: {pot_bat} kW")
+    print("-" * 60)
+    
+    meses = simular_curva_meses(curva, contador, cap_bat, pot_bat, eficiencia, precio_venta_excedente,
+                                precio_valle, precio_punta, precios_periodo, serie_precios, almacen_precios, traza)
+    resultados_mes = []
+    for mes in meses:
+        fila = {
+            'Mes': mes['mes'],
+            'Consumo_Total': int(mes['consumo_kwh']),
+            'Excedente_Total': int(mes['excedente_kwh']),
+            'Ahorro_Eur': round(mes['ahorro'], 2)
+        }
+        if serie_precios:
+            fila['Precio_Medio_Indexado'] = round(mes['precio_medio_indexado'], 4)
+            fila['Ahorro_Indexado_Eur'] = round(mes['ahorro_indexado'], 2)
+        resultados_mes.append(fila)
+    ahorro_total = sum(mes['ahorro'] for mes in meses)
     
+    df_res = pd.DataFrame(resultados_mes)
+    print(df_res.to_string(index=False))
+    print("-" * 60)
+    proyeccion = ahorro_total * 12 / len(df_res)
     roi_years = 30000 / proyeccion if proyeccion > 0 else 999
+    print(f"AHORRO TOTAL ({len(df_res)} meses): {ahorro_total:,.2f} €")
+    print(f"PROYECCIÓN AHORRO ANUAL:       {proyeccion:,.2f} €")
     print(f"Retorno Inversión (Est. 30k€):   {roi_years:.1f} años")
+    if serie_precios:
+        proyeccion_ind = df_res['Ahorro_Indexado_Eur'].sum() * 12 / len(df_res)
+        roi_ind = 30000 / proyeccion_ind if proyeccion_ind > 0 else 999
+        print(f"INDEXADO ({serie_precios}): ahorro anual {proyeccion_ind:,.2f} € | Retorno: {roi_ind:.1f} años")
+    if ruta_traza:
+        traza.flush()
+        print(f"Traza paso a paso: {ruta_traza} ({traza.shape[1]:,} pasos desde {curva['tiempo'][0]}, "
+              f"{traza.nbytes / 1e6:.1f} MB)")
+    print("-" * 60)
+    if ruta_exportar:
+        informar_exportacion(exportar(ruta_exportar, [hoja_registros('Resultados', resultados_mes),
+                                                      hoja_traza(traza, curva['tiempo'])]))
+    return df_res
+
+def comparar_contratos(datos_facturas, serie_precios, anio, cap_bat=100, pot_bat=50, eficiencia=0.90,
+                       sector=SECTOR_POR_DEFECTO, estrategia='heuristica', almacen_precios=ALMACEN_POR_DEFECTO):
+    """
+    Contrato fijo (precios de las facturas) frente a indexado (serie del almacén de precios)
+    con el mismo perfil de consumo, mes a mes y en proyección anual.
+    """
+    import pandas as pd
+
+    print(f"\n--- FIJO vs INDEXADO ({serie_precios}, {anio}) ---")
+    print(f"Batería: {cap_bat} kWh | Potencia: {pot_bat} kW | Estrategia: {estrategia}")
+    print("-" * 60)
+    fijo = calcular_arbitraje_y_solar(datos_facturas, cap_bat, pot_bat, eficiencia, sector, estrategia)
+    indexado = calcular_arbitraje_y_solar(con_precios_indexados(datos_facturas, serie_precios, anio, almacen_precios),
+                                          cap_bat, pot_bat, eficiencia, sector, estrategia)
+    df_res = pd.DataFrame({
+        'Mes': [m['Mes'] for m in fijo['meses']],
+        'Ahorro_Fijo_Eur': [m['Ahorro_Eur'] for m in fijo['meses']],
+        'Ahorro_Indexado_Eur': [m['Ahorro_Eur'] for m in indexado['meses']],
+    })
+    print(df_res.to_string(index=False))
+    print("-" * 60)
+    for nombre, res in (('FIJO', fijo), ('INDEXADO', indexado)):
+        print(f"{nombre:<9} ahorro anual: {res['proyeccion_anual']:>10,.2f} € | Retorno: {res['retorno_anios']:.1f} años")
+    print("-" * 60)
+    return df_res
+
+def ejecutar_optimizacion_potencia(ruta_curva, cap_bat=100, pot_bat=50, eficiencia=0.90, contador=0,
+                                   potencias_actuales=None):
+    """
+    Modo recorte de picos: máximos cuarto-horarios por periodo 3.0TD de la curva real y
+    potencias contratadas P1..P6 de mínimo coste anual (fijo + excesos) sin y con batería.
+    """
+    import pandas as pd
+
+    curva = cargar_curva(ruta_curva)
+    print(f"\n--- POTENCIA CONTRATADA 3.0TD: {os.path.basename(ruta_curva)} | Batería {cap_bat} kWh / {pot_bat} kW ---")
+    if curva['pasos_por_hora'] == 1:
+        print("[AVISO] Curva horaria: los máximos son medias horarias y subestiman los picos cuarto-horarios")
+    inicio = time.perf_counter()
+    res = optimizar_potencia_contratada(curva['consumo'][contador], curva['tiempo'], curva['horas_paso'],
+                                        cap_bat, pot_bat, eficiencia, potencias_actuales=potencias_actuales)
+    duracion = time.perf_counter() - inicio
+
+    tabla = pd.DataFrame({
+        'Periodo': PERIODOS,
+        'Max_Demanda_kW': np.round(np.nanmax(res['maximos'], axis=0), 1),
+        'Optima_Sin_Bateria_kW': res['sin_bateria']['potencias'],
+        'Max_Con_Bateria_kW': np.round(np.nanmax(res['maximos_con_bateria'], axis=0), 1),
+        'Optima_Con_Bateria_kW': res['con_bateria']['potencias'],
+    })
+    if 'actual' in res:
+        tabla.insert(2, 'Actual_kW', res['actual']['potencias'])
+    print(tabla.to_string(index=False))
+    print("-" * 60)
+    escenarios = [('Actual', res.get('actual')), ('Óptima sin batería', res['sin_bateria']),
+                  ('Óptima con batería', res['con_bateria'])]
+    for nombre, datos in escenarios:
+        if datos is not None:
+            print(f"{nombre:<20} fijo {datos['coste_fijo']:>9,.2f} € + excesos {datos['coste_excesos']:>8,.2f} € "
+                  f"= {datos['coste_total']:>9,.2f} €/año")
+    print("-" * 60)
+    if 'actual' in res:
+        print(f"Ahorro ajustando potencias (sin batería): {res['ahorro_optimizando']:,.2f} €/año")
+    print(f"Ahorro en potencia gracias a la batería:  {res['ahorro_anual']:,.2f} €/año")
+    print(f"Tiempo de cálculo: {duracion:.2f} s")
+    print("-" * 60)
+    return res
+
+def ejecutar_cotizacion_rapida(ruta_curva, k, precio_valle=0.092, precio_punta=0.129, precio_venta_excedente=0.10,
+                               cap_bat=100, pot_bat=50, eficiencia=0.90, contador=0, precios_periodo=None,
+                               estrategia='heuristica', comparar=False):
+    """
+    Modo cotización rápida: ahorro de toda la curva real simulando solo k días tipo, con su
+    cota de error. Con comparar=True ejecuta también la simulación completa (error real y aceleración).
+    """
+    curva = cargar_curva(ruta_curva)
+    res = cotizar_curva(curva, contador, precio_valle, precio_punta, precios_periodo, k, cap_bat, pot_bat, eficiencia,
+                        precio_venta_excedente, estrategia, comparar=comparar)
+    print(f"\n--- COTIZACIÓN RÁPIDA ({k} DÍAS TIPO): {os.path.basename(ruta_curva)} | "
+          f"Batería {cap_bat} kWh / {pot_bat} kW | {estrategia} ---")
+    print(f"Días simulados: {res['dias_simulados']} de {res['n_dias']}")
+    print(f"Ahorro estimado: {res['ahorro_estimado']:,.2f} € ± {res['cota_error']:,.2f} € "
+          f"({res['cota_error_pct']:.1f}%, banda al 95% de los días de validación"
+          + (", sin el corte diario del DP)" if estrategia == 'optima' else ")"))
+    print(f"Proyección anual: {res['ahorro_estimado'] / res['n_dias'] * 365:,.2f} €")
+    print(f"Tiempo de cálculo: {res['tiempo_s'] * 1000:.1f} ms")
+    if not conviene_cotizacion_rapida(res['n_dias'], estrategia):
+        print(f"[INFO] Con la heurística y {res['n_dias']} días el cálculo exacto es casi igual de rápido "
+              f"(la cotización compensa con --estrategia optima o desde {DIAS_MINIMOS_HEURISTICA} días)")
+    if comparar:
+        print("-" * 60)
+        print(f"Ahorro exacto: {res['ahorro_exacto']:,.2f} € en {res['tiempo_exacto_s'] * 1000:.1f} ms")
+        print(f"Error real: {res['error_real_pct']:+.2f}% | Aceleración: {res['aceleracion']:.1f}x")
     print("-" * 60)
+    return res
 
-    # --- GENERAR GRÁFICA (COMPATIBLE CON DOCKER) ---
-    plt.figure(figsize=(10, 6))
-    plt.bar(df_res['Mes'], df_res['Ahorro_Eur'], color='#4CAF50', edgecolor='black')
+def ejecutar_montecarlo(datos_facturas, n_escenarios, cap_bat=100, pot_bat=50, eficiencia=0.90,
+                       sector=SECTOR_POR_DEFECTO, inversion=30000, semilla=None, curva=None,
+                       precio_valle=0.092, precio_punta=0.129, precio_venta_excedente=0.10, contador=0):
+    """
+    Modo incertidumbre: sortea n_escenarios años de precios y consumo, los simula todos
+    a la vez con el motor por lotes y muestra el ahorro anual y el retorno P10 / P50 / P90.
+    Con curva (ruta a CSV/Excel) los escenarios son bootstraps de días reales.
+    """
+    import pandas as pd
     
-    plt.title(f'Ahorro Estimado - Batería {cap_bat}kWh (Cliente: Bar de Jimmy)', fontsize=14)
-    plt.ylabel('Ahorro Neto (€)', fontsize=12)
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    origen = f"bootstrap de días de {os.path.basename(curva)}" if curva else "facturas perturbadas"
+    print(f"\n--- MONTE CARLO: {n_escenarios:,} escenarios ({origen}) ---")
+    inicio = time.perf_counter()
+    if curva:
+        res = montecarlo_curva(cargar_curva(curva), precio_valle, precio_punta, precio_venta_excedente,
+                               n_escenarios, cap_bat, pot_bat, eficiencia, inversion, contador, semilla=semilla)
+    else:
+        res = montecarlo_facturas(datos_facturas, n_escenarios, cap_bat, pot_bat, eficiencia, sector,
+                                  inversion, semilla=semilla)
+    duracion = time.perf_counter() - inicio
     
-    # Añadir etiquetas de valor en las barras
-    for i, v in enumerate(df_res['Ahorro_Eur']):
-        plt.text(i, v + 1, f"{v:.0f}€", ha='center', fontweight='bold')
+    filas = [{'Percentil': f"P{p}", 'Ahorro_Anual_Eur': round(v['ahorro_anual'], 2),
+              'Retorno_Anios': round(v['retorno_anios'], 1)} for p, v in res['percentiles'].items()]
+    print(pd.DataFrame(filas).to_string(index=False))
+    print("-" * 60)
+    print(f"Ahorro anual medio: {res['ahorro_anual'].mean():,.2f} € | "
+          f"Escenarios con ahorro negativo: {100 * np.mean(res['ahorro_anual'] <= 0):.1f}%")
+    if res.get('dias_descartados'):
+        print(f"[INFO] {res['dias_descartados']} días con huecos en la curva fuera del sorteo")
+    print(f"Tiempo de cálculo: {duracion:.2f} s ({n_escenarios * res['ahorro_mensual'].shape[0]:,} meses simulados)")
+    print("-" * 60)
+    return res
 
-    # Guardado seguro en Docker
-    output_dir = '/app/resultados'
+def ejecutar_ciclo_vida(datos_facturas, anios, cap_bat=100, pot_bat=50, eficiencia=0.90, sector=SECTOR_POR_DEFECTO,
+                       estrategia='heuristica', inversion=30000, tasa_descuento=0.05, escalado_precios=0.02):
+    """
+    Modo ciclo de vida: flujo de caja año a año con degradación (rainflow del SOC + calendario),
+    O&M y sustitución del inversor. Muestra VAN, TIR, LCOS y retorno descontado.
+    """
+    import pandas as pd
     
-    # Si no estamos en Docker (ej. ejecución local), guardamos en carpeta local
-    if not os.path.exists('/app'):
-        output_dir = 'resultados'
-        
-    os.makedirs(output_dir, exist_ok=True)
-    ruta_fichero = os.path.join(output_dir, 'grafica_ahorro.png')
-    
-    plt.savefig(ruta_fichero)
-    print(f"\n[INFO] Gráfica guardada exitosamente en: {ruta_fichero}")
-
-# --- DATOS REALES DE LAS FACTURAS ---
-datos_reales_cliente = [
-    {
-        'mes': 'Mar-Abr', # Factura Primavera (Excedente alto, consumo bajo)
-        'consumo_total_kwh': 2955, 
-        'excedente_total_kwh': 1940,
-        'precio_valle': 0.092,  # P6 Real
-        'precio_punta': 0.129,  # P4 (Punta relativa)
-        'precio_venta_excedente': 0.10
-    },
-    {
-        'mes': 'Abr-May', 
-        'consumo_total_kwh': 3397, 
-        'excedente_total_kwh': 1708,
-        'precio_valle': 0.092, # Asumimos similar anterior
-        'precio_punta': 0.130, 
-        'precio_venta_excedente': 0.10
-    },
-    {
-        'mes': 'May-Jun', # Empieza el calor
-        'consumo_total_kwh': 5891, 
-        'excedente_total_kwh': 1352,
-        'precio_valle': 0.130, # P6 (Sube precio)
-        'precio_punta': 0.172, # P3
-        'precio_venta_excedente': 0.10
-    },
-    {
-        'mes': 'Jun-Jul', # Verano a tope
-        'consumo_total_kwh': 6563, 
-        'excedente_total_kwh': 1399,
-        'precio_valle': 0.131, # P6 Caro
-        'precio_punta': 0.180, # P1 Muy caro
-        'precio_venta_excedente': 0.10
-    }
-]
+    print(f"\n--- CICLO DE VIDA: {anios} años | Batería {cap_bat} kWh | Descuento {tasa_descuento:.1%} | "
+          f"Subida energía {escalado_precios:.1%}/año ---")
+    res = ciclo_vida(datos_facturas, anios, cap_bat, pot_bat, eficiencia, sector, estrategia, inversion,
+                     tasa_descuento, escalado_precios)
+    print(pd.DataFrame(res['anios']).to_string(index=False))
+    print("-" * 60)
+    print(f"VAN ({tasa_descuento:.1%}):              {res['van']:,.2f} €")
+    print(f"TIR:                      {res['tir']:.2%}" if np.isfinite(res['tir']) else "TIR:                      n/d")
+    print(f"LCOS:                     {res['lcos']:.3f} €/kWh descargado")
+    print(f"Retorno descontado:       {res['retorno_descontado']:.1f} años (simple: {res['retorno_simple']:.1f} años)")
+    fin_vida = f"año {res['anio_fin_vida']}" if res['anio_fin_vida'] else f"no se alcanza en {anios} años"
+    print(f"Fin de vida ({SALUD_FIN_VIDA:.0%} capacidad): {fin_vida}")
+    reutilizados = res['meses_simulables'] - res['redespachos']
+    print(f"Despachos simulados:      {res['redespachos']} de {res['meses_simulables']} meses-año"
+          + (f" ({reutilizados} reutilizados: la degradación no cambia su despacho)" if reutilizados else ""))
+    print("-" * 60)
+    return res
+
+def valores_p1_p6(texto):
+    """Convierte 'p1,p2,p3,p4,p5,p6' en una lista de 6 valores (precios €/kWh o potencias kW)."""
+    valores = [float(x) for x in texto.split(',') if x.strip()]
+    if len(valores) != 6:
+        raise argparse.ArgumentTypeError("Se necesitan 6 valores (P1..P6) separados por comas")
+    return valores
+
+def rango(texto):
+    """Convierte 'inicio:fin:paso' (fin incluido) en un array de valores."""
+    inicio, fin, paso = (float(x) for x in texto.split(':'))
+    return np.arange(inicio, fin + paso / 2, paso)
 
 if __name__ == "__main__":
-    # Ejecutamos la simulación
-    simular_arbitraje_y_solar(datos_reales_cliente)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Simulación Solar + Arbitraje de baterías")
+    parser.add_argument('--sector', choices=list(SECTORES), default=SECTOR_POR_DEFECTO,
+                        help="Plantilla de consumo del perfil sintético")
+    parser.add_argument('--estrategia', choices=ESTRATEGIAS, default='heuristica',
+                        help="Despacho por reglas (heuristica) u óptimo por programación dinámica (optima)")
+    parser.add_argument('--barrido', action='store_true', help="Barrido de dimensionado capacidad x potencia")
+    parser.add_argument('--capacidades', type=rango, default='20:500:10', help="Rango kWh 'inicio:fin:paso'")
+    parser.add_argument('--potencias', type=rango, default='10:250:5', help="Rango kW 'inicio:fin:paso'")
+    parser.add_argument('--coste-kwh', type=float, default=300, help="Coste instalado por kWh (€)")
+    parser.add_argument('--coste-kw', type=float, default=0, help="Coste adicional por kW de inversor (€)")
+    parser.add_argument('--curva', help="CSV/Excel con la curva real horaria o cuarto-horaria (Datadis/distribuidora)")
+    parser.add_argument('--contador', type=int, default=0, help="Índice del CUPS dentro del fichero de curva")
+    parser.add_argument('--precio-valle', type=float, default=0.092, help="Precio valle (€/kWh) para la curva real")
+    parser.add_argument('--precio-punta', type=float, default=0.129, help="Precio punta (€/kWh) para la curva real")
+    parser.add_argument('--precio-venta', type=float, default=0.10, help="Precio venta excedente (€/kWh)")
+    parser.add_argument('--precios-periodo', type=valores_p1_p6,
+                        help="Tarifa 3.0TD: precios P1..P6 (€/kWh) separados por comas en lugar de valle/punta")
+    parser.add_argument('--anio', type=int, default=2025, help="Año del calendario 3.0TD / precios indexados para las facturas")
+    parser.add_argument('--optimizar-potencia', action='store_true',
+                        help="Potencia contratada 3.0TD óptima (P1..P6) sin y con batería sobre la curva real (--curva)")
+    parser.add_argument('--potencias-actuales', type=valores_p1_p6, help="Potencias contratadas actuales P1..P6 (kW)")
+    parser.add_argument('--importar-precios', metavar='CSV', help="Importa una serie de precios (CSV genérico u OMIE) al almacén")
+    parser.add_argument('--serie', help="Nombre de la serie al importar (por defecto, el del fichero)")
+    parser.add_argument('--precios-indexados', metavar='SERIE',
+                        help="Compara el contrato fijo con el indexado de esta serie del almacén de precios")
+    parser.add_argument('--almacen-precios', default=ALMACEN_POR_DEFECTO, help="Directorio del almacén de precios")
+    parser.add_argument('--traza', metavar='NPY',
+                        help="Con --curva: guarda SOC/carga/descarga/red/balance de cada paso en un .npy (mmap)")
+    parser.add_argument('--dias-tipo', type=int, metavar='K',
+                        help="Con --curva: cotización rápida simulando solo K días tipo (k-means), con cota de error")
+    parser.add_argument('--comparar-exacto', action='store_true',
+                        help="Con --dias-tipo: ejecuta también la simulación completa y muestra el error real")
+    parser.add_argument('--montecarlo', type=int, metavar='N', help="Incertidumbre: N escenarios Monte Carlo (P10/P50/P90)")
+    parser.add_argument('--semilla', type=int, help="Semilla aleatoria del Monte Carlo (resultados reproducibles)")
+    parser.add_argument('--ciclo-vida', type=int, metavar='ANIOS', help="Flujo de caja a N años con degradación (VAN, TIR, LCOS)")
+    parser.add_argument('--tasa-descuento', type=float, default=0.05, help="Tasa de descuento del VAN (0.05 = 5%%)")
+    parser.add_argument('--escalado-precios', type=float, default=0.02, help="Subida anual del precio de la energía")
+    parser.add_argument('--continuo', action='store_true',
+                        help="Facturas como una sola línea temporal: días reales de calendario (--anio) y SOC arrastrado")
+    parser.add_argument('--puntos-control', metavar='JSON',
+                        help="Reanuda la línea continua desde los puntos de control del fichero y los actualiza (activa --continuo)")
+    parser.add_argument('--fv-kwp', type=float,
+                        help="Modelo FV del emplazamiento (kWp): el excedente sale de producción - demanda, no de la factura")
+    parser.add_argument('--barrido-fv', type=rango, metavar='RANGO',
+                        help="Barrido conjunto FV + batería: rango kWp 'inicio:fin:paso' (con --capacidades/--potencias)")
+    parser.add_argument('--coste-kwp', type=float, default=900, help="Coste instalado por kWp de FV (€)")
+    parser.add_argument('--latitud', type=float, help="Latitud del emplazamiento FV (grados)")
+    parser.add_argument('--longitud', type=float, help="Longitud del emplazamiento FV (grados, oeste negativo)")
+    parser.add_argument('--inclinacion', type=float, help="Inclinación de los paneles (grados sobre la horizontal)")
+    parser.add_argument('--azimut', type=float, help="Orientación de los paneles: 0 = sur, -90 = este, 90 = oeste")
+    parser.add_argument('--perdidas-fv', type=float, help="Pérdidas del sistema FV (0.14 = 14%%)")
+    parser.add_argument('--cielo', choices=CIELOS, help="Modelo de irradiancia sin TMY: días nubosos sintéticos o cielo despejado")
+    parser.add_argument('--tmy', metavar='CSV', help="Año meteorológico tipo (CSV de PVGIS u otro con GHI) en lugar del modelo")
+    parser.add_argument('--exportar', metavar='RUTA',
+                        help="Exporta los resultados (.xlsx o .csv): por periodo, rejilla del barrido o traza de la curva")
+    parser.add_argument('--pasos-por-hora', type=int, choices=(1, 2, 4), default=1,
+                        help="Resolución del perfil sintético de las facturas: 1 horaria, 4 cuarto-horaria (96 pasos/día)")
+    parser.add_argument('--no-plot', action='store_true', help="No genera la gráfica (no importa matplotlib)")
+    parser.add_argument('--instrumentar', action='store_true',
+                        help="Mide tiempo y pasos de cada etapa (perfiles, precios, despacho, tablas, gráfica)")
+    parser.add_argument('--memoria', action='store_true',
+                        help="Con la instrumentación, pico de memoria por etapa (tracemalloc: más lento)")
+    parser.add_argument('--cprofile', metavar='PROF', help="Vuelca un perfil cProfile de la ejecución (activa --instrumentar)")
+    parser.add_argument('--json', action='store_true',
+                        help="Modo sin cabeza: imprime solo el resultado en JSON (sin pandas ni matplotlib)")
+    args = parser.parse_args()
+    if args.precios_periodo:
+        datos_reales_cliente = con_tarifa(datos_reales_cliente, args.precios_periodo, args.anio)
+    if args.fv_kwp or args.barrido_fv is not None:
+        instalacion_fv = instalacion(kwp=args.fv_kwp, latitud=args.latitud, longitud=args.longitud,
+                                     inclinacion=args.inclinacion, azimut=args.azimut, perdidas=args.perdidas_fv,
+                                     cielo=args.cielo, tmy=args.tmy, semilla=args.semilla)
+        datos_reales_cliente = con_fotovoltaica(datos_reales_cliente, instalacion_fv, args.anio)
+    if args.importar_precios:
+        meta = importar_precios(args.importar_precios, args.serie, args.almacen_precios)
+        serie = args.serie or os.path.splitext(os.path.basename(args.importar_precios))[0]
+        print(f"[INFO] Serie '{serie}' importada: años {meta['anios']} | {meta['pasos_por_hora']} pasos/hora")
+        args.precios_indexados = args.precios_indexados or serie
+    
+    medicion = None
+    if args.instrumentar or args.memoria or args.cprofile:
+        medicion = iniciar(memoria=args.memoria, ruta_perfil=args.cprofile)
+    
+    if args.json:
+        resultado = calcular_arbitraje_y_solar(datos_reales_cliente, sector=args.sector, estrategia=args.estrategia,
+                                               continuo=args.continuo, anio=args.anio,
+                                               ruta_puntos_control=args.puntos_control, ruta_exportar=args.exportar,
+                                               pasos_por_hora=args.pasos_por_hora)
+        if medicion is not None:
+            resultado['rendimiento'] = finalizar(medicion)
+            resultado['rendimiento'].pop('perfil_texto')
+            medicion = None
+        json.dump(resultado, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    elif args.ciclo_vida:
+        ejecutar_ciclo_vida(datos_reales_cliente, args.ciclo_vida, sector=args.sector, estrategia=args.estrategia,
+                            tasa_descuento=args.tasa_descuento, escalado_precios=args.escalado_precios)
+    elif args.montecarlo:
+        ejecutar_montecarlo(datos_reales_cliente, args.montecarlo, sector=args.sector, semilla=args.semilla,
+                            curva=args.curva, precio_valle=args.precio_valle, precio_punta=args.precio_punta,
+                            precio_venta_excedente=args.precio_venta, contador=args.contador)
+    elif args.optimizar_potencia:
+        if not args.curva:
+            parser.error("--optimizar-potencia necesita la curva real cuarto-horaria (--curva)")
+        ejecutar_optimizacion_potencia(args.curva, contador=args.contador, potencias_actuales=args.potencias_actuales)
+    elif args.curva and args.dias_tipo:
+        ejecutar_cotizacion_rapida(args.curva, args.dias_tipo, args.precio_valle, args.precio_punta, args.precio_venta,
+                                   contador=args.contador, precios_periodo=args.precios_periodo,
+                                   estrategia=args.estrategia, comparar=args.comparar_exacto)
+    elif args.curva:
+        simular_curva_real(args.curva, args.precio_valle, args.precio_punta, args.precio_venta,
+                           contador=args.contador, precios_periodo=args.precios_periodo,
+                           serie_precios=args.precios_indexados, almacen_precios=args.almacen_precios,
+                           ruta_traza=args.traza, ruta_exportar=args.exportar)
+    elif args.barrido_fv is not None:
+        ejecutar_barrido_fv(datos_reales_cliente, args.barrido_fv, args.capacidades, args.potencias,
+                            coste_kwh=args.coste_kwh, coste_kw=args.coste_kw, coste_kwp=args.coste_kwp,
+                            sector=args.sector, ruta_exportar=args.exportar)
+    elif args.barrido:
+        ejecutar_barrido(datos_reales_cliente, args.capacidades, args.potencias,
+                         coste_kwh=args.coste_kwh, coste_kw=args.coste_kw, sector=args.sector,
+                         ruta_exportar=args.exportar)
+    elif args.precios_indexados:
+        comparar_contratos(datos_reales_cliente, args.precios_indexados, args.anio, sector=args.sector,
+                           estrategia=args.estrategia, almacen_precios=args.almacen_precios)
+    else:
+        # Ejecutamos la simulación
+        simular_arbitraje_y_solar(datos_reales_cliente, sector=args.sector, estrategia=args.estrategia,
+                                  graficar=not args.no_plot, continuo=args.continuo, anio=args.anio,
+                                  ruta_puntos_control=args.puntos_control, ruta_exportar=args.exportar,
+                                  pasos_por_hora=args.pasos_por_hora)    
+    for ruta_fichero, segundos in esperar_graficas():
+        print(f"\n[INFO] Gráfica guardada exitosamente en: {ruta_fichero} ({segundos:.2f} s en segundo plano)")
+    
+    if medicion is not None:
+        resumen = finalizar(medicion)
+        print("\n--- RENDIMIENTO POR ETAPAS ---")
+        print(informe(resumen))
+        if resumen['perfil_texto']:
+            print(resumen['perfil_texto'])
+        print("-" * 60)
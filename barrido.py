@@ -0,0 +1,140 @@
+import numpy as np
+
+from motor import simular_despacho_lote, precios_mes
+from perfiles import perfil_mensual, SECTOR_POR_DEFECTO
+from fotovoltaica import produccion_periodo, balance_neto, demanda_mes
+
+# --- BARRIDO DE DIMENSIONADO (CAPACIDAD x POTENCIA) ---
+# Simula todas las combinaciones de batería a la vez con el motor por lotes
+# y devuelve la matriz de ahorro / retorno junto con el tamaño óptimo.
+
+
+def barrido_dimensionado(datos_facturas, capacidades, potencias, eficiencia=0.90,
+                         coste_kwh=300, coste_kw=0, sector=SECTOR_POR_DEFECTO):
+    """
+    Barre una rejilla de capacidades (kWh) y potencias de inversor (kW).
+    datos_facturas usa el mismo formato que simular_arbitraje_y_solar; sector elige la
+    plantilla de consumo (ver perfiles.SECTORES).
+
+    Inversión estimada = capacidad * coste_kwh + potencia * coste_kw
+    (300 €/kWh reproduce los 30k€ de la batería de 100 kWh).
+
+    Devuelve un dict con las matrices 'ahorro_periodo', 'ahorro_anual' y 'retorno_anios'
+    de forma (n_capacidades, n_potencias) y el dict 'optimo' (menor retorno).
+    """
+    capacidades = np.asarray(capacidades, dtype=float)
+    potencias = np.asarray(potencias, dtype=float)
+    malla_cap, malla_pot = np.meshgrid(capacidades, potencias, indexing='ij')
+    cap_plana = malla_cap.ravel()
+    pot_plana = malla_pot.ravel()
+
+    ahorro_periodo = np.zeros(cap_plana.size)
+    for mes in datos_facturas:
+        hora_dia, consumo_kwh, solar_kwh = perfil_mensual(
+            mes['consumo_total_kwh'], mes['excedente_total_kwh'], 30, sector=sector
+        )
+        precio_compra, es_valle, precio_punta = precios_mes(mes, hora_dia, consumo_kwh=consumo_kwh)
+
+        # Todas las configuraciones en un único recorrido temporal del mes
+        resultado = simular_despacho_lote(
+            consumo_kwh, solar_kwh, precio_compra, es_valle,
+            cap_bat=cap_plana, pot_bat=pot_plana, eficiencia=eficiencia,
+            precio_venta_excedente=mes['precio_venta_excedente'],
+            precio_punta=precio_punta
+        )
+        ahorro_periodo += resultado['ahorro_total']
+
+    # Proyección anual simple (igual que el script de consola)
+    ahorro_anual = ahorro_periodo * (12 / len(datos_facturas))
+    inversion = cap_plana * coste_kwh + pot_plana * coste_kw
+    retorno = np.where(ahorro_anual > 0, inversion / np.where(ahorro_anual > 0, ahorro_anual, 1), np.inf)
+
+    forma = malla_cap.shape
+    idx = int(np.argmin(retorno))
+    optimo = {
+        'cap_bat': float(cap_plana[idx]),
+        'pot_bat': float(pot_plana[idx]),
+        'inversion': float(inversion[idx]),
+        'ahorro_anual': float(ahorro_anual[idx]),
+        'retorno_anios': float(retorno[idx]),
+    }
+
+    return {
+        'capacidades': capacidades,
+        'potencias': potencias,
+        'ahorro_periodo': ahorro_periodo.reshape(forma),
+        'ahorro_anual': ahorro_anual.reshape(forma),
+        'retorno_anios': retorno.reshape(forma),
+        'optimo': optimo,
+    }
+
+
+def barrido_fv_bateria(datos_facturas, potencias_fv, capacidades, potencias, eficiencia=0.90,
+                       coste_kwh=300, coste_kw=0, coste_kwp=900, sector=SECTOR_POR_DEFECTO):
+    """
+    Barrido conjunto FV + batería: kWp x capacidad (kWh) x potencia (kW).
+    datos_facturas debe traer 'fotovoltaica' e 'inicio' (fotovoltaica.con_fotovoltaica); su
+    'kwp' se ignora. La producción de 1 kWp de cada periodo sale de la caché de fotovoltaica.py
+    una sola vez y se escala para cada kWp; el balance con la demanda (demanda_mes) da el consumo
+    de red y el excedente con que el motor por lotes barre toda la rejilla de baterías.
+
+    Ahorro = autoconsumo directo a precio de compra + excedente vendido + ahorro de la batería
+    (que ya descuenta el excedente que deja de venderse al cargarla).
+    Inversión = kWp * coste_kwp + capacidad * coste_kwh + potencia * coste_kw.
+
+    Devuelve 'ahorro_fv_anual' (solo FV, forma (n_fv,)), las matrices 'ahorro_periodo',
+    'ahorro_anual' y 'retorno_anios' de forma (n_fv, n_capacidades, n_potencias) y 'optimo'.
+    """
+    potencias_fv = np.asarray(potencias_fv, dtype=float)
+    capacidades = np.asarray(capacidades, dtype=float)
+    potencias = np.asarray(potencias, dtype=float)
+    malla_cap, malla_pot = np.meshgrid(capacidades, potencias, indexing='ij')
+    cap_plana = malla_cap.ravel()
+    pot_plana = malla_pot.ravel()
+
+    ahorro_fv = np.zeros(potencias_fv.size)
+    ahorro_periodo = np.zeros((potencias_fv.size, cap_plana.size))
+    for mes in datos_facturas:
+        hora_dia, demanda, _ = perfil_mensual(demanda_mes(mes), 0.0, 30, sector=sector)
+        unidad = produccion_periodo({**mes['fotovoltaica'], 'kwp': 1.0}, mes['inicio'], 30)
+
+        for k, kwp in enumerate(potencias_fv.tolist()):
+            consumo_red, excedente, autoconsumo = balance_neto(demanda, unidad * kwp)
+            # El precio de reventa se pondera con el consumo de red, como en motor.entradas_mes
+            precio_compra, es_valle, precio_punta = precios_mes(mes, hora_dia, consumo_kwh=consumo_red)
+            ahorro_fv[k] += autoconsumo @ precio_compra + excedente.sum() * mes['precio_venta_excedente']
+            resultado = simular_despacho_lote(
+                consumo_red, excedente, precio_compra, es_valle,
+                cap_bat=cap_plana, pot_bat=pot_plana, eficiencia=eficiencia,
+                precio_venta_excedente=mes['precio_venta_excedente'],
+                precio_punta=precio_punta
+            )
+            ahorro_periodo[k] += resultado['ahorro_total']
+
+    ahorro_periodo += ahorro_fv[:, None]
+    factor_anual = 12 / len(datos_facturas)
+    ahorro_anual = ahorro_periodo * factor_anual
+    inversion = potencias_fv[:, None] * coste_kwp + (cap_plana * coste_kwh + pot_plana * coste_kw)[None, :]
+    retorno = np.where(ahorro_anual > 0, inversion / np.where(ahorro_anual > 0, ahorro_anual, 1), np.inf)
+
+    forma = (potencias_fv.size,) + malla_cap.shape
+    k, idx = np.unravel_index(int(np.argmin(retorno)), retorno.shape)
+    optimo = {
+        'kwp': float(potencias_fv[k]),
+        'cap_bat': float(cap_plana[idx]),
+        'pot_bat': float(pot_plana[idx]),
+        'inversion': float(inversion[k, idx]),
+        'ahorro_anual': float(ahorro_anual[k, idx]),
+        'retorno_anios': float(retorno[k, idx]),
+    }
+
+    return {
+        'potencias_fv': potencias_fv,
+        'capacidades': capacidades,
+        'potencias': potencias,
+        'ahorro_fv_anual': ahorro_fv * factor_anual,
+        'ahorro_periodo': ahorro_periodo.reshape(forma),
+        'ahorro_anual': ahorro_anual.reshape(forma),
+        'retorno_anios': retorno.reshape(forma),
+        'optimo': optimo,
+    }
@@ -0,0 +1,456 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import logging
+import subprocess
+import tracemalloc
+import importlib.util
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+
+from motor import simular_despacho, simular_despacho_lote
+from optimo import despacho_optimo
+from perfiles import perfil_mensual, SECTOR_POR_DEFECTO
+from tarifas import precios_dos_tramos
+from barrido import barrido_dimensionado
+from datos_cliente import datos_reales_cliente
+
+# --- BENCHMARK Y EQUIVALENCIA DE LOS MOTORES DE SIMULACIÓN ---
+# Cronometra cada motor sobre cargas estándar (4 meses horarios, 1 año horario,
+# 1 año cuarto-horario y un barrido de 100 configuraciones), mide pasos/s y el pico de memoria
+# (tracemalloc, en una ejecución aparte para no falsear el tiempo) y compara el ahorro con los
+# valores de referencia de la implementación actual sobre los datos del cliente (tolerancia 1 céntimo)
+# y comprueba INVARIANTES entre casos (el óptimo nunca ahorra menos que la heurística).
+# Los casos 'conocido/...' comparan piezas sueltas con una respuesta calculada a mano o en la norma
+# y devuelven la desviación respecto a ella (referencia 0).
+# Cada ejecución se añade al historial JSON para ver regresiones entre versiones.
+#
+#   python benchmark.py                 -> todos los casos
+#   python benchmark.py --rapido        -> sin los casos lentos (óptimo cuarto-horario)
+#   python benchmark.py --solo anio     -> solo los casos cuyo nombre contiene 'anio'
+#   python benchmark.py --arranque      -> arranque en frío de los scripts y desglose de importaciones
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+HISTORIAL_POR_DEFECTO = os.path.join('resultados', 'benchmark_historial.json')
+TOLERANCIA_EUR = 0.01
+UMBRAL_REGRESION = 1.25  # Avisamos si un caso tarda >25% más que en la ejecución anterior
+
+# Ahorro (€) de referencia de la implementación actual con los datos de las facturas
+REFERENCIAS = {
+    'facturas_4m/main.simular_caso_real': 129.54149999999996,
+    'facturas_4m/simular_arbitraje_y_solar': 446.3897702025077,
+    'facturas_4m/appstream.ejecutar_simulacion': 446.3897702025077,
+    'facturas_4m/motor.simular_despacho': 446.3897702025077,
+    'facturas_4m/motor.simular_despacho_lote': 446.3897702025077,
+    'anio_horario/motor.simular_despacho': 1629.846897027429,
+    'anio_horario/motor.simular_despacho_lote': 1629.8468970274544,
+    'anio_horario/optimo.despacho_optimo': 1636.9599485908059,
+    'anio_cuartohorario/motor.simular_despacho': 1632.139969806854,
+    'anio_cuartohorario/motor.simular_despacho_lote': 1632.1399698071034,
+    'anio_cuartohorario/optimo.despacho_optimo': 1636.9857335225856,
+    'barrido_100/barrido.barrido_dimensionado': 35335.14034886873,
+    'conocido/ciclovida.rainflow': 0.0,
+    'conocido/tarifas.calendario_periodos': 0.0,
+    'conocido/potencia.coste_excesos': 0.0,
+}
+
+CASOS_LENTOS = ('anio_cuartohorario/optimo.despacho_optimo',)
+
+# Invariantes entre casos de la misma carga: (caso que debe ahorrar al menos lo mismo, caso de comparación)
+INVARIANTES = (
+    ('anio_horario/optimo.despacho_optimo', 'anio_horario/motor.simular_despacho'),
+    ('anio_cuartohorario/optimo.despacho_optimo', 'anio_cuartohorario/motor.simular_despacho'),
+)
+
+# Arranque en frío: proceso nuevo desde el lanzamiento hasta el primer resultado
+ARRANQUES = {
+    'arbitraje-y-solar.py --json': ['arbitraje-y-solar.py', '--json'],
+    'arbitraje-y-solar.py --no-plot': ['arbitraje-y-solar.py', '--no-plot'],
+    'arbitraje-y-solar.py': ['arbitraje-y-solar.py'],
+    'main.py': ['main.py'],
+}
+MODULOS_DESGLOSE = ('numpy', 'pandas', 'matplotlib', 'matplotlib.pyplot', 'motor', 'perfiles', 'barrido',
+                    'curvas', 'montecarlo', 'optimo')
+
+# Rejilla del barrido: 10 capacidades x 10 potencias (incluye la batería de referencia 100 kWh / 50 kW)
+CAPACIDADES_BARRIDO = np.arange(10, 101, 10)
+POTENCIAS_BARRIDO = np.arange(5, 51, 5)
+
+# Ejemplo de conteo rainflow de la norma ASTM E1049-85: serie y ciclos esperados {rango: cuenta}
+SERIE_ASTM = (-2, 1, -3, 5, -1, 3, -4, 4, -2)
+CICLOS_ASTM = {3: 0.5, 4: 1.5, 6: 0.5, 8: 1.0, 9: 0.5}
+
+# Festivos nacionales de fecha fija de 2025: todas sus horas son P6. En el año hay 104 días de
+# fin de semana y 6 festivos en laborable (24 h de P6) y 255 laborables (8 h de P6)
+FESTIVOS_2025 = ('2025-01-01', '2025-01-06', '2025-05-01', '2025-08-15', '2025-10-12', '2025-11-01',
+                 '2025-12-06', '2025-12-08', '2025-12-25')
+HORAS_P6_2025 = 110 * 24 + 255 * 8
+
+
+def _cargar_script(fichero, nombre):
+    """Importa un script del repositorio con guiones en el nombre (p.ej. arbitraje-y-solar.py)."""
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    spec = importlib.util.spec_from_file_location(nombre, os.path.join(DIRECTORIO, fichero))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def _cargar_app():
+    """Importa appstream.py fuera de `streamlit run` (modo sin servidor, sin avisos)."""
+    logging.disable(logging.WARNING)
+    try:
+        with redirect_stdout(io.StringIO()):
+            return _cargar_script('appstream.py', 'appstream')
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _carga_anual(pasos_por_hora):
+    """Año completo con el consumo/excedente medio de las facturas (igual que cuarto-horarias.py --anual)."""
+    datos = datos_reales_cliente
+    n_meses = len(datos)
+    consumo_anual = sum(m['consumo_total_kwh'] for m in datos) * 12 / n_meses
+    excedente_anual = sum(m['excedente_total_kwh'] for m in datos) * 12 / n_meses
+    precio_valle = float(np.mean([m['precio_valle'] for m in datos]))
+    precio_punta = float(np.mean([m['precio_punta'] for m in datos]))
+
+    hora_dia, consumo, solar = perfil_mensual(consumo_anual, excedente_anual, 365, pasos_por_hora, SECTOR_POR_DEFECTO)
+    precio, es_valle, precio_punta = precios_dos_tramos(hora_dia, precio_valle, precio_punta)
+    return {
+        'consumo': consumo,
+        'solar': solar,
+        'precio': precio,
+        'es_valle': es_valle,
+        'precio_punta': precio_punta,
+        'precio_venta_excedente': datos[0]['precio_venta_excedente'],
+        'horas_paso': 1 / pasos_por_hora,
+    }
+
+
+def _meses_horarios():
+    """Perfiles horarios de los 4 meses de factura (entradas del motor ya generadas)."""
+    meses = []
+    for mes in datos_reales_cliente:
+        hora_dia, consumo, solar = perfil_mensual(mes['consumo_total_kwh'], mes['excedente_total_kwh'], 30)
+        precio, es_valle, _ = precios_dos_tramos(hora_dia, mes['precio_valle'], mes['precio_punta'])
+        meses.append((mes, consumo, solar, precio, es_valle))
+    return meses
+
+
+# --- CASOS: cada uno devuelve (pasos simulados, función sin argumentos que devuelve el ahorro en €) ---
+
+def _caso_main():
+    main = _cargar_script('main.py', 'main')
+    return len(main.datos_reales), lambda: main.simular_caso_real(main.datos_reales)
+
+
+def _caso_arbitraje():
+    modulo = _cargar_script('arbitraje-y-solar.py', 'arbitraje_y_solar')
+
+    def ejecutar():
+        import graficas
+        graficas.vaciar_cache()  # Cada repetición dibuja la gráfica de verdad
+        df_res = modulo.simular_arbitraje_y_solar(datos_reales_cliente)
+        graficas.esperar_graficas()  # La gráfica va en segundo plano: se cuenta hasta que termina
+        return float(df_res['Ahorro_Eur'].sum())
+    return len(datos_reales_cliente) * 720, ejecutar
+
+
+def _caso_app():
+    app = _cargar_app()
+    datos_df = app.datos_iniciales
+
+    def ejecutar():
+        app.simular_mes_cacheado.clear()  # Vaciamos la caché por mes para medir el cálculo real
+        return app.ejecutar_simulacion(datos_df, 100, 50, 0.90, 0.10)[1]
+    return len(datos_df) * 720, ejecutar
+
+
+def _caso_meses(lote):
+    meses = _meses_horarios()
+
+    def ejecutar():
+        total = 0.0
+        for mes, consumo, solar, precio, es_valle in meses:
+            argumentos = dict(eficiencia=0.90, precio_venta_excedente=mes['precio_venta_excedente'],
+                              precio_punta=mes['precio_punta'])
+            if lote:
+                total += float(simular_despacho_lote(consumo, solar, precio, es_valle, 100, 50, **argumentos)['ahorro_total'][0])
+            else:
+                total += simular_despacho(consumo, solar, precio, es_valle, 100, 50, **argumentos)['ahorro_total']
+        return total
+    return sum(len(m[1]) for m in meses), ejecutar
+
+
+def _caso_anual(pasos_por_hora, motor):
+    c = _carga_anual(pasos_por_hora)
+
+    def ejecutar():
+        if motor == 'optimo':
+            return despacho_optimo(c['consumo'], c['solar'], c['precio'], 100, 50, 0.90,
+                                   c['precio_venta_excedente'], horas_paso=c['horas_paso'])['ahorro_total']
+        argumentos = dict(eficiencia=0.90, precio_venta_excedente=c['precio_venta_excedente'],
+                          precio_punta=c['precio_punta'], horas_paso=c['horas_paso'])
+        if motor == 'lote':
+            return float(simular_despacho_lote(c['consumo'], c['solar'], c['precio'], c['es_valle'], 100, 50,
+                                               **argumentos)['ahorro_total'][0])
+        return simular_despacho(c['consumo'], c['solar'], c['precio'], c['es_valle'], 100, 50, **argumentos)['ahorro_total']
+    return len(c['consumo']), ejecutar
+
+
+def _caso_barrido():
+    datos = datos_reales_cliente
+    n_configuraciones = len(CAPACIDADES_BARRIDO) * len(POTENCIAS_BARRIDO)
+
+    def ejecutar():
+        return float(barrido_dimensionado(datos, CAPACIDADES_BARRIDO, POTENCIAS_BARRIDO)['ahorro_periodo'].sum())
+    # Pasos = pasos de tiempo x configuraciones (cada configuración es una simulación completa)
+    return len(datos) * 720 * n_configuraciones, ejecutar
+
+
+# --- CASOS DE RESPUESTA CONOCIDA: la función devuelve la desviación respecto a la respuesta esperada ---
+
+def _caso_rainflow_astm():
+    from ciclovida import rainflow
+
+    def ejecutar():
+        rangos, cuentas = rainflow(np.array(SERIE_ASTM, dtype=float))
+        contados = {}
+        for rango, cuenta in zip(rangos.tolist(), cuentas.tolist()):
+            contados[rango] = contados.get(rango, 0.0) + cuenta
+        return sum(abs(contados.get(r, 0.0) - CICLOS_ASTM.get(r, 0.0)) for r in set(contados) | set(CICLOS_ASTM))
+    return len(SERIE_ASTM), ejecutar
+
+
+def _caso_festivos_2025():
+    from tarifas import calendario_periodos, PERIODO_VALLE
+
+    def ejecutar():
+        calendario = calendario_periodos(2025)
+        dias = (np.array(FESTIVOS_2025, dtype='datetime64[D]') - np.datetime64('2025-01-01', 'D')).astype(np.int64)
+        horas_festivos = calendario.reshape(-1, 24)[dias]
+        return float(np.sum(horas_festivos != PERIODO_VALLE) + abs(np.sum(calendario == PERIODO_VALLE) - HORAS_P6_2025))
+    return 8760, ejecutar
+
+
+def _caso_excesos():
+    from potencia import preparar_demanda, coste_excesos, TEP_30TD, KP_30TD
+
+    # Dos meses cuarto-horarios de demanda aleatoria (con valores repetidos) y candidatos que
+    # incluyen 0, valores exactos de la demanda y potencias por encima del máximo
+    azar = np.random.default_rng(7)
+    n_meses = 2
+    demanda = np.round(azar.gamma(2.0, 20.0, n_meses * 30 * 96), 1)
+    periodos = azar.integers(0, 6, len(demanda))
+    mes_id = np.repeat(np.arange(n_meses), 30 * 96)
+    candidatos = np.concatenate(([0.0], demanda[:20], np.linspace(1, demanda.max() + 10, 25)))
+    tablas = preparar_demanda(demanda, periodos, mes_id)
+
+    def ejecutar():
+        desviacion = 0.0
+        for p in range(6):
+            rapido = coste_excesos(tablas, p, candidatos, n_meses)
+            for c, valor in zip(candidatos.tolist(), rapido.tolist()):
+                total = 0.0
+                for m in range(n_meses):
+                    cuadrados = sum((d - c) ** 2 for d in demanda[(periodos == p) & (mes_id == m)].tolist() if d > c)
+                    total += cuadrados ** 0.5
+                desviacion += abs(valor - TEP_30TD * KP_30TD[p] * total)
+        return desviacion
+    return len(demanda) * len(candidatos), ejecutar
+
+
+CASOS = {
+    'facturas_4m/main.simular_caso_real': _caso_main,
+    'facturas_4m/simular_arbitraje_y_solar': _caso_arbitraje,
+    'facturas_4m/appstream.ejecutar_simulacion': _caso_app,
+    'facturas_4m/motor.simular_despacho': lambda: _caso_meses(lote=False),
+    'facturas_4m/motor.simular_despacho_lote': lambda: _caso_meses(lote=True),
+    'anio_horario/motor.simular_despacho': lambda: _caso_anual(1, 'escalar'),
+    'anio_horario/motor.simular_despacho_lote': lambda: _caso_anual(1, 'lote'),
+    'anio_horario/optimo.despacho_optimo': lambda: _caso_anual(1, 'optimo'),
+    'anio_cuartohorario/motor.simular_despacho': lambda: _caso_anual(4, 'escalar'),
+    'anio_cuartohorario/motor.simular_despacho_lote': lambda: _caso_anual(4, 'lote'),
+    'anio_cuartohorario/optimo.despacho_optimo': lambda: _caso_anual(4, 'optimo'),
+    'barrido_100/barrido.barrido_dimensionado': _caso_barrido,
+    'conocido/ciclovida.rainflow': _caso_rainflow_astm,
+    'conocido/tarifas.calendario_periodos': _caso_festivos_2025,
+    'conocido/potencia.coste_excesos': _caso_excesos,
+}
+
+
+def medir(nombre, repeticiones=3):
+    """
+    Ejecuta un caso: mejor tiempo de `repeticiones`, pasos/s, pico de memoria (MB) y
+    comprobación contra REFERENCIAS. La salida por consola de los scripts se descarta.
+    """
+    pasos, funcion = CASOS[nombre]()
+    with redirect_stdout(io.StringIO()):
+        funcion()  # Calentamiento (importaciones, cachés de plantillas)
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            ahorro = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+
+        tracemalloc.start()
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    mejor = min(tiempos)
+    referencia = REFERENCIAS.get(nombre)
+    return {
+        'pasos': pasos,
+        'segundos': mejor,
+        'pasos_por_segundo': pasos / mejor if mejor > 0 else float('inf'),
+        'pico_memoria_mb': pico / 2**20,
+        'ahorro_eur': float(ahorro),
+        'referencia_eur': referencia,
+        'equivalente': None if referencia is None else abs(float(ahorro) - referencia) <= TOLERANCIA_EUR,
+    }
+
+
+def _desglose_importaciones(argumentos):
+    """Tiempo acumulado (ms) de importación de los módulos principales según `python -X importtime`."""
+    proceso = subprocess.run([sys.executable, '-X', 'importtime', *argumentos], cwd=DIRECTORIO,
+                             capture_output=True, text=True)
+    desglose = {}
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith('import time:') or '|' not in linea:
+            continue
+        _, acumulado, modulo = linea.split('|')
+        modulo = modulo.strip()
+        if modulo in MODULOS_DESGLOSE and acumulado.strip().isdigit():
+            desglose[modulo] = int(acumulado) / 1000
+    return desglose
+
+
+def medir_arranque(repeticiones=3):
+    """
+    Arranque en frío de cada comando de ARRANQUES (mejor de `repeticiones` procesos nuevos)
+    y desglose de importaciones del primero. La salida de los scripts se descarta.
+    """
+    print(f"\n--- ARRANQUE EN FRÍO: {len(ARRANQUES)} comandos | {repeticiones} repeticiones ---")
+    resultados = {}
+    for nombre, argumentos in ARRANQUES.items():
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            subprocess.run([sys.executable, *argumentos], cwd=DIRECTORIO, capture_output=True, check=True)
+            tiempos.append(time.perf_counter() - inicio)
+        desglose = _desglose_importaciones(argumentos)
+        resultados[nombre] = {'segundos': min(tiempos), 'importaciones_ms': desglose}
+        modulos = ', '.join(f"{m} {ms:.0f}" for m, ms in sorted(desglose.items(), key=lambda x: -x[1])[:4])
+        print(f"{nombre:<34}{min(tiempos) * 1000:>8.0f} ms   importaciones (ms): {modulos}")
+    print("-" * 112)
+    return resultados
+
+
+def _version_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _leer_historial(ruta):
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def ejecutar_benchmark(casos=None, repeticiones=3, ruta_historial=HISTORIAL_POR_DEFECTO, guardar=True,
+                       arranque=False):
+    """
+    Ejecuta los casos pedidos, imprime la tabla, compara con la última medición de cada caso
+    en el historial y (si guardar) añade la ejecución al JSON. Con arranque=True mide además
+    el arranque en frío de los scripts. Devuelve (entrada, ok) donde ok indica que todos los
+    casos con referencia coinciden al céntimo.
+    """
+    casos = list(CASOS) if casos is None else casos
+    historial = _leer_historial(ruta_historial)
+    anterior = {}
+    for ejecucion in historial:
+        anterior.update(ejecucion['resultados'])
+
+    resultados = {}
+    ok = True
+    if casos:
+        print(f"\n--- BENCHMARK: {len(casos)} casos | {repeticiones} repeticiones (mejor tiempo) ---")
+        print(f"{'Caso':<50}{'Pasos':>10}{'Tiempo':>11}{'Pasos/s':>13}{'Pico MB':>9}{'Ahorro €':>12}  Ref.")
+        print("-" * 112)
+
+        for nombre in casos:
+            r = medir(nombre, repeticiones)
+            resultados[nombre] = r
+            if r['equivalente'] is None:
+                marca = '-'
+            elif r['equivalente']:
+                marca = 'OK'
+            else:
+                marca = f"FALLO (ref. {r['referencia_eur']:.2f})"
+                ok = False
+            previo = anterior.get(nombre)
+            if previo and r['segundos'] > previo['segundos'] * UMBRAL_REGRESION:
+                marca += f" | REGRESIÓN x{r['segundos'] / previo['segundos']:.2f}"
+            print(f"{nombre:<50}{r['pasos']:>10,}{r['segundos'] * 1000:>9.1f}ms{r['pasos_por_segundo']:>13,.0f}"
+                  f"{r['pico_memoria_mb']:>9.1f}{r['ahorro_eur']:>12.2f}  {marca}")
+
+        print("-" * 112)
+        for mayor, menor in INVARIANTES:
+            if mayor in resultados and menor in resultados:
+                cumple = resultados[mayor]['ahorro_eur'] >= resultados[menor]['ahorro_eur'] - TOLERANCIA_EUR
+                ok = ok and cumple
+                print(f"Invariante {mayor} >= {menor}: " + ("OK" if cumple else
+                      f"FALLO ({resultados[mayor]['ahorro_eur']:.2f} < {resultados[menor]['ahorro_eur']:.2f})"))
+        print("Equivalencia con los valores de referencia: " + ("OK" if ok else "FALLO"))
+
+    entrada = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _version_codigo(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'procesador': platform.processor() or platform.machine(),
+        'repeticiones': repeticiones,
+        'resultados': resultados,
+    }
+    if arranque:
+        entrada['arranque'] = medir_arranque(repeticiones)
+    if guardar:
+        os.makedirs(os.path.dirname(os.path.abspath(ruta_historial)), exist_ok=True)
+        historial.append(entrada)
+        with open(ruta_historial, 'w', encoding='utf-8') as f:
+            json.dump(historial, f, indent=2, ensure_ascii=False)
+        print(f"[INFO] Historial actualizado: {ruta_historial} ({len(historial)} ejecuciones)")
+    return entrada, ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark y equivalencia de los motores de simulación")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Repeticiones por caso (se usa el mejor tiempo)")
+    parser.add_argument('--solo', help="Ejecuta solo los casos cuyo nombre contiene este texto")
+    parser.add_argument('--rapido', action='store_true', help="Omite los casos lentos (óptimo cuarto-horario)")
+    parser.add_argument('--historial', default=HISTORIAL_POR_DEFECTO, help="Fichero JSON de historial")
+    parser.add_argument('--no-guardar', action='store_true', help="No añade la ejecución al historial")
+    parser.add_argument('--arranque', action='store_true',
+                        help="Mide solo el arranque en frío de los scripts y el desglose de importaciones")
+    args = parser.parse_args()
+
+    if args.arranque:
+        seleccion = []
+    else:
+        seleccion = [c for c in CASOS if (not args.solo or args.solo in c) and not (args.rapido and c in CASOS_LENTOS)]
+    _, todo_ok = ejecutar_benchmark(seleccion, args.repeticiones, args.historial, not args.no_guardar, args.arranque)
+    sys.exit(0 if todo_ok else 1)
@@ -0,0 +1,264 @@
+import os
+import math
+import csv
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from motor import simular_mes, ESTRATEGIAS
+from exportar import escribir_csv, exportar
+from perfiles import SECTORES, SECTOR_POR_DEFECTO
+
+# --- EJECUCIÓN POR LOTES DE UNA CARTERA DE CLIENTES ---
+# Lee un directorio (o un manifiesto) con los datos mensuales de cada cliente, reparte los
+# clientes entre procesos (uno por núcleo) con el mismo motor que simular_arbitraje_y_solar
+# y va escribiendo cada resultado al CSV consolidado en cuanto termina (el .xlsx opcional se
+# escribe al final con las mismas filas, a través de exportar.py).
+# Si un cliente falla se registra el error y se continúa con el resto.
+
+EXTENSIONES_CLIENTE = ('.json', '.csv')
+
+# Columnas de la tabla de la app Streamlit -> claves de los scripts de consola
+COLUMNAS_TABLA = {
+    'Mes': 'mes',
+    'Consumo (kWh)': 'consumo_total_kwh',
+    'Excedente (kWh)': 'excedente_total_kwh',
+    'Precio Valle (€)': 'precio_valle',
+    'Precio Punta (€)': 'precio_punta',
+    'Precio Venta Excedente (€)': 'precio_venta_excedente',
+}
+
+CAMPOS_SALIDA = [
+    'Cliente', 'Fichero', 'Capacidad_kWh', 'Potencia_kW', 'Meses', 'Ahorro_Periodo_Eur',
+    'Ahorro_Anual_Eur', 'Inversion_Eur', 'Retorno_Anios', 'Estado', 'Error', 'Tiempo_s'
+]
+
+
+def cargar_cliente(ruta, precio_venta_excedente=0.10):
+    """
+    Lee los datos mensuales de un cliente.
+      .json -> lista de meses (formato datos_reales_cliente) o dict {'cliente', 'meses', ...}
+              con opcionales 'cap_bat', 'pot_bat', 'sector', 'inversion'
+      .csv  -> tabla con las columnas de la app ('Mes', 'Consumo (kWh)', ...) o las claves de consola
+    Devuelve (nombre, meses, opciones_cliente).
+    """
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    opciones = {}
+    if ruta.lower().endswith('.json'):
+        with open(ruta, 'r', encoding='utf-8') as f:
+            contenido = json.load(f)
+        if isinstance(contenido, dict):
+            nombre = contenido.get('cliente', nombre)
+            opciones = {k: contenido[k] for k in ('cap_bat', 'pot_bat', 'sector', 'inversion') if k in contenido}
+            meses = contenido['meses']
+        else:
+            meses = contenido
+    else:
+        with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+            separador = ';' if ';' in f.readline() else ','
+            f.seek(0)
+            filas = list(csv.DictReader(f, delimiter=separador))
+        meses = [{k: v for k, v in fila.items() if k} for fila in filas]
+    return nombre, normalizar_meses(meses, precio_venta_excedente, ruta), opciones
+
+
+def normalizar_meses(meses, precio_venta_excedente=0.10, origen='los datos'):
+    """
+    Meses con las claves de consola (acepta también las columnas de la app), importes como
+    float (admite coma decimal) y precio de venta del excedente por defecto.
+    Lanza ValueError si falta alguna columna o no hay meses.
+    """
+    normalizados = []
+    for fila in meses:
+        mes = {COLUMNAS_TABLA.get(str(k).strip(), str(k).strip()): v for k, v in fila.items()}
+        for clave in ('consumo_total_kwh', 'excedente_total_kwh', 'precio_valle', 'precio_punta',
+                      'precio_venta_excedente'):
+            if clave in mes and mes[clave] not in (None, ''):
+                mes[clave] = float(str(mes[clave]).replace(',', '.'))
+                if not math.isfinite(mes[clave]):
+                    raise ValueError(f"'{clave}' del mes {mes.get('mes')} no es un número finito en {origen}")
+        mes.setdefault('precio_venta_excedente', precio_venta_excedente)
+        faltan = [c for c in ('mes', 'consumo_total_kwh', 'excedente_total_kwh', 'precio_valle', 'precio_punta')
+                  if c not in mes]
+        if faltan:
+            raise ValueError(f"Faltan columnas {faltan} en {origen}")
+        normalizados.append(mes)
+    if not normalizados:
+        raise ValueError(f"{origen} no contiene meses")
+    return normalizados
+
+
+def listar_clientes(entrada):
+    """
+    Devuelve la lista de tareas a partir de un directorio de ficheros de cliente
+    o de un manifiesto CSV (columnas 'fichero' y opcionales 'cliente', 'cap_bat', 'pot_bat', 'sector', 'inversion').
+    """
+    if os.path.isdir(entrada):
+        return [{'fichero': os.path.join(entrada, f)} for f in sorted(os.listdir(entrada))
+                if f.lower().endswith(EXTENSIONES_CLIENTE)]
+
+    base = os.path.dirname(os.path.abspath(entrada))
+    tareas = []
+    with open(entrada, 'r', encoding='utf-8-sig', newline='') as f:
+        for fila in csv.DictReader(f):
+            tarea = {k: v for k, v in fila.items() if v not in (None, '')}
+            if not os.path.isabs(tarea['fichero']):
+                tarea['fichero'] = os.path.join(base, tarea['fichero'])
+            tareas.append(tarea)
+    return tareas
+
+
+def simular_cliente(tarea):
+    """
+    Trabajo de un proceso: carga el cliente y simula cada opción de batería.
+    Nunca lanza excepciones: los fallos se devuelven como filas con Estado = 'error'.
+    """
+    inicio = time.perf_counter()
+    fichero = tarea['fichero']
+    try:
+        nombre, meses, opciones_cliente = cargar_cliente(fichero, tarea['precio_venta_excedente'])
+        nombre = tarea.get('cliente', nombre)
+        sector = tarea.get('sector') or opciones_cliente.get('sector', tarea['sector_defecto'])
+
+        if 'cap_bat' in tarea or 'cap_bat' in opciones_cliente:
+            opciones = [(float(tarea.get('cap_bat', opciones_cliente.get('cap_bat'))),
+                         float(tarea.get('pot_bat', opciones_cliente.get('pot_bat', 50))))]
+        else:
+            opciones = tarea['opciones']
+
+        filas = []
+        for cap_bat, pot_bat in opciones:
+            ahorro = sum(simular_mes(mes, cap_bat, pot_bat, tarea['eficiencia'], sector, tarea['estrategia'])['ahorro']
+                         for mes in meses)
+            ahorro_anual = ahorro * 12 / len(meses)
+            inversion = float(tarea.get('inversion', opciones_cliente.get('inversion',
+                              cap_bat * tarea['coste_kwh'] + pot_bat * tarea['coste_kw'])))
+            filas.append({
+                'Cliente': nombre,
+                'Fichero': os.path.basename(fichero),
+                'Capacidad_kWh': cap_bat,
+                'Potencia_kW': pot_bat,
+                'Meses': len(meses),
+                'Ahorro_Periodo_Eur': round(ahorro, 2),
+                'Ahorro_Anual_Eur': round(ahorro_anual, 2),
+                'Inversion_Eur': round(inversion, 2),
+                'Retorno_Anios': round(inversion / ahorro_anual, 2) if ahorro_anual > 0 else 999,
+                'Estado': 'ok',
+                'Error': '',
+            })
+    except Exception as error:
+        filas = [{
+            'Cliente': tarea.get('cliente', os.path.splitext(os.path.basename(fichero))[0]),
+            'Fichero': os.path.basename(fichero),
+            'Estado': 'error',
+            'Error': f"{type(error).__name__}: {error}",
+            'Traza': traceback.format_exc(limit=3),
+        }]
+
+    duracion = round(time.perf_counter() - inicio, 3)
+    for fila in filas:
+        fila['Tiempo_s'] = duracion
+    return filas
+
+
+def ejecutar_cartera(entrada, salida_csv, salida_excel=None, opciones=((100, 50),), eficiencia=0.90,
+                     sector=SECTOR_POR_DEFECTO, estrategia='heuristica', coste_kwh=300, coste_kw=0,
+                     precio_venta_excedente=0.10, procesos=None):
+    """
+    Simula toda la cartera en paralelo (ProcessPoolExecutor, un proceso por núcleo por defecto)
+    y escribe cada cliente en el CSV (y opcionalmente en un .xlsx) en cuanto termina.
+    Devuelve (n_ok, n_error).
+    """
+    tareas = listar_clientes(entrada)
+    comunes = {
+        'opciones': [tuple(o) for o in opciones],
+        'eficiencia': eficiencia,
+        'sector_defecto': sector,
+        'estrategia': estrategia,
+        'coste_kwh': coste_kwh,
+        'coste_kw': coste_kw,
+        'precio_venta_excedente': precio_venta_excedente,
+    }
+    for tarea in tareas:
+        for clave, valor in comunes.items():
+            tarea.setdefault(clave, valor)
+
+    procesos = procesos or os.cpu_count() or 1
+    print(f"\n--- CARTERA: {len(tareas)} clientes | {len(opciones)} opciones de batería | {procesos} procesos ---")
+
+    directorio = os.path.dirname(os.path.abspath(salida_csv))
+    os.makedirs(directorio, exist_ok=True)
+
+    n_ok = n_error = 0
+    filas_excel = [] if salida_excel else None
+    inicio = time.perf_counter()
+
+    def filas_cartera(f_csv):
+        # Genera las filas según van terminando los clientes; escribir_csv ya ha puesto la
+        # cabecera al pedir la primera y cada cliente queda en disco antes de esperar al siguiente
+        nonlocal n_ok, n_error
+        f_csv.flush()
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = {pool.submit(simular_cliente, tarea): tarea for tarea in tareas}
+            for futuro in as_completed(futuros):
+                tarea = futuros[futuro]
+                try:
+                    filas = futuro.result()
+                except Exception as error:  # p.ej. proceso caído (BrokenProcessPool)
+                    filas = [{'Cliente': os.path.basename(tarea['fichero']), 'Fichero': os.path.basename(tarea['fichero']),
+                              'Estado': 'error', 'Error': f"{type(error).__name__}: {error}"}]
+
+                for fila in filas:
+                    valores = [fila.get(c, '') for c in CAMPOS_SALIDA]
+                    if filas_excel is not None:
+                        filas_excel.append(valores)
+                    yield valores
+                f_csv.flush()
+
+                if filas[0]['Estado'] == 'ok':
+                    n_ok += 1
+                else:
+                    n_error += 1
+                    print(f"[ERROR] {filas[0]['Cliente']}: {filas[0]['Error']}")
+                hechos = n_ok + n_error
+                if hechos % 10 == 0 or hechos == len(tareas):
+                    print(f"[INFO] {hechos}/{len(tareas)} clientes ({time.perf_counter() - inicio:.1f} s)")
+
+    with open(salida_csv, 'w', encoding='utf-8', newline='') as f_csv:
+        escribir_csv(f_csv, CAMPOS_SALIDA, filas_cartera(f_csv))
+
+    if salida_excel:
+        # Una fila por cliente y opción: se guardan en memoria y la hoja se escribe al final
+        exportar(salida_excel, [('Cartera', CAMPOS_SALIDA, filas_excel)])
+
+    print("-" * 60)
+    print(f"Clientes OK: {n_ok} | Con error: {n_error} | Tiempo total: {time.perf_counter() - inicio:.1f} s")
+    print(f"[INFO] Resultados en: {salida_csv}" + (f" y {salida_excel}" if salida_excel else ""))
+    return n_ok, n_error
+
+
+def lista_numeros(texto):
+    return [float(x) for x in texto.split(',') if x.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulación por lotes de una cartera de clientes")
+    parser.add_argument('entrada', help="Directorio con ficheros .json/.csv de clientes o manifiesto .csv")
+    parser.add_argument('--salida', default=os.path.join('resultados', 'cartera.csv'), help="CSV consolidado")
+    parser.add_argument('--excel', help="Ruta .xlsx opcional con los mismos resultados")
+    parser.add_argument('--capacidades', type=lista_numeros, default=[100], help="kWh separados por comas")
+    parser.add_argument('--potencias', type=lista_numeros, default=[50], help="kW separados por comas")
+    parser.add_argument('--eficiencia', type=float, default=0.90)
+    parser.add_argument('--sector', choices=list(SECTORES), default=SECTOR_POR_DEFECTO)
+    parser.add_argument('--estrategia', choices=ESTRATEGIAS, default='heuristica')
+    parser.add_argument('--coste-kwh', type=float, default=300)
+    parser.add_argument('--coste-kw', type=float, default=0)
+    parser.add_argument('--precio-venta', type=float, default=0.10, help="Precio venta excedente si el fichero no lo trae")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos (por defecto, uno por núcleo)")
+    args = parser.parse_args()
+
+    opciones = [(c, p) for c in args.capacidades for p in args.potencias]
+    ejecutar_cartera(args.entrada, args.salida, args.excel, opciones, args.eficiencia, args.sector,
+                     args.estrategia, args.coste_kwh, args.coste_kw, args.precio_venta, args.procesos)
@@ -0,0 +1,189 @@
+import numpy as np
+
+from motor import simular_mes
+from perfiles import SECTOR_POR_DEFECTO
+
+# --- CICLO DE VIDA: DEGRADACIÓN, VAN, TIR, LCOS Y RETORNO DESCONTADO ---
+# Simula la instalación año a año. La capacidad útil cae por calendario y por ciclos; los
+# ciclos se cuentan con rainflow sobre la traza de SOC que ya devuelve el motor y cada ciclo
+# consume vida según su profundidad (curva de Wöhler N(DoD) = N100 * DoD^-k).
+# Los perfiles sintéticos salen de la caché de plantillas y el despacho de cada mes solo se
+# vuelve a simular cuando la capacidad degradada queda por debajo de la 'capacidad_necesaria'
+# del despacho anterior (si no, la traza sería idéntica y se reutiliza).
+
+ANIOS_POR_DEFECTO = 15
+CICLOS_VIDA_100_DOD = 6000      # Ciclos completos (100% DoD) hasta fin de vida, química LFP
+EXPONENTE_DOD = 1.3             # Ciclos menos profundos desgastan menos que proporcionalmente
+SALUD_FIN_VIDA = 0.80           # Fin de vida convencional: 80% de la capacidad nominal
+DEGRADACION_CALENDARIO = 0.01   # Pérdida de capacidad por año aunque no se use
+COSTE_INVERSOR_KW = 80          # €/kW de la sustitución del inversor
+RETORNO_SIN_AHORRO = 999
+
+
+def puntos_de_giro(serie):
+    """Reduce una serie a sus extremos locales (quita mesetas y tramos monótonos intermedios)."""
+    x = np.asarray(serie, dtype=float)
+    if len(x) < 2:
+        return x
+    x = np.concatenate(([x[0]], x[1:][np.diff(x) != 0]))
+    if len(x) < 3:
+        return x
+    pendiente = np.sign(np.diff(x))
+    giro = pendiente[1:] != pendiente[:-1]
+    return np.concatenate(([x[0]], x[1:-1][giro], [x[-1]]))
+
+
+def rainflow(serie):
+    """
+    Conteo rainflow (regla de los 4 puntos) vectorizado.
+    En cada pasada se extraen a la vez todos los ciclos cerrados b-c de ventanas a-b-c-d
+    con |b-c| <= |a-b| y |b-c| <= |c-d| que no se solapan; se repite hasta que no quedan.
+    Lo que sobra son semiciclos.
+    Devuelve (rangos, cuentas): amplitud pico a pico de cada ciclo y su peso (1 o 0.5).
+    """
+    p = puntos_de_giro(serie)
+    rangos = []
+    while len(p) >= 4:
+        r = np.abs(np.diff(p))
+        cerrado = np.zeros(len(r), dtype=bool)
+        cerrado[1:-1] = (r[1:-1] <= r[:-2]) & (r[1:-1] <= r[2:])
+        # Ventanas independientes: el ciclo i usa los puntos i-1..i+2, así que descartamos
+        # los candidatos con otro candidato en las dos posiciones anteriores (salen en otra pasada)
+        previo = np.zeros(len(r), dtype=bool)
+        previo[1:] |= cerrado[:-1]
+        previo[2:] |= cerrado[:-2]
+        cerrado &= ~previo
+        if not cerrado.any():
+            break
+        indices = np.nonzero(cerrado)[0]
+        rangos.append(r[indices])
+        quitar = np.zeros(len(p), dtype=bool)
+        quitar[indices] = True
+        quitar[indices + 1] = True
+        p = p[~quitar]
+
+    completos = np.concatenate(rangos) if rangos else np.empty(0)
+    semiciclos = np.abs(np.diff(p))
+    return (np.concatenate((completos, semiciclos)),
+            np.concatenate((np.ones(len(completos)), np.full(len(semiciclos), 0.5))))
+
+
+def desgaste_ciclos(rangos_kwh, cuentas, capacidad_kwh):
+    """Fracción de capacidad perdida por los ciclos: sum(cuenta * (1 - SALUD_FIN_VIDA) / N(DoD))."""
+    if capacidad_kwh <= 0 or len(rangos_kwh) == 0:
+        return 0.0
+    dod = np.clip(np.asarray(rangos_kwh) / capacidad_kwh, 0.0, 1.0)
+    return float(np.sum(cuentas * (1 - SALUD_FIN_VIDA) * dod ** EXPONENTE_DOD / CICLOS_VIDA_100_DOD))
+
+
+def tir(flujos):
+    """Tasa interna de retorno (raíces del polinomio del VAN en x = 1/(1+r)); NaN si no existe."""
+    flujos = np.asarray(flujos, dtype=float)
+    raices = np.roots(flujos[::-1])
+    reales = raices[(np.abs(raices.imag) < 1e-9) & (raices.real > 0)].real
+    if len(reales) == 0:
+        return float('nan')
+    tasas = 1 / reales - 1
+    return float(tasas[np.argmin(np.abs(tasas))])
+
+
+def retorno_descontado(flujos, tasa_descuento):
+    """Años hasta que el flujo descontado acumulado pasa a positivo (interpolado dentro del año)."""
+    descontados = np.asarray(flujos, dtype=float) / (1 + tasa_descuento) ** np.arange(len(flujos))
+    acumulado = np.cumsum(descontados)
+    positivos = np.nonzero(acumulado >= 0)[0]
+    if len(positivos) == 0 or positivos[0] == 0:
+        return RETORNO_SIN_AHORRO if len(positivos) == 0 else 0.0
+    anio = positivos[0]
+    return float(anio - 1 + (-acumulado[anio - 1]) / descontados[anio])
+
+
+def ciclo_vida(datos_facturas, anios=ANIOS_POR_DEFECTO, cap_bat=100, pot_bat=50, eficiencia=0.90,
+               sector=SECTOR_POR_DEFECTO, estrategia='heuristica', inversion=30000, tasa_descuento=0.05,
+               escalado_precios=0.02, coste_om_pct=0.01, anio_cambio_inversor=10, coste_cambio_inversor=None):
+    """
+    Flujo de caja de la instalación durante `anios` años con degradación de la batería.
+
+    Cada año: capacidad útil = cap_bat * salud; ahorro y energía descargada de los meses de
+    factura extrapolados a 12 meses; el ahorro se escala con escalado_precios (subida anual de
+    la energía). Costes: O&M anual (coste_om_pct de la inversión) y sustitución del inversor
+    en anio_cambio_inversor (por defecto pot_bat * COSTE_INVERSOR_KW).
+    La salud del año siguiente resta el desgaste por ciclos (rainflow del SOC) y el de calendario.
+
+    LCOS = costes descontados / energía descargada descontada (€/kWh, sin el coste de la energía cargada).
+    Devuelve un dict con la tabla por año ('anios'), 'van', 'tir', 'lcos', 'retorno_descontado',
+    'retorno_simple', 'anio_fin_vida' y 'redespachos' (meses re-simulados / meses-año totales).
+    """
+    if coste_cambio_inversor is None:
+        coste_cambio_inversor = pot_bat * COSTE_INVERSOR_KW
+    factor_anual = 12 / len(datos_facturas)
+    ultimo = [None] * len(datos_facturas)  # Último despacho simulado de cada mes
+    redespachos = 0
+
+    salud = 1.0
+    anio_fin_vida = None
+    tabla = []
+    flujos = [-float(inversion)]
+    descarga_anual = [0.0]
+    costes = [float(inversion)]
+    for anio in range(1, anios + 1):
+        capacidad = cap_bat * salud
+        ahorro = descarga = desgaste = ciclos_equivalentes = 0.0
+        for i, mes in enumerate(datos_facturas):
+            if ultimo[i] is None or capacidad < ultimo[i]['capacidad_necesaria'] - 1e-9:
+                resultado = simular_mes(mes, capacidad, pot_bat, eficiencia, sector, estrategia)['resultado']
+                rangos, cuentas = rainflow(resultado['soc'])
+                ultimo[i] = {
+                    'ahorro': resultado['ahorro_total'],
+                    'descarga_kwh': resultado['descarga_kwh'],
+                    'capacidad_necesaria': resultado['capacidad_necesaria'],
+                    'rangos': rangos,
+                    'cuentas': cuentas,
+                }
+                redespachos += 1
+            mes_sim = ultimo[i]
+            ahorro += mes_sim['ahorro']
+            descarga += mes_sim['descarga_kwh']
+            desgaste += desgaste_ciclos(mes_sim['rangos'], mes_sim['cuentas'], capacidad)
+            ciclos_equivalentes += float(np.sum(mes_sim['cuentas'] * mes_sim['rangos'])) / capacidad if capacidad > 0 else 0.0
+
+        ahorro_anio = ahorro * factor_anual * (1 + escalado_precios) ** (anio - 1)
+        coste_anio = coste_om_pct * inversion + (coste_cambio_inversor if anio == anio_cambio_inversor else 0.0)
+        flujos.append(ahorro_anio - coste_anio)
+        costes.append(coste_anio)
+        descarga_anual.append(descarga * factor_anual)
+        tabla.append({
+            'Anio': anio,
+            'Salud_Pct': round(100 * salud, 1),
+            'Capacidad_kWh': round(capacidad, 1),
+            'Ciclos_Equivalentes': round(ciclos_equivalentes * factor_anual, 1),
+            'Ahorro_Eur': round(ahorro_anio, 2),
+            'Costes_Eur': round(coste_anio, 2),
+            'Flujo_Eur': round(flujos[-1], 2),
+        })
+
+        salud = max(salud - desgaste * factor_anual - DEGRADACION_CALENDARIO, 0.0)
+        if anio_fin_vida is None and salud < SALUD_FIN_VIDA:
+            anio_fin_vida = anio
+
+    flujos = np.array(flujos)
+    descuento = (1 + tasa_descuento) ** np.arange(len(flujos))
+    acumulado = np.cumsum(flujos / descuento)
+    for fila, valor in zip(tabla, acumulado[1:]):
+        fila['Flujo_Desc_Acum_Eur'] = round(float(valor), 2)
+    energia_descontada = float(np.sum(np.array(descarga_anual) / descuento))
+    ahorro_primer_anio = flujos[1] + costes[1]
+
+    return {
+        'anios': tabla,
+        'flujos': flujos,
+        'van': float(acumulado[-1]),
+        'tir': tir(flujos),
+        'lcos': float(np.sum(np.array(costes) / descuento)) / energia_descontada if energia_descontada > 0 else float('inf'),
+        'retorno_descontado': retorno_descontado(flujos, tasa_descuento),
+        'retorno_simple': float(inversion / ahorro_primer_anio) if ahorro_primer_anio > 0 else RETORNO_SIN_AHORRO,
+        'anio_fin_vida': anio_fin_vida,
+        'salud_final': salud,
+        'redespachos': redespachos,
+        'meses_simulables': anios * len(datos_facturas),
+    }
@@ -0,0 +1,80 @@
+import numpy as np
+import time
+import argparse
+
+from motor import simular_despacho, simular_mes
+from tarifas import precios_dos_tramos
+from perfiles import perfil_mensual, SECTORES, SECTOR_POR_DEFECTO
+from datos_cliente import datos_reales_cliente
+
+PASOS_POR_HORA = 4          # Resolución cuarto-horaria (liquidación a 15 minutos)
+HORAS_PASO = 1 / PASOS_POR_HORA  # 0.25 h por paso
+
+def simular_cuartohorario(datos_facturas, cap_bat=100, pot_bat=50, eficiencia=0.90, sector=SECTOR_POR_DEFECTO):
+    """
+    Simulación Solar + Arbitraje a resolución de 15 minutos (96 pasos/día): el mismo
+    simular_mes que usa arbitraje-y-solar.py --pasos-por-hora 4, con la potencia del inversor
+    limitada a pot_bat * 0.25 kWh por paso.
+    """
+    print(f"\n--- SIMULACIÓN CUARTO-HORARIA: SOLAR + ARBITRAJE ---")
+    print(f"Batería: {cap_bat} kWh | Potencia: {pot_bat} kW ({pot_bat * HORAS_PASO:.1f} kWh/paso) | Eficiencia: {int(eficiencia*100)}%")
+    print("-" * 60)
+
+    resultados_mes = []
+    ahorro_total = 0
+
+    for mes in datos_facturas:
+        res_mes = simular_mes(mes, cap_bat, pot_bat, eficiencia, sector, pasos_por_hora=PASOS_POR_HORA)
+        resultados_mes.append((mes['mes'], len(res_mes['consumo_kwh']), res_mes['ahorro']))
+        ahorro_total += res_mes['ahorro']
+
+    print(f"{'Mes':<10}{'Pasos':>8}{'Ahorro (€)':>14}")
+    for nombre, pasos, ahorro in resultados_mes:
+        print(f"{nombre:<10}{pasos:>8}{ahorro:>14.2f}")
+    print("-" * 60)
+    print(f"AHORRO TOTAL ({len(datos_facturas)} meses): {ahorro_total:,.2f} €")
+
+    proyeccion = ahorro_total * 12 / len(datos_facturas)
+    roi_years = 30000 / proyeccion if proyeccion > 0 else 999
+    print(f"PROYECCIÓN AHORRO ANUAL:       {proyeccion:,.2f} €")
+    print(f"Retorno Inversión (Est. 30k€):   {roi_years:.1f} años")
+    print("-" * 60)
+    return ahorro_total
+
+def simular_anio_completo(datos_facturas, cap_bat=100, pot_bat=50, eficiencia=0.90, sector=SECTOR_POR_DEFECTO):
+    """
+    Año completo de 35.040 cuartos de hora en un único recorrido del motor,
+    usando el consumo/excedente medio de las facturas. Mide el tiempo de cálculo.
+    """
+    n_meses = len(datos_facturas)
+    consumo_anual = sum(m['consumo_total_kwh'] for m in datos_facturas) * 12 / n_meses
+    excedente_anual = sum(m['excedente_total_kwh'] for m in datos_facturas) * 12 / n_meses
+    precio_valle = np.mean([m['precio_valle'] for m in datos_facturas])
+    precio_punta = np.mean([m['precio_punta'] for m in datos_facturas])
+
+    inicio = time.perf_counter()
+    hora_dia, consumo_kwh, solar_kwh = perfil_mensual(consumo_anual, excedente_anual, 365, PASOS_POR_HORA, sector)
+    precio_compra, es_valle, precio_punta = precios_dos_tramos(hora_dia, precio_valle, precio_punta)
+    resultado = simular_despacho(
+        consumo_kwh, solar_kwh, precio_compra, es_valle,
+        cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+        precio_venta_excedente=datos_facturas[0]['precio_venta_excedente'],
+        precio_punta=precio_punta, horas_paso=HORAS_PASO
+    )
+    duracion = time.perf_counter() - inicio
+
+    print(f"\n--- AÑO COMPLETO CUARTO-HORARIO ({len(consumo_kwh)} pasos) ---")
+    print(f"Ahorro anual estimado: {resultado['ahorro_total']:,.2f} €")
+    print(f"Tiempo de cálculo:     {duracion * 1000:.0f} ms ({len(consumo_kwh) / duracion:,.0f} pasos/s)")
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulación cuarto-horaria (15 min) Solar + Arbitraje")
+    parser.add_argument('--sector', choices=list(SECTORES), default=SECTOR_POR_DEFECTO,
+                        help="Plantilla de consumo del perfil sintético")
+    parser.add_argument('--anual', action='store_true', help="Simula además un año completo (35.040 pasos)")
+    args = parser.parse_args()
+
+    simular_cuartohorario(datos_reales_cliente, sector=args.sector)
+    if args.anual:
+        simular_anio_completo(datos_reales_cliente, sector=args.sector)
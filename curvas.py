@@ -0,0 +1,301 @@
+import os
+import csv
+import json
+import numpy as np
+
+# --- CARGA DE CURVAS DE CARGA REALES (DATADIS / DISTRIBUIDORA) ---
+# Lee curvas horarias o cuarto-horarias de consumo y vertido desde CSV o Excel (.xlsx),
+# por bloques, directamente a arrays float32 alineados a una rejilla temporal regular.
+# El resultado se guarda junto al fichero original como .npy mapeables en memoria,
+# de modo que volver a abrirlo (p.ej. en cada rerun de Streamlit) cuesta milisegundos.
+# pandas solo hace falta para parsear y se importa dentro de esos helpers: abrir una curva
+# ya cacheada (o usar hora_de_marcas) no paga su importación.
+
+VERSION_CACHE = 1
+TAMANO_BLOQUE = 200_000  # Filas por bloque al parsear
+
+# Nombres de columna reconocidos (en minúsculas, sin espacios extremos)
+COLUMNAS_CUPS = ('cups', 'contador', 'punto de suministro')
+COLUMNAS_FECHA_HORA = ('fecha_hora', 'fechahora', 'timestamp', 'datetime', 'fecha y hora')
+COLUMNAS_FECHA = ('fecha', 'date', 'dia')
+COLUMNAS_HORA = ('hora', 'hour', 'periodo horario')
+COLUMNAS_CONSUMO = ('consumo_kwh', 'consumo', 'ae_kwh', 'ae', 'energia_consumida_kwh', 'consumo (kwh)')
+COLUMNAS_VERTIDO = ('energia_vertida_kwh', 'vertido_kwh', 'vertido', 'excedente_kwh', 'excedente',
+                    'as_kwh', 'as', 'energia_vertida', 'excedente (kwh)')
+
+
+def buscar_columna(columnas, candidatos):
+    """Devuelve el nombre original de la primera columna que coincide con un candidato."""
+    normalizadas = {str(c).strip().lower(): c for c in columnas}
+    for candidato in candidatos:
+        if candidato in normalizadas:
+            return normalizadas[candidato]
+    return None
+
+
+def _rutas_cache(ruta):
+    base = ruta + '.curva'
+    return {
+        'dir': base,
+        'meta': os.path.join(base, 'meta.json'),
+        'consumo': os.path.join(base, 'consumo.npy'),
+        'vertido': os.path.join(base, 'vertido.npy'),
+    }
+
+
+def _firma_origen(ruta):
+    estado = os.stat(ruta)
+    return {'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns, 'version': VERSION_CACHE}
+
+
+def _detectar_columnas(cabecera, ruta):
+    columnas = {
+        'cups': buscar_columna(cabecera, COLUMNAS_CUPS),
+        'fecha_hora': buscar_columna(cabecera, COLUMNAS_FECHA_HORA),
+        'fecha': buscar_columna(cabecera, COLUMNAS_FECHA),
+        'hora': buscar_columna(cabecera, COLUMNAS_HORA),
+        'consumo': buscar_columna(cabecera, COLUMNAS_CONSUMO),
+        'vertido': buscar_columna(cabecera, COLUMNAS_VERTIDO),
+    }
+    if columnas['consumo'] is None:
+        raise ValueError(f"No se encuentra la columna de consumo en {ruta}: {list(cabecera)}")
+    if columnas['fecha_hora'] is None and (columnas['fecha'] is None or columnas['hora'] is None):
+        raise ValueError(f"No se encuentran las columnas de fecha/hora en {ruta}: {list(cabecera)}")
+    return columnas
+
+
+def _a_fechas(serie):
+    """Parsea fechas 'dd/mm/aaaa' (o 'aaaa/mm/dd', ISO, datetime de Excel) a un Series datetime."""
+    import pandas as pd
+    if pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+        primera = str(serie.iloc[0]).strip() if len(serie) else ''
+        dia_primero = not (len(primera) >= 4 and primera[:4].isdigit())
+        return pd.to_datetime(serie, dayfirst=dia_primero)
+    return pd.to_datetime(serie)
+
+
+def minutos_bloque(bloque, columnas):
+    """
+    Convierte las columnas de fecha/hora de un bloque a minutos desde epoch (int64).
+    Devuelve también el minuto del día tal y como viene etiquetado (None si hay marca completa),
+    para decidir después si las marcas son de fin de intervalo (estilo Datadis: Hora 1..24, '24:00').
+    """
+    import pandas as pd
+    if columnas['fecha_hora'] is not None:
+        marcas = _a_fechas(bloque[columnas['fecha_hora']])
+        return marcas.to_numpy('datetime64[m]').astype(np.int64), None
+
+    fechas = _a_fechas(bloque[columnas['fecha']]).to_numpy('datetime64[D]')
+    fechas = fechas.astype('datetime64[m]').astype(np.int64)
+    horas = bloque[columnas['hora']]
+    if pd.api.types.is_numeric_dtype(horas):
+        minuto_dia = horas.to_numpy(np.int64) * 60
+    else:
+        partes = horas.astype(str).str.strip().str.split(':', n=2, expand=True)
+        minuto_dia = partes[0].astype(np.int64).to_numpy() * 60
+        if partes.shape[1] > 1:
+            minuto_dia = minuto_dia + partes[1].fillna('0').astype(np.int64).to_numpy()
+    return fechas + minuto_dia, minuto_dia
+
+
+def _valores(bloque, columna):
+    import pandas as pd
+    if columna is None:
+        return np.zeros(len(bloque), dtype=np.float32)
+    serie = bloque[columna]
+    if serie.dtype == object:
+        serie = pd.to_numeric(serie.astype(str).str.replace(',', '.', regex=False), errors='coerce')
+    return serie.to_numpy(np.float32)
+
+
+def _bloques_csv(ruta, tamano_bloque):
+    """Generador de bloques de un CSV: detecta separador/decimal y lee los kWh directamente como float32."""
+    import pandas as pd
+
+    with open(ruta, 'r', encoding='utf-8-sig', errors='replace') as f:
+        muestra = f.read(4096)
+    try:
+        separador = csv.Sniffer().sniff(muestra, delimiters=';,\t').delimiter
+    except csv.Error:
+        separador = ','
+    decimal = ',' if separador == ';' else '.'
+
+    cabecera = pd.read_csv(ruta, sep=separador, nrows=0, encoding='utf-8-sig').columns
+    columnas = _detectar_columnas(cabecera, ruta)
+    usadas = [c for c in columnas.values() if c is not None]
+    tipos = {columnas[k]: np.float32 for k in ('consumo', 'vertido') if columnas[k] is not None}
+    if columnas['cups'] is not None:
+        tipos[columnas['cups']] = str
+
+    lector = pd.read_csv(ruta, sep=separador, decimal=decimal, chunksize=tamano_bloque,
+                         encoding='utf-8-sig', usecols=usadas, dtype=tipos)
+    for bloque in lector:
+        yield bloque, columnas
+
+
+def _bloques_excel(ruta, tamano_bloque):
+    """Generador de bloques de un .xlsx en modo de solo lectura (openpyxl, sin cargar todo el libro)."""
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[0]
+        filas = hoja.iter_rows(values_only=True)
+        cabecera = [str(c).strip() if c is not None else '' for c in next(filas)]
+        columnas = _detectar_columnas(cabecera, ruta)
+        buffer = []
+        for fila in filas:
+            if fila is None or all(v is None for v in fila):
+                continue
+            buffer.append(fila[:len(cabecera)])
+            if len(buffer) >= tamano_bloque:
+                yield pd.DataFrame(buffer, columns=cabecera), columnas
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=cabecera), columnas
+    finally:
+        libro.close()
+
+
+def _parsear(ruta, tamano_bloque):
+    """Parsea el fichero por bloques y devuelve la curva alineada a una rejilla regular."""
+    extension = os.path.splitext(ruta)[1].lower()
+    bloques = _bloques_excel(ruta, tamano_bloque) if extension in ('.xlsx', '.xlsm') else _bloques_csv(ruta, tamano_bloque)
+
+    lista_minutos, lista_cups, lista_consumo, lista_vertido = [], [], [], []
+    minuto_dia_min, minuto_dia_max = None, None
+    for bloque, columnas in bloques:
+        minutos, minuto_dia = minutos_bloque(bloque, columnas)
+        if minuto_dia is not None and len(minuto_dia):
+            minuto_dia_min = min(int(minuto_dia.min()), minuto_dia_min if minuto_dia_min is not None else 1440)
+            minuto_dia_max = max(int(minuto_dia.max()), minuto_dia_max if minuto_dia_max is not None else 0)
+        lista_minutos.append(minutos)
+        lista_consumo.append(_valores(bloque, columnas['consumo']))
+        lista_vertido.append(_valores(bloque, columnas['vertido']))
+        if columnas['cups'] is not None:
+            lista_cups.append(bloque[columnas['cups']].astype(str).str.strip().to_numpy())
+
+    if not lista_minutos:
+        raise ValueError(f"El fichero {ruta} no contiene datos")
+
+    minutos = np.concatenate(lista_minutos)
+    consumo = np.concatenate(lista_consumo)
+    vertido = np.concatenate(lista_vertido)
+    if lista_cups:
+        contadores, id_contador = np.unique(np.concatenate(lista_cups), return_inverse=True)
+    else:
+        contadores, id_contador = np.array(['']), np.zeros(len(minutos), dtype=np.int64)
+
+    # Resolución: mínimo salto entre minutos del día distintos (60 horario, 15 cuarto-horario)
+    saltos = np.diff(np.unique(minutos % 1440))
+    minutos_paso = int(saltos.min()) if len(saltos) else 60
+    if minutos_paso not in (15, 30, 60):
+        minutos_paso = 60 if minutos_paso > 30 else 15
+
+    # Marcas de fin de intervalo (Hora 1..24, '00:15'..'24:00') -> inicio del intervalo
+    if minuto_dia_min is not None and (minuto_dia_min > 0 or minuto_dia_max >= 1440):
+        minutos = minutos - minutos_paso
+
+    inicio = int(minutos.min())
+    n_pasos = int((minutos.max() - inicio) // minutos_paso) + 1
+    posicion = (minutos - inicio) // minutos_paso
+
+    # Rejilla (contadores x pasos); los huecos quedan como NaN. Duplicados (cambio de hora) se suman.
+    forma = (len(contadores), n_pasos)
+    consumo_rejilla = np.full(forma, np.nan, dtype=np.float32)
+    vertido_rejilla = np.full(forma, np.nan, dtype=np.float32)
+    plano = id_contador * n_pasos + posicion
+    for destino, origen in ((consumo_rejilla, consumo), (vertido_rejilla, vertido)):
+        vista = destino.reshape(-1)
+        vista[plano] = 0.0
+        np.add.at(vista, plano, np.nan_to_num(origen))
+
+    meta = {
+        'inicio_min': inicio,
+        'minutos_paso': minutos_paso,
+        'n_pasos': n_pasos,
+        'contadores': [str(c) for c in contadores],
+    }
+    return meta, consumo_rejilla, vertido_rejilla
+
+
+def _construir_curva(meta, consumo, vertido):
+    inicio = np.datetime64(meta['inicio_min'], 'm')
+    return {
+        'tiempo': inicio + np.arange(meta['n_pasos']) * np.timedelta64(meta['minutos_paso'], 'm'),
+        'contadores': meta['contadores'],
+        'consumo': consumo,
+        'vertido': vertido,
+        'pasos_por_hora': 60 // meta['minutos_paso'],
+        'horas_paso': meta['minutos_paso'] / 60,
+    }
+
+
+def cargar_curva(ruta, tamano_bloque=TAMANO_BLOQUE, usar_cache=True):
+    """
+    Carga una curva de consumo/vertido horaria o cuarto-horaria (CSV de Datadis/distribuidora o .xlsx).
+
+    Devuelve un dict con:
+      'tiempo'          -> datetime64[m] de inicio de cada paso (rejilla regular)
+      'contadores'      -> lista de CUPS presentes en el fichero
+      'consumo'/'vertido' -> float32 de forma (n_contadores, n_pasos), kWh por paso (NaN = hueco)
+      'pasos_por_hora'/'horas_paso'
+
+    La primera lectura guarda una caché en '<ruta>.curva/' (.npy + meta.json); las siguientes
+    la abren con mmap sin volver a parsear mientras el fichero original no cambie.
+    """
+    rutas = _rutas_cache(ruta)
+    firma = _firma_origen(ruta)
+
+    if usar_cache and os.path.exists(rutas['meta']):
+        with open(rutas['meta'], 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('origen') == firma:
+            consumo = np.load(rutas['consumo'], mmap_mode='r')
+            vertido = np.load(rutas['vertido'], mmap_mode='r')
+            return _construir_curva(meta, consumo, vertido)
+
+    meta, consumo, vertido = _parsear(ruta, tamano_bloque)
+    meta['origen'] = firma
+
+    if usar_cache:
+        os.makedirs(rutas['dir'], exist_ok=True)
+        np.save(rutas['consumo'], consumo)
+        np.save(rutas['vertido'], vertido)
+        with open(rutas['meta'], 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        consumo = np.load(rutas['consumo'], mmap_mode='r')
+        vertido = np.load(rutas['vertido'], mmap_mode='r')
+
+    return _construir_curva(meta, consumo, vertido)
+
+
+def hora_de_marcas(tiempo):
+    """Hora del día (float, 0-24) de cada marca datetime64."""
+    return (tiempo - tiempo.astype('datetime64[D]')).astype('timedelta64[m]').astype(np.int64) / 60
+
+
+def curva_por_meses(curva, contador=0):
+    """
+    Trocea la curva de un contador por meses naturales.
+    Devuelve una lista de dicts {'mes', 'tiempo', 'consumo_kwh', 'vertido_kwh'} con arrays float
+    listos para el motor (los huecos se rellenan con 0).
+    """
+    tiempo = curva['tiempo']
+    consumo = np.nan_to_num(np.asarray(curva['consumo'][contador], dtype=float))
+    vertido = np.nan_to_num(np.asarray(curva['vertido'][contador], dtype=float))
+
+    meses = tiempo.astype('datetime64[M]')
+    cortes = np.flatnonzero(meses[1:] != meses[:-1]) + 1
+    limites = np.concatenate(([0], cortes, [len(tiempo)]))
+
+    trozos = []
+    for a, b in zip(limites[:-1], limites[1:]):
+        trozos.append({
+            'mes': str(meses[a]),
+            'tiempo': tiempo[a:b],
+            'consumo_kwh': consumo[a:b],
+            'vertido_kwh': vertido[a:b],
+        })
+    return trozos
@@ -0,0 +1,37 @@
+# --- DATOS REALES DE LAS FACTURAS ---
+# Meses de factura del cliente (cargados a mano de los PDF) compartidos por los scripts de
+# consola (arbitraje-y-solar.py, cuarto-horarias.py) y benchmark.py.
+datos_reales_cliente = [
+    {
+        'mes': 'Mar-Abr', # Factura Primavera (Excedente alto, consumo bajo)
+        'consumo_total_kwh': 2955, 
+        'excedente_total_kwh': 1940,
+        'precio_valle': 0.092,  # P6 Real
+        'precio_punta': 0.129,  # P4 (Punta relativa)
+        'precio_venta_excedente': 0.10
+    },
+    {
+        'mes': 'Abr-May', 
+        'consumo_total_kwh': 3397, 
+        'excedente_total_kwh': 1708,
+        'precio_valle': 0.092, # Asumimos similar anterior
+        'precio_punta': 0.130, 
+        'precio_venta_excedente': 0.10
+    },
+    {
+        'mes': 'May-Jun', # Empieza el calor
+        'consumo_total_kwh': 5891, 
+        'excedente_total_kwh': 1352,
+        'precio_valle': 0.130, # P6 (Sube precio)
+        'precio_punta': 0.172, # P3
+        'precio_venta_excedente': 0.10
+    },
+    {
+        'mes': 'Jun-Jul', # Verano a tope
+        'consumo_total_kwh': 6563, 
+        'excedente_total_kwh': 1399,
+        'precio_valle': 0.131, # P6 Caro
+        'precio_punta': 0.180, # P1 Muy caro
+        'precio_venta_excedente': 0.10
+    }
+]
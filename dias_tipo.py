@@ -0,0 +1,304 @@
+import time
+
+import numpy as np
+
+from motor import simular_despacho, simular_despacho_lote
+from curvas import hora_de_marcas
+from tarifas import precios_curva, precios_dos_tramos
+
+# --- COTIZACIÓN RÁPIDA CON DÍAS TIPO ---
+# Para presupuestar delante del cliente no hace falta simular cada hora de varios años:
+# los días se agrupan con k-means sobre sus vectores de consumo, solar y precio, se simula
+# solo el día real más cercano a cada centroide (con su peso = nº de días del grupo) y el
+# ahorro total sale de recorrer los días reales en orden con la respuesta de su día tipo.
+# La batería enlaza días (el excedente solar de hoy se descarga mañana), así que cada día tipo
+# se simula desde NIVELES_SOC estados de carga iniciales, todos en una única llamada al motor por
+# lotes (una columna por día y nivel); la cadena de días interpola ahorro y SOC final en el SOC
+# con el que llega cada día.
+#
+# Con estrategia='optima' cada día tipo se resuelve con el DP de optimo.py (sin enlace: el DP
+# vacía la batería al final de cada día).
+# La cota de error sale de una muestra estratificada: unos pocos días reales de cada grupo
+# se simulan igual y se compara su ahorro con el de su día tipo. Cada día del grupo se trata
+# como un residuo independiente de esa distribución (error cuadrático medio del grupo por su
+# peso), así que la cota es la del total encadenado, no la de un día suelto. Con 'optima' la
+# cota no incluye el corte diario del DP (la muestra de validación también se resuelve día a día):
+# el DP anual arrastra carga de un día a otro y la cotización queda ~5% por debajo aunque la cota
+# salga menor.
+#
+# Con la heurística el motor exacto ya es muy rápido: en una curva de un año la cotización gana
+# poco (~1.3x horaria, ~4x cuarto-horaria: el agrupamiento y la cadena tienen un coste fijo de
+# unos ms) y solo compensa a partir de varios años; con el despacho óptimo gana 10-30x.
+# conviene_cotizacion_rapida decide si se ofrece.
+
+K_POR_DEFECTO = 12
+MUESTRAS_POR_TIPO = 2
+NIVELES_SOC = 5  # SOC de partida simulados por día tipo (0, 25%, ..., 100% de la capacidad)
+ITERACIONES_KMEANS = 25  # Suele converger antes; el error residual lo recoge la cota
+Z_95 = 1.96
+DIAS_MINIMOS_HEURISTICA = 730  # Con la heurística, modo rápido por defecto solo desde 2 años de curva
+
+
+def conviene_cotizacion_rapida(n_dias, estrategia='heuristica'):
+    """True si la cotización rápida ahorra tiempo de verdad: despacho óptimo o curvas de varios años."""
+    return estrategia == 'optima' or n_dias >= DIAS_MINIMOS_HEURISTICA
+
+
+def dias_completos(tiempo, pasos_por_hora):
+    """(inicio, n_dias): primer paso de las 00:00 y número de días completos desde ahí."""
+    tiempo = np.asarray(tiempo, dtype='datetime64[m]')
+    pasos_dia = 24 * pasos_por_hora
+    medianoche = tiempo == tiempo.astype('datetime64[D]')
+    inicio = int(np.argmax(medianoche)) if medianoche.any() else 0
+    return inicio, (len(tiempo) - inicio) // pasos_dia
+
+
+def matriz_dias(serie, inicio, n_dias, pasos_dia):
+    """Serie por paso (escalar o array) -> matriz (n_dias, pasos_dia)."""
+    serie = np.asarray(serie, dtype=float)
+    if serie.ndim == 0:
+        return np.full((n_dias, pasos_dia), float(serie))
+    return serie[inicio:inicio + n_dias * pasos_dia].reshape(n_dias, pasos_dia)
+
+
+def kmeans(datos, k, semilla=0, iteraciones=ITERACIONES_KMEANS):
+    """
+    k-means (inicialización k-means++) sobre las filas de datos.
+    Devuelve (etiquetas, centroides). Los grupos que se quedan vacíos se re-siembran con el
+    punto más alejado de su centroide.
+    """
+    rng = np.random.default_rng(semilla)
+    n = len(datos)
+    k = min(k, n)
+    centroides = [datos[rng.integers(n)]]
+    distancia = ((datos - centroides[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        probabilidad = distancia / distancia.sum() if distancia.sum() > 0 else None
+        centroides.append(datos[rng.choice(n, p=probabilidad)])
+        distancia = np.minimum(distancia, ((datos - centroides[-1]) ** 2).sum(axis=1))
+    centroides = np.array(centroides)
+
+    norma = (datos ** 2).sum(axis=1)[:, None]
+    etiquetas = np.full(n, -1)
+    for _ in range(iteraciones):
+        # ||x - c||^2 = ||x||^2 - 2 x·c + ||c||^2 (matriz n x k sin bucles)
+        distancias = norma - 2 * datos @ centroides.T + (centroides ** 2).sum(axis=1)
+        nuevas = np.argmin(distancias, axis=1)
+        if np.array_equal(nuevas, etiquetas):
+            break
+        etiquetas = nuevas
+        # Medias de todos los grupos a la vez: matriz de pertenencia (k x n) @ datos / tamaño del grupo
+        tamanos = np.bincount(etiquetas, minlength=k)
+        sumas = (etiquetas == np.arange(k)[:, None]).astype(float) @ datos
+        vacios = tamanos == 0
+        centroides = sumas / np.maximum(tamanos, 1)[:, None]
+        if vacios.any():
+            centroides[vacios] = datos[np.argmax(distancias.min(axis=1))]
+    return etiquetas, centroides
+
+
+def _simular_dias(indices, dias, niveles_soc, cap_bat, pot_bat, eficiencia, precio_venta_excedente, horas_paso,
+                  estrategia='heuristica'):
+    """
+    Respuesta de cada día indicado a su SOC de partida: (ahorro, soc_final), arrays (n_dias, n_niveles).
+    'heuristica': todos los días y niveles de niveles_soc en una sola llamada al motor por lotes
+    (una columna por pareja día-nivel).
+    'optima': despacho óptimo día a día desde batería vacía (el DP la deja vacía al final del día).
+    """
+    if estrategia == 'optima':
+        from optimo import despacho_optimo
+        ahorro = np.array([despacho_optimo(dias['consumo'][i], dias['solar'][i], dias['precio'][i], cap_bat, pot_bat,
+                                           eficiencia, precio_venta_excedente, horas_paso=horas_paso)['ahorro_total']
+                           for i in indices])
+        return ahorro[:, None], np.zeros((len(indices), 1))
+
+    n_niveles = len(niveles_soc)
+    columnas = np.repeat(indices, n_niveles)
+    entradas = {clave: matriz[columnas].T for clave, matriz in dias.items()}
+    resultado = simular_despacho_lote(entradas['consumo'], entradas['solar'], entradas['precio'], entradas['es_valle'],
+                                      cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+                                      precio_venta_excedente=precio_venta_excedente,
+                                      precio_punta=entradas['precio_punta'],
+                                      soc_inicial=np.tile(niveles_soc, len(indices)), horas_paso=horas_paso)
+    forma = (len(indices), n_niveles)
+    return resultado['ahorro_total'].reshape(forma), resultado['soc_final'].reshape(forma)
+
+
+def interpolar_niveles(soc, niveles_soc, respuesta):
+    """
+    Interpolación lineal de la respuesta por nivel (filas de `respuesta`, niveles equiespaciados
+    desde 0) en el SOC de cada fila: como np.interp fila a fila, pero vectorizada.
+    """
+    soc = np.asarray(soc, dtype=float)
+    respuesta = np.asarray(respuesta, dtype=float)
+    if len(niveles_soc) == 1:
+        return respuesta[:, 0].copy()
+    posicion = np.clip(soc / niveles_soc[1], 0, len(niveles_soc) - 1)
+    indice = np.minimum(posicion.astype(np.int64), len(niveles_soc) - 2)
+    peso = posicion - indice
+    filas = np.arange(len(respuesta))
+    return respuesta[filas, indice] * (1 - peso) + respuesta[filas, indice + 1] * peso
+
+
+def encadenar_dias(etiquetas, niveles_soc, ahorro_tipo, soc_final_tipo, soc_inicial=0.0):
+    """
+    Recorre los días reales en orden usando la respuesta de su día tipo e interpolando en el SOC
+    con el que llega cada día (niveles equiespaciados desde 0, ver interpolar_niveles).
+    Solo el SOC se encadena en el bucle (floats de Python); el ahorro se interpola después de una vez.
+    Devuelve (ahorro de cada día, SOC al inicio de cada día).
+    """
+    n_niveles = len(niveles_soc)
+    ultimo = n_niveles - 1
+    paso = float(niveles_soc[1]) if n_niveles > 1 else 1.0
+    soc_final_tipo = soc_final_tipo.tolist()
+    soc_dia = []
+    soc = float(soc_inicial)
+    for j in etiquetas.tolist():
+        soc_dia.append(soc)
+        fila = soc_final_tipo[j]
+        if ultimo == 0:
+            soc = fila[0]
+            continue
+        posicion = min(max(soc / paso, 0.0), ultimo)
+        i = min(int(posicion), ultimo - 1)
+        soc = fila[i] + (posicion - i) * (fila[i + 1] - fila[i])
+    soc_dia = np.array(soc_dia)
+    return interpolar_niveles(soc_dia, niveles_soc, ahorro_tipo[etiquetas]), soc_dia
+
+
+def cotizacion_rapida(consumo, solar, precio, es_valle, precio_punta, tiempo, pasos_por_hora, k=K_POR_DEFECTO,
+                      cap_bat=100, pot_bat=50, eficiencia=0.90, precio_venta_excedente=0.10,
+                      muestras_por_tipo=MUESTRAS_POR_TIPO, semilla=0, estrategia='heuristica'):
+    """
+    Ahorro aproximado de toda la serie (curva real o perfil sintético) simulando solo k días tipo.
+
+    consumo, solar, precio y es_valle son arrays por paso; precio_punta escalar o por paso;
+    tiempo marca el inicio de cada paso (solo se usan los días completos). Con estrategia='optima'
+    cada día tipo se resuelve con el despacho óptimo, donde la ganancia de tiempo es mayor.
+    Devuelve un dict con 'ahorro_estimado', 'cota_error' (€, banda al 95% del total a partir de
+    los residuos de validación de cada grupo ponderados por su nº de días), 'cota_error_pct',
+    'etiquetas' (grupo de cada día), 'pesos', 'representantes', 'n_dias', 'dias_simulados' y 'tiempo_s'.
+    """
+    inicio_reloj = time.perf_counter()
+    pasos_dia = 24 * pasos_por_hora
+    inicio, n_dias = dias_completos(tiempo, pasos_por_hora)
+    if n_dias == 0:
+        raise ValueError("La serie no contiene ningún día completo")
+
+    dias = {
+        'consumo': matriz_dias(consumo, inicio, n_dias, pasos_dia),
+        'solar': matriz_dias(solar, inicio, n_dias, pasos_dia),
+        'precio': matriz_dias(precio, inicio, n_dias, pasos_dia),
+        'es_valle': matriz_dias(es_valle, inicio, n_dias, pasos_dia).astype(bool),
+        'precio_punta': matriz_dias(precio_punta, inicio, n_dias, pasos_dia),
+    }
+
+    # Vector de cada día: consumo | solar | precio en medias horarias (24 valores por bloque aunque
+    # la serie sea cuarto-horaria), cada bloque escalado por su desviación típica
+    bloques = []
+    for clave in ('consumo', 'solar', 'precio'):
+        horario = dias[clave].reshape(n_dias, 24, pasos_por_hora).mean(axis=2)
+        escala = horario.std()
+        bloques.append(horario / escala if escala > 0 else np.zeros_like(horario))
+    vectores = np.hstack(bloques)
+
+    etiquetas, centroides = kmeans(vectores, k, semilla)
+    k = len(centroides)
+    pesos = np.bincount(etiquetas, minlength=k)
+    distancia = ((vectores - centroides[etiquetas]) ** 2).sum(axis=1)
+    representantes = np.array([np.flatnonzero(etiquetas == j)[np.argmin(distancia[etiquetas == j])]
+                               if pesos[j] else 0 for j in range(k)])
+
+    # Muestra de validación estratificada (días distintos del representante)
+    rng = np.random.default_rng(semilla)
+    muestra, grupo_muestra = [], []
+    for j in range(k):
+        candidatos = np.setdiff1d(np.flatnonzero(etiquetas == j), representantes[j])
+        elegidos = rng.choice(candidatos, size=min(muestras_por_tipo, len(candidatos)), replace=False)
+        muestra.extend(elegidos.tolist())
+        grupo_muestra.extend([j] * len(elegidos))
+    muestra = np.array(muestra, dtype=np.int64)
+    grupo_muestra = np.array(grupo_muestra, dtype=np.int64)
+
+    simulados = np.concatenate((representantes, muestra))
+    if estrategia == 'optima' or cap_bat <= 0:
+        niveles_soc = np.zeros(1)
+    else:
+        niveles_soc = np.linspace(0.0, cap_bat, NIVELES_SOC)
+    ahorro_dias, soc_final_dias = _simular_dias(simulados, dias, niveles_soc, cap_bat, pot_bat, eficiencia,
+                                                precio_venta_excedente, 1 / pasos_por_hora, estrategia)
+    ahorro_cadena, soc_dia = encadenar_dias(etiquetas, niveles_soc, ahorro_dias[:k], soc_final_dias[:k])
+    ahorro_estimado = float(ahorro_cadena.sum())
+
+    # Residuo del día tipo frente a los días reales de su grupo, ambos desde el SOC con el que
+    # llega ese día en la cadena. Cada día del grupo aporta un residuo independiente con el error
+    # cuadrático medio de su muestra: varianza del total = suma de peso x ECM del grupo
+    errores = (interpolar_niveles(soc_dia[muestra], niveles_soc, ahorro_dias[k:])
+               - interpolar_niveles(soc_dia[muestra], niveles_soc, ahorro_dias[grupo_muestra]))
+    varianza = 0.0
+    for j in range(k):
+        e = errores[grupo_muestra == j]
+        if len(e):
+            varianza += pesos[j] * np.mean(e ** 2)
+    cota_error = Z_95 * np.sqrt(varianza)
+
+    return {
+        'ahorro_estimado': ahorro_estimado,
+        'cota_error': float(cota_error),
+        'cota_error_pct': float(100 * cota_error / abs(ahorro_estimado)) if ahorro_estimado else float('inf'),
+        'etiquetas': etiquetas,
+        'pesos': pesos,
+        'representantes': representantes,
+        'n_dias': n_dias,
+        'dias_simulados': len(simulados),
+        'tiempo_s': time.perf_counter() - inicio_reloj,
+    }
+
+
+def simulacion_completa(consumo, solar, precio, es_valle, precio_punta, tiempo, pasos_por_hora, cap_bat=100,
+                        pot_bat=50, eficiencia=0.90, precio_venta_excedente=0.10, estrategia='heuristica'):
+    """
+    Referencia exacta de cotizacion_rapida: los mismos días completos simulados de seguido
+    (motor escalar o despacho óptimo). Devuelve {'ahorro', 'tiempo_s'}.
+    """
+    inicio_reloj = time.perf_counter()
+    inicio, n_dias = dias_completos(tiempo, pasos_por_hora)
+    tramo = slice(inicio, inicio + n_dias * 24 * pasos_por_hora)
+    precio_punta = precio_punta if np.ndim(precio_punta) == 0 else np.asarray(precio_punta)[tramo]
+    if estrategia == 'optima':
+        from optimo import despacho_optimo
+        ahorro = despacho_optimo(consumo[tramo], solar[tramo], precio[tramo], cap_bat, pot_bat, eficiencia,
+                                 precio_venta_excedente, horas_paso=1 / pasos_por_hora)['ahorro_total']
+    else:
+        ahorro = simular_despacho(consumo[tramo], solar[tramo], precio[tramo], es_valle[tramo], cap_bat, pot_bat,
+                                  eficiencia, precio_venta_excedente, precio_punta=precio_punta,
+                                  horas_paso=1 / pasos_por_hora)['ahorro_total']
+    return {'ahorro': float(ahorro), 'tiempo_s': time.perf_counter() - inicio_reloj}
+
+
+def cotizar_curva(curva, contador=0, precio_valle=0.092, precio_punta=0.129, precios_periodo=None, k=K_POR_DEFECTO,
+                  cap_bat=100, pot_bat=50, eficiencia=0.90, precio_venta_excedente=0.10, estrategia='heuristica',
+                  semilla=0, comparar=False):
+    """
+    cotizacion_rapida sobre una curva de curvas.cargar_curva con precios valle/punta o 3.0TD (precios_periodo).
+    Con comparar=True añade la simulación completa: 'ahorro_exacto', 'tiempo_exacto_s', 'error_real_pct'
+    y 'aceleracion'.
+    """
+    consumo = np.nan_to_num(np.asarray(curva['consumo'][contador], dtype=float))
+    solar = np.nan_to_num(np.asarray(curva['vertido'][contador], dtype=float))
+    if precios_periodo:
+        precio, es_valle, reventa = precios_curva(curva['tiempo'], precios_periodo, consumo)
+    else:
+        precio, es_valle, reventa = precios_dos_tramos(hora_de_marcas(curva['tiempo']), precio_valle, precio_punta)
+    entradas = (consumo, solar, precio, es_valle, reventa, curva['tiempo'], curva['pasos_por_hora'])
+    configuracion = dict(cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+                         precio_venta_excedente=precio_venta_excedente, estrategia=estrategia)
+    resultado = cotizacion_rapida(*entradas, k=k, semilla=semilla, **configuracion)
+    if comparar:
+        exacto = simulacion_completa(*entradas, **configuracion)
+        resultado['ahorro_exacto'] = exacto['ahorro']
+        resultado['tiempo_exacto_s'] = exacto['tiempo_s']
+        resultado['error_real_pct'] = (100 * (resultado['ahorro_estimado'] - exacto['ahorro']) / abs(exacto['ahorro'])
+                                       if exacto['ahorro'] else float('inf'))
+        resultado['aceleracion'] = exacto['tiempo_s'] / resultado['tiempo_s']
+    return resultado
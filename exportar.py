@@ -0,0 +1,175 @@
+import os
+import csv
+
+import numpy as np
+
+from traza import COLUMNAS_TRAZA
+
+# --- EXPORTACIÓN A EXCEL / CSV EN STREAMING ---
+# Resultados mensuales, barridos de dimensionado y trazas paso a paso se escriben fila a fila
+# desde generadores, sin montar antes un DataFrame: la memoria no crece con el número de filas.
+#  - Una "hoja" es (nombre, cabecera, filas) con filas un iterable de listas (normalmente un
+#    generador: hoja_registros, hoja_barrido, hoja_barrido_fv, hoja_matriz, hoja_traza).
+#  - .xlsx: openpyxl en modo write_only (cada fila se serializa al momento a un temporal en disco);
+#    las hojas de más de MAX_FILAS_HOJA filas siguen en 'Nombre (2)', 'Nombre (3)'...
+#  - .csv: csv.writer sobre el fichero; con varias hojas, un CSV por hoja (ruta_<hoja>.csv).
+# Las trazas se convierten por bloques de FILAS_POR_BLOQUE pasos (un .npy mapeado en memoria
+# solo lee del disco el bloque que se está escribiendo).
+
+MAX_FILAS_HOJA = 1_048_576  # Límite de filas de una hoja de Excel (cabecera incluida)
+FILAS_POR_BLOQUE = 10_000
+DECIMALES_TRAZA = 4
+UNIDADES_TRAZA = {'soc': 'SOC_kWh', 'carga': 'Carga_kWh', 'descarga': 'Descarga_kWh', 'red': 'Red_kWh',
+                  'balance': 'Balance_Eur'}
+FORMATOS = ('.xlsx', '.csv')
+
+
+def hoja_registros(nombre, registros, campos=None):
+    """Hoja a partir de dicts (p.ej. res['meses']); campos por defecto: las claves del primero."""
+    registros = iter(registros)
+    primero = next(registros, None)
+    if campos is None:
+        campos = list(primero) if primero is not None else []
+
+    def filas():
+        if primero is None:
+            return
+        yield [primero.get(c) for c in campos]
+        for registro in registros:
+            yield [registro.get(c) for c in campos]
+    return nombre, list(campos), filas()
+
+
+def hoja_barrido(res, nombre='Barrido'):
+    """Barrido de dimensionado en formato largo: una fila por configuración capacidad x potencia."""
+    cabecera = ['Capacidad_kWh', 'Potencia_kW', 'Ahorro_Periodo_Eur', 'Ahorro_Anual_Eur', 'Retorno_Anios']
+
+    def filas():
+        for i, cap in enumerate(res['capacidades'].tolist()):
+            ahorro_periodo = res['ahorro_periodo'][i].tolist()
+            ahorro_anual = res['ahorro_anual'][i].tolist()
+            retorno = res['retorno_anios'][i].tolist()
+            for j, pot in enumerate(res['potencias'].tolist()):
+                yield [cap, pot, round(ahorro_periodo[j], 2), round(ahorro_anual[j], 2),
+                       round(retorno[j], 2) if np.isfinite(retorno[j]) else None]
+    return nombre, cabecera, filas()
+
+
+def hoja_barrido_fv(res, nombre='Barrido FV'):
+    """Barrido conjunto FV + batería en formato largo: una fila por kWp x capacidad x potencia."""
+    cabecera = ['FV_kWp', 'Capacidad_kWh', 'Potencia_kW', 'Ahorro_FV_Anual_Eur', 'Ahorro_Anual_Eur', 'Retorno_Anios']
+
+    def filas():
+        for k, kwp in enumerate(res['potencias_fv'].tolist()):
+            ahorro_fv = round(float(res['ahorro_fv_anual'][k]), 2)
+            for i, cap in enumerate(res['capacidades'].tolist()):
+                ahorro_anual = res['ahorro_anual'][k, i].tolist()
+                retorno = res['retorno_anios'][k, i].tolist()
+                for j, pot in enumerate(res['potencias'].tolist()):
+                    yield [kwp, cap, pot, ahorro_fv, round(ahorro_anual[j], 2),
+                           round(retorno[j], 2) if np.isfinite(retorno[j]) else None]
+    return nombre, cabecera, filas()
+
+
+def hoja_matriz(res, clave='ahorro_anual', nombre=None, decimales=2):
+    """Una matriz del barrido tal cual: filas = capacidades (kWh), columnas = potencias (kW)."""
+    cabecera = ['Capacidad_kWh \\ Potencia_kW'] + res['potencias'].tolist()
+
+    def filas():
+        for cap, fila in zip(res['capacidades'].tolist(), res[clave]):
+            yield [cap] + [round(v, decimales) if np.isfinite(v) else None for v in fila.tolist()]
+    return nombre or clave, cabecera, filas()
+
+
+def hoja_traza(traza, tiempo=None, nombre='Traza', bloque=FILAS_POR_BLOQUE, decimales=DECIMALES_TRAZA):
+    """
+    Traza (n_columnas, n_pasos) de traza.py paso a paso. tiempo (datetime64 por paso, opcional)
+    añade la columna 'Hora'. Se convierte por bloques de 'bloque' pasos.
+    """
+    cabecera = ['Paso'] + (['Hora'] if tiempo is not None else []) + [UNIDADES_TRAZA[c] for c in COLUMNAS_TRAZA]
+
+    def filas():
+        n_pasos = traza.shape[1]
+        for inicio in range(0, n_pasos, bloque):
+            fin = min(inicio + bloque, n_pasos)
+            valores = np.round(np.asarray(traza[:, inicio:fin], dtype=float).T, decimales).tolist()
+            if tiempo is None:
+                for paso, fila in zip(range(inicio, fin), valores):
+                    yield [paso] + fila
+            else:
+                horas = np.asarray(tiempo[inicio:fin]).astype('datetime64[s]').tolist()
+                for paso, hora, fila in zip(range(inicio, fin), horas, valores):
+                    yield [paso, hora] + fila
+    return nombre, cabecera, filas()
+
+
+def escribir_csv(destino, cabecera, filas, separador=','):
+    """Escribe una hoja en CSV (ruta o fichero de texto abierto). Devuelve las filas escritas."""
+    if isinstance(destino, (str, os.PathLike)):
+        with open(destino, 'w', encoding='utf-8', newline='') as f:
+            return escribir_csv(f, cabecera, filas, separador)
+    escritor = csv.writer(destino, delimiter=separador)
+    escritor.writerow(cabecera)
+    n = 0
+    for fila in filas:
+        escritor.writerow(fila)
+        n += 1
+    return n
+
+
+def escribir_xlsx(destino, hojas):
+    """
+    Escribe las hojas en un .xlsx en modo streaming (ruta o fichero binario abierto).
+    Devuelve {nombre de hoja: filas escritas}.
+    """
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    escritas = {}
+    for nombre, cabecera, filas in hojas:
+        parte = 1
+        hoja = libro.create_sheet(_nombre_hoja(nombre, parte))
+        hoja.append(cabecera)
+        en_hoja = 1
+        escritas[nombre] = 0
+        for fila in filas:
+            if en_hoja == MAX_FILAS_HOJA:
+                parte += 1
+                hoja = libro.create_sheet(_nombre_hoja(nombre, parte))
+                hoja.append(cabecera)
+                en_hoja = 1
+            hoja.append(fila)
+            en_hoja += 1
+            escritas[nombre] += 1
+    libro.save(destino)
+    return escritas
+
+
+def _nombre_hoja(nombre, parte):
+    # Excel: como mucho 31 caracteres y sin []:*?/\
+    limpio = ''.join('_' if c in '[]:*?/\\' else c for c in str(nombre))
+    sufijo = f' ({parte})' if parte > 1 else ''
+    return limpio[:31 - len(sufijo)] + sufijo
+
+
+def exportar(ruta, hojas):
+    """
+    Exporta las hojas según la extensión de ruta (.xlsx o .csv; con varias hojas en CSV, un
+    fichero ruta_<hoja>.csv por hoja). Devuelve la lista de (fichero, filas escritas).
+    """
+    base, extension = os.path.splitext(ruta)
+    extension = extension.lower()
+    if extension not in FORMATOS:
+        raise ValueError(f"Formato de exportación no soportado '{extension}'. Opciones: {', '.join(FORMATOS)}")
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    hojas = list(hojas)
+    if extension == '.xlsx':
+        escritas = escribir_xlsx(ruta, hojas)
+        return [(ruta, sum(escritas.values()))]
+    ficheros = []
+    for nombre, cabecera, filas in hojas:
+        fichero = ruta if len(hojas) == 1 else f"{base}_{_nombre_hoja(nombre, 1).replace(' ', '_').lower()}{extension}"
+        ficheros.append((fichero, escribir_csv(fichero, cabecera, filas)))
+    return ficheros
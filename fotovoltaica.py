@@ -0,0 +1,375 @@
+import os
+import csv
+from functools import lru_cache
+
+import numpy as np
+
+from curvas import buscar_columna
+from perfiles import perfil_mensual, _solo_lectura, SECTOR_POR_DEFECTO
+from tarifas import inicio_desde_etiqueta, dias_cambio_hora
+
+# --- PRODUCCIÓN FOTOVOLTAICA POR EMPLAZAMIENTO ---
+# Sustituye la campana senoidal fija (perfiles.plantilla_solar escalada al excedente de la
+# factura) por la producción de una instalación concreta: latitud/longitud, inclinación,
+# azimut y kWp.
+#  - Irradiancia: cielo despejado (Haurwitz) con días nubosos sintéticos (índice de claridad
+#    diario alrededor de la media del mes, reproducible con la semilla) o un CSV tipo TMY
+#    (año meteorológico tipo, p.ej. la exportación de PVGIS: G(h), Gb(n), Gd(h), T2m).
+#  - Posición solar, reparto directa/difusa (Erbs), transposición al plano del panel (cielo
+#    isótropo) y pérdidas por temperatura se calculan vectorizadas sobre todos los cuartos de
+#    hora del año de una vez; la resolución horaria es la suma de sus cuatro cuartos.
+#  - La producción de 1 kWp de cada emplazamiento y año se guarda en una LRU: cambiar el kWp es
+#    una multiplicación y los barridos FV + batería reutilizan el mismo array.
+# El excedente deja de ser un dato de la factura: sale del balance producción - demanda paso a paso.
+
+TAMANO_CACHE = 32
+MINUTOS_BASE = 15           # Resolución del cálculo (cuarto-horaria)
+CONSTANTE_SOLAR = 1361.0    # W/m²
+COS_CENIT_MINIMO = 0.0175   # Sol a menos de ~1º sobre el horizonte: sin componente directa
+
+# Irradiación real / cielo despejado por mes (interior peninsular) y dispersión de la claridad
+# diaria (distribución Beta: más concentración = días más parecidos entre sí)
+INDICE_CLARIDAD_MENSUAL = (0.68, 0.72, 0.76, 0.78, 0.82, 0.88, 0.92, 0.91, 0.84, 0.76, 0.69, 0.66)
+CONCENTRACION_NUBES = 6.0
+
+TEMPERATURA_MENSUAL = (6, 8, 11, 13, 17, 23, 26, 26, 21, 15, 10, 7)  # ºC ambiente si el TMY no la trae
+COEF_TEMPERATURA = -0.004   # Pérdida de potencia por ºC de célula sobre 25 ºC
+TONC = 45.0                 # Temperatura de operación nominal de la célula (ºC)
+
+CIELOS = ('nuboso', 'despejado')
+INSTALACION_POR_DEFECTO = {
+    'kwp': 10.0,
+    'latitud': 40.4,
+    'longitud': -3.7,
+    'inclinacion': 30.0,      # Grados sobre la horizontal
+    'azimut': 0.0,            # 0 = sur, -90 = este, 90 = oeste (convención de PVGIS)
+    'perdidas': 0.14,         # Cableado, inversor, suciedad...
+    'albedo': 0.2,
+    'huso': 1,                # Horas sobre UTC de la hora civil de las facturas
+    'horario_verano': True,
+    'tmy': None,              # Ruta del CSV tipo TMY; None = modelo de cielo
+    'cielo': 'nuboso',
+    'semilla': 0,
+}
+
+COLUMNAS_TIEMPO_TMY = ('time(utc)', 'time', 'fecha_hora_utc', 'fecha_hora', 'timestamp', 'datetime')
+COLUMNAS_GHI = ('g(h)', 'ghi', 'irradiancia_global', 'global_horizontal')
+COLUMNAS_DNI = ('gb(n)', 'dni', 'irradiancia_directa')
+COLUMNAS_DHI = ('gd(h)', 'dhi', 'irradiancia_difusa')
+COLUMNAS_TEMPERATURA = ('t2m', 'temp_air', 'temperatura', 'temperatura_aire')
+
+HORAS_ANIO_TIPO = 8760
+_DIAS_ACUMULADOS = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+
+
+def instalacion(**parametros):
+    """Instalación completa: INSTALACION_POR_DEFECTO con los parámetros indicados (valida los nombres)."""
+    desconocidos = set(parametros) - set(INSTALACION_POR_DEFECTO)
+    if desconocidos:
+        raise ValueError(f"Parámetros de instalación desconocidos: {', '.join(sorted(desconocidos))}")
+    resultado = {**INSTALACION_POR_DEFECTO, **{k: v for k, v in parametros.items() if v is not None}}
+    if resultado['cielo'] not in CIELOS:
+        raise ValueError(f"Cielo desconocido '{resultado['cielo']}'. Opciones: {', '.join(CIELOS)}")
+    return resultado
+
+
+# --- TIEMPO Y POSICIÓN SOLAR ---
+
+def a_utc(tiempo, huso=1, horario_verano=True):
+    """
+    Marcas de hora civil local (datetime64) a UTC: resta el huso y, con horario_verano, una
+    hora más entre el último domingo de marzo y el último de octubre (01:00 UTC, norma europea).
+    """
+    tiempo = np.asarray(tiempo, dtype='datetime64[s]')
+    utc = tiempo - np.timedelta64(int(round(huso * 3600)), 's')
+    if horario_verano:
+        utc_verano = utc - np.timedelta64(1, 'h')
+        anios = utc.astype('datetime64[Y]').astype(np.int64) + 1970
+        verano = np.zeros(utc.shape, dtype=bool)
+        for anio in np.unique(anios).tolist():
+            dia_verano, dia_invierno = dias_cambio_hora(anio)
+            desde = dia_verano + np.timedelta64(1, 'h')
+            hasta = dia_invierno + np.timedelta64(1, 'h')
+            seleccion = anios == anio
+            verano[seleccion] = (utc_verano[seleccion] >= desde) & (utc_verano[seleccion] < hasta)
+        utc = np.where(verano, utc_verano, utc)
+    return utc
+
+
+def posicion_solar(tiempo_utc, latitud, longitud):
+    """
+    Posición del sol en cada marca UTC (series de Spencer / NOAA): (cos del ángulo cenital,
+    azimut en radianes con 0 = sur y positivo hacia el oeste, irradiancia extraterrestre W/m²).
+    """
+    tiempo = np.asarray(tiempo_utc, dtype='datetime64[s]')
+    dia = (tiempo - tiempo.astype('datetime64[Y]')).astype(np.int64) / 86400  # Días desde el 1 de enero
+    hora = (dia % 1) * 24
+    gamma = 2 * np.pi / 365 * (dia - 0.5)
+    ecuacion_tiempo = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                                - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    declinacion = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+                   - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+                   - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    angulo_horario = np.radians((hora * 60 + ecuacion_tiempo + 4 * longitud) / 4 - 180)
+
+    lat = np.radians(latitud)
+    cos_cenit = (np.sin(lat) * np.sin(declinacion)
+                 + np.cos(lat) * np.cos(declinacion) * np.cos(angulo_horario))
+    azimut = np.arctan2(np.sin(angulo_horario),
+                        np.cos(angulo_horario) * np.sin(lat) - np.tan(declinacion) * np.cos(lat))
+    extraterrestre = CONSTANTE_SOLAR * (1 + 0.033 * np.cos(2 * np.pi * dia / 365))
+    return cos_cenit, azimut, extraterrestre
+
+
+# --- IRRADIANCIA ---
+
+def ghi_cielo_despejado(cos_cenit):
+    """Irradiancia global horizontal con cielo despejado (modelo de Haurwitz), W/m²."""
+    cos_cenit = np.asarray(cos_cenit, dtype=float)
+    sol = cos_cenit > 0
+    seguro = np.where(sol, cos_cenit, 1.0)
+    return np.where(sol, 1098 * seguro * np.exp(-0.057 / seguro), 0.0)
+
+
+def descomponer(ghi, cos_cenit, extraterrestre):
+    """Reparto de la global horizontal en directa normal y difusa (correlación de Erbs): (dni, dhi)."""
+    sol = cos_cenit > COS_CENIT_MINIMO
+    seguro = np.where(sol, cos_cenit, 1.0)
+    kt = np.clip(np.where(sol, ghi / (extraterrestre * seguro), 0.0), 0.0, 1.0)
+    kd = np.select(
+        [kt <= 0.22, kt <= 0.80],
+        [1 - 0.09 * kt, 0.9511 - 0.1604 * kt + 4.388 * kt ** 2 - 16.638 * kt ** 3 + 12.336 * kt ** 4],
+        0.165,
+    )
+    dhi = np.where(sol, kd * ghi, ghi)
+    dni = np.where(sol, np.minimum((ghi - dhi) / seguro, extraterrestre), 0.0)
+    return dni, dhi
+
+
+def irradiancia_plano(ghi, dni, dhi, cos_cenit, azimut_sol, inclinacion, azimut, albedo=0.2):
+    """Irradiancia sobre el plano del panel (W/m²): directa + difusa de cielo isótropo + reflejada."""
+    beta = np.radians(inclinacion)
+    sen_cenit = np.sqrt(np.clip(1 - cos_cenit ** 2, 0.0, 1.0))
+    cos_incidencia = (cos_cenit * np.cos(beta)
+                      + sen_cenit * np.sin(beta) * np.cos(azimut_sol - np.radians(azimut)))
+    directa = np.where(cos_cenit > COS_CENIT_MINIMO, dni * np.maximum(cos_incidencia, 0.0), 0.0)
+    return directa + dhi * (1 + np.cos(beta)) / 2 + ghi * albedo * (1 - np.cos(beta)) / 2
+
+
+def potencia_por_kwp(irradiancia, temperatura, perdidas=0.14):
+    """kW entregados por kWp instalado: irradiancia / 1000 corregida por temperatura de célula y pérdidas."""
+    temperatura_celula = temperatura + irradiancia * (TONC - 20) / 800
+    factor = 1 + COEF_TEMPERATURA * (temperatura_celula - 25)
+    return np.maximum(irradiancia / 1000 * factor * (1 - perdidas), 0.0)
+
+
+def _claridad_diaria(anio, semilla, n_dias):
+    """Fracción de la irradiancia de cielo despejado de cada día del año (Beta alrededor de la media del mes)."""
+    dias = np.datetime64(f'{anio}-01-01') + np.arange(n_dias)
+    mes = dias.astype('datetime64[M]').astype(np.int64) % 12
+    media = np.asarray(INDICE_CLARIDAD_MENSUAL)[mes]
+    generador = np.random.default_rng([semilla, anio])
+    return generador.beta(media * CONCENTRACION_NUBES, (1 - media) * CONCENTRACION_NUBES)
+
+
+# --- AÑO METEOROLÓGICO TIPO (CSV) ---
+
+def _hora_tipo(tiempo):
+    """Hora del año tipo (0..8759) de cada marca: mes, día y hora; el 29 de febrero cuenta como el 28."""
+    horas = np.asarray(tiempo).astype('datetime64[h]')
+    dias = horas.astype('datetime64[D]')
+    meses = dias.astype('datetime64[M]')
+    mes = meses.astype(np.int64) % 12
+    dia_mes = (dias - meses.astype('datetime64[D]')).astype(np.int64)
+    dia_mes = np.where((mes == 1) & (dia_mes == 28), 27, dia_mes)
+    return (_DIAS_ACUMULADOS[mes] + dia_mes) * 24 + (horas - dias.astype('datetime64[h]')).astype(np.int64)
+
+
+def _marca_tmy(texto):
+    texto = texto.strip()
+    if len(texto) == 13 and texto[8] == ':':  # PVGIS: 20070101:0010
+        texto = f'{texto[:4]}-{texto[4:6]}-{texto[6:8]}T{texto[9:11]}:{texto[11:13]}'
+    return np.datetime64(texto.replace(' ', 'T')[:16], 'm')
+
+
+def firma_tmy(ruta):
+    """Fecha de modificación del CSV (parte de la clave de caché: editarlo invalida la producción)."""
+    return os.stat(ruta).st_mtime_ns if ruta and os.path.exists(ruta) else None
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _leer_tmy(ruta, firma, huso, horario_verano):
+    """
+    Año tipo del CSV por hora del año en UTC (HORAS_ANIO_TIPO valores): dict con 'ghi' y,
+    si vienen, 'dni', 'dhi' y 'temperatura' (None si no). Marcas en UTC si la columna de tiempo
+    lo dice (PVGIS: 'time(UTC)'); si no, hora civil con el huso de la instalación.
+    Se saltan las líneas de cabecera y pie que no son datos.
+    """
+    with open(ruta, 'r', encoding='utf-8-sig', errors='replace') as f:
+        lineas = f.read().splitlines()
+
+    for inicio, linea in enumerate(lineas):
+        separador = ';' if linea.count(';') > linea.count(',') else ','
+        cabecera = [c.strip() for c in linea.split(separador)]
+        columna_tiempo = buscar_columna(cabecera, COLUMNAS_TIEMPO_TMY)
+        if columna_tiempo is not None and buscar_columna(cabecera, COLUMNAS_GHI) is not None:
+            break
+    else:
+        raise ValueError(f"No se encuentran las columnas de tiempo e irradiancia global en {ruta}")
+
+    columnas = {
+        'ghi': buscar_columna(cabecera, COLUMNAS_GHI),
+        'dni': buscar_columna(cabecera, COLUMNAS_DNI),
+        'dhi': buscar_columna(cabecera, COLUMNAS_DHI),
+        'temperatura': buscar_columna(cabecera, COLUMNAS_TEMPERATURA),
+    }
+    posiciones = {k: cabecera.index(c) for k, c in columnas.items() if c is not None}
+    posicion_tiempo = cabecera.index(columna_tiempo)
+
+    marcas, valores = [], []
+    for campos in csv.reader(lineas[inicio + 1:], delimiter=separador):
+        if len(campos) < len(cabecera):
+            continue
+        try:
+            marca = _marca_tmy(campos[posicion_tiempo])
+            fila = [float(campos[p].replace(',', '.')) for p in posiciones.values()]
+        except ValueError:
+            continue  # Pie del fichero (notas, unidades...)
+        marcas.append(marca)
+        valores.append(fila)
+    if not marcas:
+        raise ValueError(f"{ruta} no contiene filas de irradiancia")
+
+    marcas = np.array(marcas, dtype='datetime64[m]')
+    if 'utc' not in columna_tiempo.lower():
+        marcas = a_utc(marcas, huso, horario_verano)
+    hora = _hora_tipo(marcas)
+    valores = np.array(valores, dtype=float)
+
+    datos = {k: None for k in columnas}
+    for i, clave in enumerate(posiciones):
+        serie = np.full(HORAS_ANIO_TIPO, np.nan)
+        serie[hora] = valores[:, i]
+        datos[clave] = serie
+    huecos = int(np.isnan(datos['ghi']).sum())
+    if huecos:
+        raise ValueError(f"El año tipo de {ruta} tiene {huecos} horas sin irradiancia global")
+    return datos
+
+
+# --- PRODUCCIÓN ---
+
+def _parametros(inst):
+    """Parámetros de la instalación que fijan la producción por kWp (clave de la caché)."""
+    return (float(inst['latitud']), float(inst['longitud']), float(inst['inclinacion']), float(inst['azimut']),
+            float(inst['perdidas']), float(inst['albedo']), float(inst['huso']), bool(inst['horario_verano']),
+            inst['tmy'], firma_tmy(inst['tmy']), inst['cielo'], int(inst['semilla']))
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _produccion_kwp(anio, latitud, longitud, inclinacion, azimut, perdidas, albedo, huso, horario_verano,
+                    tmy, firma, cielo, semilla):
+    """kWh por kWp de cada cuarto de hora (hora civil) del año: array de solo lectura."""
+    inicio = np.datetime64(f'{anio}-01-01T00:00')
+    n_pasos = int((np.datetime64(f'{anio + 1}-01-01T00:00') - inicio).astype(np.int64)) // MINUTOS_BASE
+    pasos_dia = 24 * 60 // MINUTOS_BASE
+    local = inicio + np.arange(n_pasos) * np.timedelta64(MINUTOS_BASE, 'm')
+    # Geometría en el centro de cada paso
+    utc = a_utc(local, huso, horario_verano) + np.timedelta64(MINUTOS_BASE * 30, 's')
+    cos_cenit, azimut_sol, extraterrestre = posicion_solar(utc, latitud, longitud)
+    mes = local.astype('datetime64[M]').astype(np.int64) % 12
+    temperatura = np.asarray(TEMPERATURA_MENSUAL, dtype=float)[mes]
+
+    if tmy:
+        datos = _leer_tmy(tmy, firma, huso, horario_verano)
+        hora = _hora_tipo(utc)
+        ghi = datos['ghi'][hora]
+        if datos['dni'] is not None and datos['dhi'] is not None:
+            dni, dhi = datos['dni'][hora], datos['dhi'][hora]
+        else:
+            dni, dhi = descomponer(ghi, cos_cenit, extraterrestre)
+        if datos['temperatura'] is not None:
+            temperatura = datos['temperatura'][hora]
+    else:
+        ghi = ghi_cielo_despejado(cos_cenit)
+        if cielo == 'nuboso':
+            ghi = ghi * _claridad_diaria(anio, semilla, n_pasos // pasos_dia)[np.arange(n_pasos) // pasos_dia]
+        dni, dhi = descomponer(ghi, cos_cenit, extraterrestre)
+
+    plano = irradiancia_plano(ghi, dni, dhi, cos_cenit, azimut_sol, inclinacion, azimut, albedo)
+    return _solo_lectura(potencia_por_kwp(plano, temperatura, perdidas) * MINUTOS_BASE / 60)
+
+
+def produccion_anual(inst, anio, pasos_por_hora=1):
+    """
+    kWh de la instalación en cada paso del año completo en hora civil (8760 / 35.040 pasos;
+    8784 / 35.136 en bisiesto). pasos_por_hora: 1, 2 ó 4. inst puede ser parcial: el resto
+    de parámetros se toman de INSTALACION_POR_DEFECTO.
+    """
+    inst = instalacion(**inst)
+    base = _produccion_kwp(int(anio), *_parametros(inst))
+    agrupar = 60 // MINUTOS_BASE // pasos_por_hora
+    if agrupar > 1:
+        base = base.reshape(-1, agrupar).sum(axis=1)
+    return base * float(inst['kwp'])
+
+
+def produccion_periodo(inst, inicio, dias=30, pasos_por_hora=1):
+    """Producción (kWh por paso) de `dias` días a partir de 'aaaa-mm-dd', cruzando de año si hace falta."""
+    inicio = np.datetime64(str(inicio)[:10], 'D')
+    anio = int(str(inicio)[:4])
+    pasos_dia = 24 * pasos_por_hora
+    desplazamiento = int((inicio - np.datetime64(f'{anio}-01-01', 'D')).astype(np.int64)) * pasos_dia
+    n_pasos = dias * pasos_dia
+
+    trozos = []
+    while n_pasos > 0:
+        trozo = produccion_anual(inst, anio, pasos_por_hora)[desplazamiento:desplazamiento + n_pasos]
+        trozos.append(trozo)
+        n_pasos -= len(trozo)
+        anio += 1
+        desplazamiento = 0
+    return trozos[0] if len(trozos) == 1 else np.concatenate(trozos)
+
+
+def balance_neto(demanda, produccion):
+    """Balance paso a paso: (consumo de red, excedente, autoconsumo directo), kWh. Admite (T,) o (T, N)."""
+    autoconsumo = np.minimum(demanda, produccion)
+    return demanda - autoconsumo, produccion - autoconsumo, autoconsumo
+
+
+def demanda_mes(mes):
+    """
+    Demanda del local en el periodo: consumo de la factura más 'autoconsumo_kwh' si lo trae
+    (en un local que ya tiene FV, la factura solo recoge la energía comprada a la red).
+    """
+    return mes['consumo_total_kwh'] + mes.get('autoconsumo_kwh', 0)
+
+
+def perfil_fotovoltaico(mes, dias=30, pasos_por_hora=1, sector=SECTOR_POR_DEFECTO):
+    """
+    Equivalente a perfiles.perfil_mensual con la producción modelada de mes['fotovoltaica']:
+    la demanda del sector (demanda_mes) menos la producción da el consumo de red y el excedente.
+    El 'excedente_total_kwh' de la factura no se usa. Necesita mes['inicio'].
+    Devuelve (hora_dia, consumo_kwh, solar_kwh, produccion_kwh).
+    """
+    hora_dia, demanda, _ = perfil_mensual(demanda_mes(mes), 0.0, dias, pasos_por_hora, sector)
+    produccion = produccion_periodo(mes['fotovoltaica'], mes['inicio'], dias, pasos_por_hora)
+    consumo_red, excedente, _ = balance_neto(demanda, produccion)
+    return hora_dia, consumo_red, excedente, produccion
+
+
+def resumen_fotovoltaico(mes, dias=30, pasos_por_hora=1, sector=SECTOR_POR_DEFECTO):
+    """Totales del periodo en kWh: producción, autoconsumo directo y excedente."""
+    _, _, excedente, produccion = perfil_fotovoltaico(mes, dias, pasos_por_hora, sector)
+    return {
+        'Produccion_FV': int(round(produccion.sum())),
+        'Autoconsumo_FV': int(round(produccion.sum() - excedente.sum())),
+        'Excedente_FV': int(round(excedente.sum())),
+    }
+
+
+def con_fotovoltaica(datos_facturas, inst, anio):
+    """Copia de las facturas con la instalación FV y la fecha de inicio sacada de la etiqueta del mes."""
+    return [{**mes, 'fotovoltaica': dict(inst), 'inicio': mes.get('inicio') or inicio_desde_etiqueta(mes['mes'], anio)}
+            for mes in datos_facturas]
@@ -0,0 +1,240 @@
+import io
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# --- CAPA DE RENDERIZADO DE GRÁFICAS ---
+# Las gráficas se dibujan con la API orientada a objetos de matplotlib (Figure + backend Agg,
+# sin pyplot: no se acumulan figuras abiertas y se puede dibujar desde otro hilo) y se
+# devuelven como bytes PNG.
+#  - Diezmado: una serie larga (un año cuarto-horario son 35.040 puntos) se reduce a la
+#    envolvente mínimo/máximo de cada cubeta de píxel antes de dibujar; los picos se conservan.
+#  - Caché: los PNG se guardan en una LRU en memoria con clave = huella de los datos + ventana
+#    + parámetros de dibujo, así que un rerun de Streamlit con los mismos datos no redibuja nada.
+#  - Segundo plano: en consola las imágenes se generan en un hilo aparte (en_segundo_plano) y el
+#    script imprime los resultados numéricos sin esperarlas; esperar_graficas() las recoge al final.
+
+PIXELES_ANCHO = 1000   # Ancho útil de la figura (10 pulgadas a 100 ppp): una cubeta por píxel
+DPI = 100
+TAMANO_CACHE_GRAFICAS = 64
+
+_cache_png = OrderedDict()
+_cerrojo = threading.Lock()
+_ejecutor = None
+_pendientes = []
+
+
+def diezmar(x, y, n_cubos=PIXELES_ANCHO):
+    """
+    Envolvente mínimo/máximo por cubeta: (x, y) con como mucho 2 * n_cubos puntos, en orden
+    temporal (en cada cubeta el mínimo y el máximo en el orden en que aparecen).
+    Series cortas se devuelven tal cual.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= 2 * n_cubos:
+        return x, y
+    tamano = -(-n // n_cubos)
+    filas = -(-n // tamano)
+    relleno = np.full(filas * tamano, np.nan)
+    relleno[:n] = y
+    bloques = relleno.reshape(filas, tamano)
+    desplazamiento = np.arange(filas)[:, None] * tamano
+    indices = np.sort(np.stack([np.nanargmin(bloques, axis=1), np.nanargmax(bloques, axis=1)], axis=1), axis=1)
+    indices = (indices + desplazamiento).ravel()
+    return x[indices], y[indices]
+
+
+def huella(*partes):
+    """Huella (hex) de arrays y valores sueltos para las claves de la caché."""
+    resumen = hashlib.blake2b(digest_size=16)
+    for parte in partes:
+        if isinstance(parte, np.ndarray):
+            resumen.update(f'{parte.dtype}{parte.shape}'.encode())
+            resumen.update(np.ascontiguousarray(parte).tobytes())
+        else:
+            resumen.update(repr(parte).encode())
+        resumen.update(b'|')
+    return resumen.hexdigest()
+
+
+def png_en_cache(clave, dibujar):
+    """PNG de la caché LRU o, si no está, dibujar() (fuera del cerrojo) y guardarlo."""
+    with _cerrojo:
+        if clave in _cache_png:
+            _cache_png.move_to_end(clave)
+            return _cache_png[clave]
+    png = dibujar()
+    with _cerrojo:
+        _cache_png[clave] = png
+        while len(_cache_png) > TAMANO_CACHE_GRAFICAS:
+            _cache_png.popitem(last=False)
+    return png
+
+
+def vaciar_cache():
+    """Descarta todos los PNG cacheados."""
+    with _cerrojo:
+        _cache_png.clear()
+
+
+def _figura(ancho=10, alto=4):
+    from matplotlib.figure import Figure
+    return Figure(figsize=(ancho, alto), dpi=DPI)
+
+
+def _a_png(figura):
+    salida = io.BytesIO()
+    figura.savefig(salida, format='png')
+    return salida.getvalue()
+
+
+def png_operacion(horas, soc, precio, capacidad):
+    """
+    Detalle de operación: SOC (eje izquierdo) y precio de compra (eje derecho, con relleno)
+    sobre las horas indicadas. Series largas se diezman a la envolvente por píxel.
+    """
+    horas = np.asarray(horas)
+    soc = np.asarray(soc)
+    precio = np.asarray(precio)
+
+    def dibujar():
+        figura = _figura()
+        ax1 = figura.subplots()
+        ax1.set_xlabel('Hora Simulada')
+        ax1.set_ylabel('Carga Batería (kWh)', color='green')
+        x_soc, y_soc = diezmar(horas, soc)
+        linea1 = ax1.plot(x_soc, y_soc, color='green', label='SOC Batería (kWh)', linewidth=2 if len(soc) <= 200 else 1)
+        ax1.tick_params(axis='y', labelcolor='green')
+        ax1.set_ylim(0, capacidad * 1.1)
+
+        ax2 = ax1.twinx()
+        ax2.set_ylabel('Precio Luz (€/kWh)', color='red')
+        x_precio, y_precio = diezmar(horas, precio)
+        linea2 = ax2.plot(x_precio, y_precio, color='red', linestyle='--', label='Precio Luz', alpha=0.5)
+        ax2.tick_params(axis='y', labelcolor='red')
+        ax2.fill_between(x_precio, 0, y_precio, color='red', alpha=0.1)
+
+        lineas = linea1 + linea2
+        ax1.legend(lineas, [l.get_label() for l in lineas], loc='upper left')
+        return _a_png(figura)
+
+    return png_en_cache(huella('operacion', horas, soc, precio, capacidad), dibujar)
+
+
+def png_ahorro_mensual(meses, ahorros, titulo):
+    """Barras del ahorro por mes con la etiqueta del valor encima de cada barra."""
+    meses = [str(m) for m in meses]
+    ahorros = [float(a) for a in ahorros]
+
+    def dibujar():
+        figura = _figura(10, 6)
+        ax = figura.subplots()
+        ax.bar(meses, ahorros, color='#4CAF50', edgecolor='black')
+        ax.set_title(titulo, fontsize=14)
+        ax.set_ylabel('Ahorro Neto (€)', fontsize=12)
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
+        for i, v in enumerate(ahorros):
+            ax.text(i, v + 1, f"{v:.0f}€", ha='center', fontweight='bold')
+        return _a_png(figura)
+
+    return png_en_cache(huella('ahorro_mensual', meses, ahorros, titulo), dibujar)
+
+
+def png_barrido(capacidades, potencias, retorno_anios, cap_optima, pot_optima, retorno_maximo=30):
+    """Mapa de calor del retorno (años, recortado a retorno_maximo) por capacidad y potencia, con el óptimo marcado."""
+    capacidades = np.asarray(capacidades)
+    potencias = np.asarray(potencias)
+    retorno = np.clip(np.asarray(retorno_anios, dtype=float), 0, retorno_maximo)
+
+    def dibujar():
+        figura = _figura()
+        ax = figura.subplots()
+        imagen = ax.imshow(retorno, aspect='auto', origin='lower', cmap='RdYlGn_r',
+                           extent=[potencias[0], potencias[-1], capacidades[0], capacidades[-1]])
+        ax.set_xlabel('Potencia Inversor (kW)')
+        ax.set_ylabel('Capacidad Batería (kWh)')
+        ax.plot(pot_optima, cap_optima, 'k*', markersize=14)
+        figura.colorbar(imagen, ax=ax, label=f'Retorno (años, máx. {retorno_maximo})')
+        return _a_png(figura)
+
+    return png_en_cache(huella('barrido', capacidades, potencias, retorno, cap_optima, pot_optima), dibujar)
+
+
+def png_abanico(abanico):
+    """Abanico del ahorro acumulado por mes: banda P10-P90 y mediana (filas de abanico: P10, P50, P90)."""
+    abanico = np.asarray(abanico, dtype=float)
+
+    def dibujar():
+        figura = _figura()
+        ax = figura.subplots()
+        meses = np.arange(1, abanico.shape[1] + 1)
+        p10, p50, p90 = abanico
+        ax.fill_between(meses, p10, p90, color='#4CAF50', alpha=0.25, label='P10 - P90')
+        ax.plot(meses, p50, color='#2E7D32', linewidth=2, label='P50 (mediana)')
+        ax.set_xlabel('Mes del año')
+        ax.set_ylabel('Ahorro acumulado (€)')
+        ax.set_xticks(meses)
+        ax.legend(loc='upper left')
+        return _a_png(figura)
+
+    return png_en_cache(huella('abanico', abanico), dibujar)
+
+
+def png_ciclo_vida(anios, flujo_acumulado, salud_pct, salud_fin_vida):
+    """Flujo descontado acumulado por año (barras verdes/rojas) y salud de la batería (eje derecho, %)."""
+    anios = np.asarray(anios)
+    flujo_acumulado = np.asarray(flujo_acumulado, dtype=float)
+    salud_pct = np.asarray(salud_pct, dtype=float)
+
+    def dibujar():
+        figura = _figura()
+        ax = figura.subplots()
+        colores = np.where(flujo_acumulado >= 0, '#4CAF50', '#E57373')
+        ax.bar(anios, flujo_acumulado, color=colores)
+        ax.axhline(0, color='black', linewidth=0.8)
+        ax.set_xlabel('Año')
+        ax.set_ylabel('Flujo descontado acumulado (€)')
+        ax_salud = ax.twinx()
+        ax_salud.plot(anios, salud_pct, color='#1565C0', marker='o', label='Salud batería (%)')
+        ax_salud.axhline(100 * salud_fin_vida, color='#1565C0', linestyle=':', alpha=0.6)
+        ax_salud.set_ylabel('Capacidad útil (%)', color='#1565C0')
+        ax_salud.set_ylim(0, 105)
+        return _a_png(figura)
+
+    return png_en_cache(huella('ciclo_vida', anios, flujo_acumulado, salud_pct, salud_fin_vida), dibujar)
+
+
+def guardar_png(ruta, dibujar):
+    """Escribe en ruta el PNG que devuelve dibujar(). Devuelve (ruta, segundos)."""
+    inicio = time.perf_counter()
+    png = dibujar()
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    with open(ruta, 'wb') as f:
+        f.write(png)
+    return ruta, time.perf_counter() - inicio
+
+
+def en_segundo_plano(funcion, *args, **kwargs):
+    """Encola funcion(*args, **kwargs) en el hilo de gráficas y devuelve su Future."""
+    global _ejecutor
+    if _ejecutor is None:
+        _ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='graficas')
+    futuro = _ejecutor.submit(funcion, *args, **kwargs)
+    _pendientes.append(futuro)
+    return futuro
+
+
+def esperar_graficas():
+    """Espera a todas las gráficas encoladas y devuelve sus resultados (en orden de encolado)."""
+    resultados = [futuro.result() for futuro in _pendientes]
+    _pendientes.clear()
+    return resultados
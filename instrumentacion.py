@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# --- INSTRUMENTACIÓN POR ETAPAS ---
+# Tiempo de reloj, pasos simulados y (opcional) pico de memoria de cada etapa de una ejecución:
+# generación de perfiles, despacho, montaje de tablas, gráficas...
+#
+#   medicion = iniciar(memoria=True, ruta_perfil='perfil.prof')
+#   with etapa('despacho', pasos=720):
+#       ...
+#   resumen = finalizar(medicion)   # dict serializable a JSON
+#
+# La medición activa vive en una ContextVar: los módulos marcan sus etapas con etapa() sin
+# recibir nada por argumento y, si no hay medición activa, etapa() no hace nada (coste de una
+# consulta). Las etapas se pueden anidar; el tiempo de una etapa incluye el de sus hijas.
+# El pico de memoria usa tracemalloc, que ralentiza mucho el bucle escalar del motor: solo se
+# activa con memoria=True. cProfile, igual, solo con ruta_perfil (volcado .prof para pstats/snakeviz).
+
+LINEAS_PERFIL = 25  # Funciones del resumen de texto de cProfile
+
+_activa = ContextVar('medicion_activa', default=None)
+
+
+def iniciar(memoria=False, ruta_perfil=None):
+    """Empieza una medición y la deja activa para las etapas de este hilo/contexto."""
+    medicion = {
+        'etapas': {},
+        'orden': [],
+        'pila': [],
+        'memoria': memoria,
+        'tracemalloc_propio': False,
+        'ruta_perfil': ruta_perfil,
+        'perfil': None,
+        'inicio': time.perf_counter(),
+    }
+    if memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        medicion['tracemalloc_propio'] = True
+    if ruta_perfil:
+        import cProfile
+        medicion['perfil'] = cProfile.Profile()
+        medicion['perfil'].enable()
+    medicion['token'] = _activa.set(medicion)
+    return medicion
+
+
+def finalizar(medicion):
+    """
+    Cierra la medición y devuelve el resumen:
+    {'total_s', 'etapas': [{'etapa', 'segundos', 'porcentaje', 'llamadas', 'pasos',
+    'pasos_por_segundo', 'pico_memoria_mb'}, ...], 'rss_max_mb', 'perfil', 'perfil_texto'}.
+    """
+    total = time.perf_counter() - medicion['inicio']
+    _activa.reset(medicion['token'])
+    ruta_perfil = None
+    texto_perfil = None
+    if medicion['perfil'] is not None:
+        medicion['perfil'].disable()
+        ruta_perfil = medicion['ruta_perfil']
+        carpeta = os.path.dirname(ruta_perfil)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        medicion['perfil'].dump_stats(ruta_perfil)
+        texto_perfil = texto_cprofile(ruta_perfil)
+    if medicion['tracemalloc_propio']:
+        tracemalloc.stop()
+
+    etapas = []
+    for nombre in medicion['orden']:
+        datos = medicion['etapas'][nombre]
+        segundos = datos['segundos']
+        etapas.append({
+            'etapa': nombre,
+            'segundos': segundos,
+            'porcentaje': 100 * segundos / total if total > 0 else 0.0,
+            'llamadas': datos['llamadas'],
+            'pasos': datos['pasos'],
+            'pasos_por_segundo': datos['pasos'] / segundos if datos['pasos'] and segundos > 0 else None,
+            'pico_memoria_mb': datos['pico'] / 2**20 if medicion['memoria'] else None,
+        })
+    return {
+        'total_s': total,
+        'etapas': etapas,
+        'rss_max_mb': rss_max_mb(),
+        'perfil': ruta_perfil,
+        'perfil_texto': texto_perfil,
+    }
+
+
+@contextmanager
+def medir(memoria=False, ruta_perfil=None):
+    """iniciar/finalizar como bloque with: el resumen queda en medicion['resumen']."""
+    medicion = iniciar(memoria, ruta_perfil)
+    try:
+        yield medicion
+    finally:
+        medicion['resumen'] = finalizar(medicion)
+
+
+@contextmanager
+def etapa(nombre, pasos=0):
+    """Marca una etapa de la medición activa (acumula si se repite, p.ej. una vez por mes)."""
+    medicion = _activa.get()
+    if medicion is None:
+        yield
+        return
+
+    pila = medicion['pila']
+    memoria = medicion['memoria'] and tracemalloc.is_tracing()
+    marco = {'pico_hijas': 0, 'base': 0}
+    if memoria:
+        actual, pico = tracemalloc.get_traced_memory()
+        if pila:
+            # El pico del padre hasta aquí se perdería con reset_peak: lo guardamos en su marco
+            pila[-1]['pico_hijas'] = max(pila[-1]['pico_hijas'], pico)
+        marco['base'] = actual
+        tracemalloc.reset_peak()
+    pila.append(marco)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        pila.pop()
+        pico_etapa = 0
+        if memoria:
+            pico_absoluto = max(tracemalloc.get_traced_memory()[1], marco['pico_hijas'])
+            pico_etapa = pico_absoluto - marco['base']
+            if pila:
+                pila[-1]['pico_hijas'] = max(pila[-1]['pico_hijas'], pico_absoluto)
+        if nombre not in medicion['etapas']:
+            medicion['etapas'][nombre] = {'segundos': 0.0, 'llamadas': 0, 'pasos': 0, 'pico': 0}
+            medicion['orden'].append(nombre)
+        datos = medicion['etapas'][nombre]
+        datos['segundos'] += segundos
+        datos['llamadas'] += 1
+        datos['pasos'] += int(pasos)
+        datos['pico'] = max(datos['pico'], pico_etapa)
+
+
+def rss_max_mb():
+    """Pico de memoria residente del proceso (MB); None si el sistema no lo expone (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo / 2**20 if sys.platform == 'darwin' else maximo / 2**10  # bytes en macOS, KB en Linux
+
+
+def texto_cprofile(ruta_perfil, lineas=LINEAS_PERFIL):
+    """Las funciones con más tiempo acumulado de un volcado de cProfile, como texto."""
+    import io
+    import pstats
+    salida = io.StringIO()
+    pstats.Stats(ruta_perfil, stream=salida).sort_stats('cumulative').print_stats(lineas)
+    return salida.getvalue()
+
+
+def informe(resumen):
+    """Tabla de texto del resumen para la consola."""
+    lineas = [f"{'Etapa':<22}{'Tiempo (ms)':>12}{'%':>7}{'Llamadas':>10}{'Pasos':>10}{'Pasos/s':>12}{'Pico MB':>9}"]
+    for e in resumen['etapas']:
+        pasos_s = f"{e['pasos_por_segundo']:,.0f}" if e['pasos_por_segundo'] else '-'
+        pico = f"{e['pico_memoria_mb']:.1f}" if e['pico_memoria_mb'] is not None else '-'
+        lineas.append(f"{e['etapa']:<22}{e['segundos'] * 1000:>12.1f}{e['porcentaje']:>7.1f}{e['llamadas']:>10}"
+                      f"{e['pasos']:>10,}{pasos_s:>12}{pico:>9}")
+    lineas.append(f"{'TOTAL':<22}{resumen['total_s'] * 1000:>12.1f}")
+    if resumen['rss_max_mb'] is not None:
+        lineas.append(f"Memoria residente máxima del proceso: {resumen['rss_max_mb']:.0f} MB")
+    if resumen['perfil']:
+        lineas.append(f"Perfil cProfile: {resumen['perfil']} (python -m pstats {resumen['perfil']})")
+    return "\n".join(lineas)
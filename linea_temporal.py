@@ -0,0 +1,236 @@
+import os
+import json
+import hashlib
+import calendar
+from datetime import date
+
+import numpy as np
+
+from perfiles import SECTOR_POR_DEFECTO
+from tarifas import inicio_desde_etiqueta
+from motor import entradas_mes, despachar
+from traza import crear_traza, ventana
+from instrumentacion import etapa
+
+# --- LÍNEA TEMPORAL CONTINUA ENTRE FACTURAS ---
+# En lugar de simular cada factura como un bloque independiente de 30 días que empieza con la
+# batería vacía, todas las facturas se encadenan en una sola serie con su duración real de
+# calendario y el motor la recorre de una vez: el SOC pasa de un periodo al siguiente y el
+# despacho óptimo ve también lo que viene después del cambio de mes.
+#
+# Cada periodo deja un punto de control: su clave, el SOC con el que empieza y su resultado.
+# La clave encadena la del periodo anterior con los datos del periodo y los parámetros de la
+# batería, así que al editar el periodo N (o cambiar algo que le afecte) las claves coinciden
+# hasta N-1 y la siguiente ejecución reanuda desde el SOC guardado al inicio de N en lugar de
+# repetir todo el año. Con la estrategia 'optima' los periodos anteriores a N se dan por ya
+# operados: no se reoptimizan con los datos nuevos.
+
+DIAS_POR_DEFECTO = 30  # Periodos sin fecha ni duración conocidas
+
+
+def fecha_inicio(mes, anio=None):
+    """Fecha de inicio del periodo: 'inicio' o, con anio, la sacada de la etiqueta. None si no hay."""
+    if mes.get('inicio'):
+        return date.fromisoformat(str(mes['inicio'])[:10])
+    if anio is None:
+        return None
+    try:
+        return date.fromisoformat(inicio_desde_etiqueta(mes['mes'], anio))
+    except ValueError:
+        return None  # Etiqueta que no empieza por un mes ('1', 'Factura 3'...)
+
+
+def dias_periodos(meses, anio=None):
+    """
+    Duración real (días) de cada periodo: 'dias' si el mes la trae; si no, hasta el inicio del
+    periodo siguiente; si es el último (o el siguiente no tiene fecha), los días del mes
+    natural en que empieza. Sin ninguna fecha, DIAS_POR_DEFECTO.
+    """
+    inicios = [fecha_inicio(mes, anio) for mes in meses]
+    dias = []
+    for i, mes in enumerate(meses):
+        siguiente = inicios[i + 1] if i + 1 < len(meses) else None
+        if mes.get('dias'):
+            dias.append(int(mes['dias']))
+        elif inicios[i] and siguiente and siguiente > inicios[i]:
+            dias.append((siguiente - inicios[i]).days)
+        elif inicios[i]:
+            dias.append(calendar.monthrange(inicios[i].year, inicios[i].month)[1])
+        else:
+            dias.append(DIAS_POR_DEFECTO)
+    return dias
+
+
+def fechar_periodos(meses, primer_inicio):
+    """
+    Copia de los periodos con 'inicio' en meses naturales consecutivos desde primer_inicio
+    (date o 'aaaa-mm-dd') para los que no lo traen (p.ej. filas numeradas de la app).
+    """
+    primero = date.fromisoformat(str(primer_inicio)[:10])
+    fechados = []
+    for i, mes in enumerate(meses):
+        anio, indice = divmod(primero.month - 1 + i, 12)
+        dia = min(primero.day, calendar.monthrange(primero.year + anio, indice + 1)[1])
+        fechados.append({**mes, 'inicio': mes.get('inicio') or date(primero.year + anio, indice + 1, dia).isoformat()})
+    return fechados
+
+
+def _valor_json(valor):
+    return valor.tolist() if hasattr(valor, 'tolist') else str(valor)
+
+
+def claves_puntos_control(meses, dias, parametros):
+    """
+    Clave de cada periodo: huella de la clave anterior + datos del periodo (sin la etiqueta) +
+    su duración + parámetros de la simulación. Cambiar un periodo cambia su clave y las siguientes.
+    """
+    claves = []
+    anterior = ''
+    for mes, n_dias in zip(meses, dias):
+        datos = {k: v for k, v in mes.items() if k != 'mes'}
+        contenido = json.dumps([anterior, datos, n_dias, parametros], sort_keys=True, default=_valor_json)
+        anterior = hashlib.blake2b(contenido.encode(), digest_size=16).hexdigest()
+        claves.append(anterior)
+    return claves
+
+
+def _tramos(valores):
+    """Rangos [a, b) de posiciones consecutivas con el mismo valor."""
+    tramos = []
+    inicio = 0
+    for i in range(1, len(valores) + 1):
+        if i == len(valores) or valores[i] != valores[inicio]:
+            tramos.append((inicio, i))
+            inicio = i
+    return tramos
+
+
+def _despachar_continuo(entradas, pasos_inicio, precios_venta, soc_inicial, estrategia, cap_bat, pot_bat,
+                        eficiencia, horas_paso, traza):
+    """
+    Una llamada al motor por cada tramo de periodos con el mismo precio de venta del excedente
+    (el motor lo recibe como escalar; normalmente es un solo tramo). Devuelve (soc, balance) por paso.
+    """
+    soc_hist, balance_hist = [], []
+    soc = soc_inicial
+    for a, b in _tramos(precios_venta):
+        corte = slice(pasos_inicio[a] - pasos_inicio[0], pasos_inicio[b] - pasos_inicio[0])
+        resultado = despachar(
+            entradas['consumo'][corte], entradas['solar'][corte], entradas['precio'][corte],
+            entradas['es_valle'][corte], cap_bat, pot_bat, eficiencia, precios_venta[a],
+            precio_punta=entradas['precio_punta'][corte], soc_inicial=soc, horas_paso=horas_paso,
+            estrategia=estrategia, traza=None if traza is None else traza[:, corte]
+        )
+        soc = resultado['soc_final']
+        soc_hist.append(resultado['soc'])
+        balance_hist.append(resultado['balance'])
+    return np.concatenate(soc_hist), np.concatenate(balance_hist)
+
+
+def simular_linea_temporal(meses, cap_bat=100, pot_bat=50, eficiencia=0.90, sector=SECTOR_POR_DEFECTO,
+                           estrategia='heuristica', anio=None, pasos_por_hora=1, anterior=None, traza=False):
+    """
+    Simula todas las facturas como una única línea temporal (duraciones de dias_periodos, SOC
+    arrastrado entre periodos). anterior: resultado de una ejecución previa (o de
+    cargar_puntos_control); se reanuda desde el primer periodo cuya clave ha cambiado.
+    Con traza=True devuelve también el búfer (5, pasos totales) de traza.py; los pasos de los
+    periodos reutilizados se copian de anterior['traza'] si la trae.
+
+    Devuelve un dict con 'puntos_control' (uno por periodo: 'mes', 'clave', 'dias',
+    'paso_inicio', 'n_pasos', 'soc_inicial', 'soc_final', 'ahorro' y lo mismo de la heurística),
+    'ahorro_total', 'ahorro_heuristica_total', 'soc_final', 'reanudado_desde' (índice del
+    primer periodo simulado), 'pasos_simulados', 'pasos_totales' y 'traza'.
+    """
+    horas_paso = 1 / pasos_por_hora
+    dias = dias_periodos(meses, anio)
+    n_pasos = [d * 24 * pasos_por_hora for d in dias]
+    pasos_inicio = np.concatenate(([0], np.cumsum(n_pasos))).astype(int).tolist()
+    claves = claves_puntos_control(meses, dias, [cap_bat, pot_bat, eficiencia, sector, estrategia, pasos_por_hora])
+
+    previos = (anterior or {}).get('puntos_control') or []
+    desde = 0
+    while desde < min(len(previos), len(meses)) and previos[desde]['clave'] == claves[desde]:
+        desde += 1
+    puntos = [dict(p) for p in previos[:desde]]
+
+    buffer = None
+    if traza:
+        buffer = crear_traza(pasos_inicio[-1])
+        traza_previa = (anterior or {}).get('traza')
+        if traza_previa is not None and desde:
+            buffer[:, :pasos_inicio[desde]] = traza_previa[:, :pasos_inicio[desde]]
+
+    if desde < len(meses):
+        pendientes = range(desde, len(meses))
+        columnas = {'consumo': [], 'solar': [], 'precio': [], 'es_valle': [], 'precio_punta': []}
+        for i in pendientes:
+            _, consumo, solar, precio, es_valle, precio_punta = entradas_mes(meses[i], sector, dias[i], pasos_por_hora)
+            columnas['consumo'].append(consumo)
+            columnas['solar'].append(solar)
+            columnas['precio'].append(precio)
+            columnas['es_valle'].append(es_valle)
+            columnas['precio_punta'].append(np.broadcast_to(np.asarray(precio_punta, dtype=float), (n_pasos[i],)))
+        entradas = {k: np.concatenate(v) for k, v in columnas.items()}
+        precios_venta = [float(meses[i]['precio_venta_excedente']) for i in pendientes]
+        inicios = pasos_inicio[desde:]
+        vista = None if buffer is None else ventana(buffer, pasos_inicio[desde], pasos_inicio[-1] - pasos_inicio[desde])
+
+        soc_0 = puntos[-1]['soc_final'] if puntos else 0.0
+        soc_0_heuristica = puntos[-1]['soc_final_heuristica'] if puntos else 0.0
+        pasos_pendientes = pasos_inicio[-1] - pasos_inicio[desde]
+        with etapa('despacho_heuristica', pasos_pendientes):
+            soc_h, balance_h = _despachar_continuo(entradas, inicios, precios_venta, soc_0_heuristica, 'heuristica',
+                                                   cap_bat, pot_bat, eficiencia, horas_paso,
+                                                   vista if estrategia == 'heuristica' else None)
+        if estrategia == 'heuristica':
+            soc, balance = soc_h, balance_h
+        else:
+            with etapa(f'despacho_{estrategia}', pasos_pendientes):
+                soc, balance = _despachar_continuo(entradas, inicios, precios_venta, soc_0, estrategia,
+                                                   cap_bat, pot_bat, eficiencia, horas_paso, vista)
+
+        for i in pendientes:
+            a, b = pasos_inicio[i] - pasos_inicio[desde], pasos_inicio[i + 1] - pasos_inicio[desde]
+            puntos.append({
+                'mes': meses[i]['mes'],
+                'clave': claves[i],
+                'dias': dias[i],
+                'paso_inicio': pasos_inicio[i],
+                'n_pasos': n_pasos[i],
+                'soc_inicial': soc_0,
+                'soc_final': float(soc[b - 1]) if b > a else soc_0,
+                'ahorro': float(balance[a:b].sum()),
+                'soc_inicial_heuristica': soc_0_heuristica,
+                'soc_final_heuristica': float(soc_h[b - 1]) if b > a else soc_0_heuristica,
+                'ahorro_heuristica': float(balance_h[a:b].sum()),
+            })
+            soc_0, soc_0_heuristica = puntos[-1]['soc_final'], puntos[-1]['soc_final_heuristica']
+
+    return {
+        'puntos_control': puntos,
+        'ahorro_total': sum(p['ahorro'] for p in puntos),
+        'ahorro_heuristica_total': sum(p['ahorro_heuristica'] for p in puntos),
+        'soc_final': puntos[-1]['soc_final'] if puntos else 0.0,
+        'reanudado_desde': desde,
+        'pasos_simulados': pasos_inicio[-1] - pasos_inicio[desde],
+        'pasos_totales': pasos_inicio[-1],
+        'traza': buffer,
+    }
+
+
+def guardar_puntos_control(ruta, resultado):
+    """Guarda en JSON los puntos de control de un resultado de simular_linea_temporal."""
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump({'puntos_control': resultado['puntos_control']}, f, ensure_ascii=False, indent=2,
+                  default=_valor_json)
+
+
+def cargar_puntos_control(ruta):
+    """Puntos de control guardados (listo para el argumento anterior); None si el fichero no existe."""
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
@@ -1,5 +1,4 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 
 def simular_caso_real(datos_mensuales, cap_bat_kwh=100, pot_bat_kw=50, eficiencia=0.90):
     """
@@ -78,8 +77,8 @@ def simular_caso_real(datos_mensuales, cap_bat_kwh=100, pot_bat_kw=50, eficienci
     print("-" * 50)
     print(f"AHORRO TOTAL (4 Meses analizados): {ahorro_total_periodo:,.2f} €")
     
-    # Proyección Anual (Extrapolación simple x3)
-    proyeccion = ahorro_total_periodo * 3
+    # Proyección Anual (extrapolación simple a 12 meses; ciclovida.py para el análisis plurianual)
+    proyeccion = ahorro_total_periodo * 12 / len(datos_mensuales)
     print(f"PROYECCIÓN AHORRO ANUAL ESTIMADO:  {proyeccion:,.2f} €")
     print("-" * 50)
     
@@ -92,6 +91,7 @@ def simular_caso_real(datos_mensuales, cap_bat_kwh=100, pot_bat_kw=50, eficienci
     print(f"Tiempo de Amortización (años):     {amortizacion_years:.1f} años")
     print("\nNOTA: El ahorro es bajo porque Repsol te paga muy bien los excedentes (0.10€)")
     print("y compras la luz relativamente barata (promedio 0.14€). El margen es pequeño.")
+    return ahorro_total_periodo
 
 # --- DATOS CARGADOS MANUALMENTE DE LAS FACTURAS ---
 datos_reales = [
@@ -130,4 +130,5 @@ datos_reales = [
 ]
 
 # Ejecutar
-simular_caso_real(datos_reales, cap_bat_kwh=100)
\ No newline at end of file
+if __name__ == "__main__":
+    simular_caso_real(datos_reales, cap_bat_kwh=100)
@@ -0,0 +1,188 @@
+import numpy as np
+
+from motor import simular_despacho_lote
+from perfiles import plantilla_sector, plantilla_solar, SECTOR_POR_DEFECTO
+from curvas import hora_de_marcas
+from tarifas import HORA_FIN_VALLE
+
+# --- INCERTIDUMBRE MONTE CARLO (AHORRO Y RETORNO P10 / P50 / P90) ---
+# En vez de un único retorno, se sortean miles de años posibles y se simulan todos a la vez
+# con el motor por lotes (una columna por escenario). El tiempo se recorre mes a mes:
+# cada mes es un array (pasos, escenarios) y el estado SOC es (escenarios,), así que el coste
+# es ~12 x 720 pasos de operaciones NumPy sobre vectores, no 5.000 llamadas al bucle mensual.
+#
+# Dos formas de generar escenarios:
+#   - montecarlo_facturas: cada mes del año se sortea entre las facturas (bootstrap) y se
+#     perturban consumo, excedente y precios con factores lognormales de media 1.
+#   - montecarlo_curva: con una curva real se sortean días completos (bootstrap de días)
+#     y se perturban los precios.
+# Los precios son siempre los dos tramos de las facturas (valle / punta, tarifas.HORA_FIN_VALLE):
+# la perturbación es un factor sobre cada tramo y los días sorteados pierden su fecha, así que
+# el calendario 3.0TD y las series indexadas quedan fuera de este modelo a propósito.
+
+N_ESCENARIOS = 5000
+PERCENTILES = (10, 50, 90)
+MESES_ANIO = 12
+DIAS_MES = 30
+RETORNO_SIN_AHORRO = 999  # Mismo valor que usan los scripts cuando el ahorro no es positivo
+
+# Desviación relativa (1 sigma) de cada magnitud respecto al valor de la factura
+DISPERSION_POR_DEFECTO = {
+    'consumo': 0.10,
+    'excedente': 0.20,
+    'precio': 0.20,
+    'precio_venta': 0.25,
+}
+
+
+def _factores(rng, n, sigma):
+    """Factores lognormales de media 1 (sigma = desviación relativa aproximada)."""
+    if sigma <= 0:
+        return np.ones(n)
+    return np.exp(rng.standard_normal(n) * sigma - 0.5 * sigma * sigma)
+
+
+def _dispersion(dispersion):
+    return {**DISPERSION_POR_DEFECTO, **(dispersion or {})}
+
+
+def resumen_percentiles(ahorro_anual, inversion, percentiles=PERCENTILES):
+    """
+    Percentiles de ahorro anual y retorno de la inversión.
+    El retorno se calcula escenario a escenario, así que su P10 es el caso optimista
+    (corresponde aproximadamente al P90 de ahorro).
+    Devuelve {p: {'ahorro_anual': ..., 'retorno_anios': ...}}.
+    """
+    retorno = np.where(ahorro_anual > 0, inversion / np.where(ahorro_anual > 0, ahorro_anual, 1),
+                       RETORNO_SIN_AHORRO)
+    ahorro_p = np.percentile(ahorro_anual, percentiles)
+    retorno_p = np.percentile(retorno, percentiles)
+    return {p: {'ahorro_anual': float(a), 'retorno_anios': float(r)}
+            for p, a, r in zip(percentiles, ahorro_p, retorno_p)}
+
+
+def _resultado(ahorro_mensual, inversion, n_escenarios, semilla):
+    """Empaqueta el resultado común de los dos modos."""
+    ahorro_anual = ahorro_mensual.sum(axis=0)
+    acumulado = np.cumsum(ahorro_mensual, axis=0)
+    return {
+        'n_escenarios': n_escenarios,
+        'semilla': semilla,
+        'ahorro_mensual': ahorro_mensual,
+        'ahorro_anual': ahorro_anual,
+        'percentiles': resumen_percentiles(ahorro_anual, inversion),
+        # Abanico: percentiles del ahorro acumulado mes a mes, forma (len(PERCENTILES), meses)
+        'abanico': np.percentile(acumulado, PERCENTILES, axis=1),
+    }
+
+
+def montecarlo_facturas(datos_facturas, n_escenarios=N_ESCENARIOS, cap_bat=100, pot_bat=50, eficiencia=0.90,
+                        sector=SECTOR_POR_DEFECTO, inversion=30000, dispersion=None, semilla=None,
+                        meses_anio=MESES_ANIO):
+    """
+    Monte Carlo sobre las facturas (formato de datos_reales_cliente).
+
+    Para cada escenario y cada mes del año se elige una factura al azar y se multiplican su
+    consumo, excedente, precios valle/punta y precio de venta por factores lognormales
+    (dispersion sobrescribe DISPERSION_POR_DEFECTO). Valle y punta comparten factor: el
+    mercado sube o baja entero, no solo un periodo.
+    Igual que simular_arbitraje_y_solar, cada mes parte con la batería vacía.
+
+    Devuelve un dict con 'ahorro_mensual' (meses, N), 'ahorro_anual' (N,),
+    'percentiles' (ver resumen_percentiles) y 'abanico' para el gráfico.
+    """
+    dispersion = _dispersion(dispersion)
+    rng = np.random.default_rng(semilla)
+
+    consumo_f = np.array([m['consumo_total_kwh'] for m in datos_facturas], dtype=float)
+    excedente_f = np.array([m['excedente_total_kwh'] for m in datos_facturas], dtype=float)
+    valle_f = np.array([m['precio_valle'] for m in datos_facturas], dtype=float)
+    punta_f = np.array([m['precio_punta'] for m in datos_facturas], dtype=float)
+    venta_f = np.array([m['precio_venta_excedente'] for m in datos_facturas], dtype=float)
+
+    plantilla = plantilla_sector(sector, DIAS_MES)
+    forma_consumo = plantilla.forma[:, None]
+    forma_solar = plantilla_solar(DIAS_MES).forma[:, None]
+    es_valle = plantilla.hora_dia < HORA_FIN_VALLE
+    valle_col = es_valle[:, None]
+
+    ahorro_mensual = np.empty((meses_anio, n_escenarios))
+    for i in range(meses_anio):
+        factura = rng.integers(len(datos_facturas), size=n_escenarios)
+        f_precio = _factores(rng, n_escenarios, dispersion['precio'])
+        precio_valle = valle_f[factura] * f_precio
+        precio_punta = punta_f[factura] * f_precio
+
+        consumo = forma_consumo * (consumo_f[factura] * _factores(rng, n_escenarios, dispersion['consumo']))
+        solar = forma_solar * (excedente_f[factura] * _factores(rng, n_escenarios, dispersion['excedente']))
+        precio = np.where(valle_col, precio_valle, precio_punta)
+
+        resultado = simular_despacho_lote(
+            consumo, solar, precio, es_valle, cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+            precio_venta_excedente=venta_f[factura] * _factores(rng, n_escenarios, dispersion['precio_venta']),
+            precio_punta=precio_punta[None, :]
+        )
+        ahorro_mensual[i] = resultado['ahorro_total']
+
+    return _resultado(ahorro_mensual, inversion, n_escenarios, semilla)
+
+
+def montecarlo_curva(curva, precio_valle, precio_punta, precio_venta_excedente=0.10, n_escenarios=N_ESCENARIOS,
+                     cap_bat=100, pot_bat=50, eficiencia=0.90, inversion=30000, contador=0, dispersion=None,
+                     semilla=None, meses_anio=MESES_ANIO):
+    """
+    Monte Carlo con bootstrap de días reales de una curva (salida de curvas.cargar_curva).
+
+    Cada escenario es un año de meses_anio x 30 días sorteados con reemplazo entre los días
+    completos de la curva (consumo y vertido del mismo día van juntos). Los precios se
+    perturban con los factores lognormales de dispersion['precio'] / ['precio_venta'].
+    Los días con huecos (NaN en la curva) no entran en el sorteo; si ninguno está completo,
+    los huecos cuentan como 0 kWh. 'dias_descartados' dice cuántos se han quitado.
+    """
+    dispersion = _dispersion(dispersion)
+    rng = np.random.default_rng(semilla)
+
+    pasos_dia = 24 * curva['pasos_por_hora']
+    hora = hora_de_marcas(curva['tiempo'])
+    inicio = int(np.argmax(hora == 0))  # Primer paso de las 00:00
+    n_dias = (len(hora) - inicio) // pasos_dia
+    if n_dias == 0:
+        raise ValueError("La curva no contiene ningún día completo")
+    fin = inicio + n_dias * pasos_dia
+    consumo_dias = np.asarray(curva['consumo'][contador, inicio:fin], dtype=float).reshape(n_dias, pasos_dia)
+    vertido_dias = np.asarray(curva['vertido'][contador, inicio:fin], dtype=float).reshape(n_dias, pasos_dia)
+
+    # Un hueco sorteado daría un escenario NaN entero: solo se sortean días completos
+    completos = ~(np.isnan(consumo_dias).any(axis=1) | np.isnan(vertido_dias).any(axis=1))
+    dias_descartados = 0
+    if completos.any():
+        dias_descartados = int(n_dias - completos.sum())
+        consumo_dias, vertido_dias = consumo_dias[completos], vertido_dias[completos]
+        n_dias = len(consumo_dias)
+    else:
+        consumo_dias, vertido_dias = np.nan_to_num(consumo_dias), np.nan_to_num(vertido_dias)
+
+    es_valle = np.tile(hora[inicio:inicio + pasos_dia] < HORA_FIN_VALLE, DIAS_MES)
+    valle_col = es_valle[:, None]
+
+    ahorro_mensual = np.empty((meses_anio, n_escenarios))
+    for i in range(meses_anio):
+        dias = rng.integers(n_dias, size=(DIAS_MES, n_escenarios))
+        # (días, escenarios, pasos_dia) -> (días, pasos_dia, escenarios) -> (pasos del mes, escenarios)
+        consumo = consumo_dias[dias].transpose(0, 2, 1).reshape(-1, n_escenarios)
+        solar = vertido_dias[dias].transpose(0, 2, 1).reshape(-1, n_escenarios)
+
+        f_precio = _factores(rng, n_escenarios, dispersion['precio'])
+        punta = precio_punta * f_precio
+        precio = np.where(valle_col, precio_valle * f_precio, punta)
+
+        resultado = simular_despacho_lote(
+            consumo, solar, precio, es_valle, cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+            precio_venta_excedente=precio_venta_excedente * _factores(rng, n_escenarios, dispersion['precio_venta']),
+            precio_punta=punta[None, :], horas_paso=curva['horas_paso']
+        )
+        ahorro_mensual[i] = resultado['ahorro_total']
+
+    resultado = _resultado(ahorro_mensual, inversion, n_escenarios, semilla)
+    resultado['dias_descartados'] = dias_descartados
+    return resultado
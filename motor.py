@@ -0,0 +1,403 @@
+import numpy as np
+
+from perfiles import perfil_mensual, SECTOR_POR_DEFECTO
+from fotovoltaica import perfil_fotovoltaico
+from tarifas import periodos_desde, precios_tarifa, precios_dos_tramos, precios_curva
+from precios import precios_desde, entradas_indexadas, precios_curva_indexada, ALMACEN_POR_DEFECTO
+from curvas import curva_por_meses, hora_de_marcas
+from traza import escribir_traza, ventana
+from instrumentacion import etapa
+
+# --- MOTOR DE DESPACHO COMPARTIDO ---
+# Lógica hora a hora de la batería (Solar + Arbitraje) usada por el script de consola
+# (arbitraje-y-solar.py) y por la aplicación web (appstream.py).
+# Trabaja con arrays planos de NumPy en lugar de recorrer un DataFrame con df.loc.
+# Los perfiles sintéticos de entrada se generan en perfiles.py.
+
+MARGEN_MINIMO_ARBITRAJE = 0.02  # Solo cargamos de red si ganamos >2 céntimos/kWh
+
+# Estrategias de despacho disponibles: reglas greedy (este módulo) u óptimo por DP (optimo.py)
+ESTRATEGIAS = ('heuristica', 'optima')
+
+
+def simular_despacho(consumo, solar, precio, es_valle, cap_bat=100, pot_bat=50, eficiencia=0.90,
+                     precio_venta_excedente=0.10, precio_punta=None, soc_inicial=0.0,
+                     margen_minimo=MARGEN_MINIMO_ARBITRAJE, horas_paso=1.0, traza=None):
+    """
+    Simula la batería paso a paso sobre arrays de consumo, solar, precio y máscara valle.
+
+    Estrategia (misma que el bucle original):
+      1. Carga solar con prioridad absoluta (coste de oportunidad = precio de venta del excedente).
+      2. Carga de red en horas valle si no ha entrado sol y el spread supera el margen mínimo.
+      3. Descarga en horas no valle para cubrir consumo.
+
+    precio_punta: precio al que se "revende" la energía cargada de red (escalar o array por paso).
+    Si no se indica, se toma el precio máximo de las horas no valle de la serie.
+    horas_paso: duración de cada paso (1.0 horario, 0.25 cuarto-horario). La potencia del
+    inversor (kW) se convierte a energía máxima por paso: pot_bat * horas_paso.
+
+    traza: vista (n_columnas, n_pasos) de un búfer de traza.crear_traza donde se escriben SOC,
+    carga, descarga, compra de red y balance de cada paso (None: no se registran).
+
+    Devuelve un dict con 'soc' y 'balance' (arrays por paso) y los totales del periodo.
+    'capacidad_necesaria' es el mayor SOC + carga que se ha pedido: con cualquier capacidad
+    igual o superior el despacho sería idéntico (útil para reaprovechar simulaciones).
+    """
+    consumo = np.asarray(consumo, dtype=float)
+    solar = np.asarray(solar, dtype=float)
+    precio = np.asarray(precio, dtype=float)
+    es_valle = np.asarray(es_valle, dtype=bool)
+    n_pasos = len(consumo)
+
+    if precio_punta is None:
+        precio_punta = precio[~es_valle].max() if (~es_valle).any() else 0.0
+
+    # Decisión de arbitraje precalculada de forma vectorizada (no depende del SOC)
+    margen = np.broadcast_to(precio_punta, (n_pasos,)) - precio / eficiencia
+    permite_red = es_valle & (margen > margen_minimo)
+
+    raiz_ef = float(np.sqrt(eficiencia))
+    cap_bat = float(cap_bat)
+    energia_max_paso = float(pot_bat) * horas_paso  # kWh por paso
+    precio_venta_excedente = float(precio_venta_excedente)
+
+    soc_hist = np.empty(n_pasos)
+    balance_hist = np.empty(n_pasos)
+    soc = float(soc_inicial)
+    carga_solar_total = 0.0
+    carga_red_total = 0.0
+    descarga_total = 0.0
+    capacidad_necesaria = soc  # Mayor SOC + carga pedido: por encima, la capacidad no limita nada
+    registrar = traza is not None
+    if registrar:
+        # Listas de Python en el bucle (append es más barato que escribir floats sueltos en float32)
+        carga_hist, carga_red_hist, descarga_hist = [], [], []
+
+    # Bucle escalar sobre floats de Python: evita el coste de df.loc y de np.sqrt por paso
+    for i, (cons, sol, prec, valle, red) in enumerate(zip(
+            consumo.tolist(), solar.tolist(), precio.tolist(), es_valle.tolist(), permite_red.tolist())):
+        coste_carga = 0.0
+        carga_solar = 0.0
+        carga_red = 0.0
+        descarga = 0.0
+
+        # 1. Carga Solar (Prioridad Absoluta)
+        if sol > 0:
+            carga_solar = min(sol, cap_bat - soc, energia_max_paso)
+            if soc + carga_solar > capacidad_necesaria:
+                capacidad_necesaria = soc + carga_solar
+            soc += carga_solar * raiz_ef  # Pérdida en la entrada
+            coste_carga += carga_solar * precio_venta_excedente
+            carga_solar_total += carga_solar
+
+        # 2. Carga de Red (Arbitraje) -> Solo si el sol no ha cargado nada en este paso
+        if red and carga_solar == 0:
+            espacio_libre = cap_bat - soc
+            if espacio_libre > 0:
+                carga_red = min(espacio_libre, energia_max_paso)
+                if soc + carga_red > capacidad_necesaria:
+                    capacidad_necesaria = soc + carga_red
+                soc += carga_red * raiz_ef
+                coste_carga += carga_red * prec
+                carga_red_total += carga_red
+
+        # 3. Descarga en horas caras (No valle) para cubrir consumo
+        ahorro_paso = 0.0
+        if not valle and soc > 0 and cons > 0:
+            descarga = min(cons, soc * raiz_ef, energia_max_paso)
+            soc -= descarga / raiz_ef
+            ahorro_paso = descarga * prec
+            descarga_total += descarga
+
+        soc_hist[i] = soc
+        balance_hist[i] = ahorro_paso - coste_carga
+        if registrar:
+            carga_hist.append(carga_solar + carga_red)
+            carga_red_hist.append(carga_red)
+            descarga_hist.append(descarga)
+
+    if registrar:
+        escribir_traza(traza, consumo, soc_hist, balance_hist, np.array(carga_hist), np.array(carga_red_hist),
+                       np.array(descarga_hist))
+
+    return {
+        'soc': soc_hist,
+        'balance': balance_hist,
+        'ahorro_total': float(balance_hist.sum()),
+        'soc_final': soc,
+        'carga_solar_kwh': carga_solar_total,
+        'carga_red_kwh': carga_red_total,
+        'descarga_kwh': descarga_total,
+        'capacidad_necesaria': capacidad_necesaria,
+    }
+
+
+def simular_despacho_lote(consumo, solar, precio, es_valle, cap_bat, pot_bat, eficiencia=0.90,
+                          precio_venta_excedente=0.10, precio_punta=None, soc_inicial=0.0,
+                          margen_minimo=MARGEN_MINIMO_ARBITRAJE, guardar_soc=False, horas_paso=1.0):
+    """
+    Versión por lotes de simular_despacho: simula N configuraciones a la vez con un
+    estado SOC de forma (N,), recorriendo el tiempo una sola vez.
+
+    cap_bat, pot_bat (y eficiencia / soc_inicial) pueden ser escalares o arrays de forma (N,).
+    consumo, solar y precio pueden ser (T,) comunes a todas las configuraciones o (T, N)
+    (un escenario distinto por columna, p.ej. Monte Carlo). es_valle es (T,) o (T, N).
+    horas_paso convierte la potencia (kW) a energía por paso, igual que en simular_despacho.
+
+    Devuelve un dict con los totales por configuración (arrays de forma (N,)) y,
+    si guardar_soc=True, la traza 'soc' de forma (T, N).
+    """
+    cap_bat = np.atleast_1d(np.asarray(cap_bat, dtype=float))
+    pot_bat = np.atleast_1d(np.asarray(pot_bat, dtype=float))
+    consumo = np.asarray(consumo, dtype=float)
+    solar = np.asarray(solar, dtype=float)
+    precio = np.asarray(precio, dtype=float)
+    es_valle = np.asarray(es_valle, dtype=bool)
+    n_pasos = consumo.shape[0]
+    n_conf = np.broadcast_shapes(cap_bat.shape, pot_bat.shape, np.shape(eficiencia),
+                                 consumo.shape[1:], solar.shape[1:], precio.shape[1:])
+    n_conf = n_conf[0] if n_conf else 1
+
+    cap_bat = np.broadcast_to(cap_bat, (n_conf,))
+    energia_max_paso = np.broadcast_to(pot_bat, (n_conf,)) * horas_paso
+    eficiencia = np.broadcast_to(np.asarray(eficiencia, dtype=float), (n_conf,))
+    raiz_ef = np.sqrt(eficiencia)
+
+    precio_2d = precio if precio.ndim > 1 else precio[:, None]
+    valle_2d = es_valle if es_valle.ndim > 1 else es_valle[:, None]
+    if precio_punta is None:
+        # Precio máximo no valle de cada escenario (fila (1, N) o (1, 1))
+        precio_punta = np.where(valle_2d, -np.inf, precio_2d).max(axis=0, keepdims=True)
+        precio_punta = np.where(np.isfinite(precio_punta), precio_punta, 0.0)
+    else:
+        precio_punta = np.asarray(precio_punta, dtype=float)
+        if precio_punta.ndim == 1:
+            precio_punta = precio_punta[:, None]  # Un valor por paso
+
+    # Decisión de arbitraje precalculada (T, N) o (T, 1): no depende del SOC
+    ef_margen = eficiencia[:1] if np.all(eficiencia == eficiencia[0]) else eficiencia
+    margen = precio_punta - precio_2d / ef_margen
+    permite_red = valle_2d & (margen > margen_minimo)
+
+    soc = np.array(np.broadcast_to(np.asarray(soc_inicial, dtype=float), (n_conf,)))
+    balance_total = np.zeros(n_conf)
+    carga_solar_total = np.zeros(n_conf)
+    carga_red_total = np.zeros(n_conf)
+    descarga_total = np.zeros(n_conf)
+    soc_hist = np.empty((n_pasos, n_conf)) if guardar_soc else None
+
+    # Buffers preasignados para no crear arrays nuevos en cada paso
+    espacio = np.empty(n_conf)
+    carga_solar = np.empty(n_conf)
+    carga_red = np.empty(n_conf)
+    descarga = np.empty(n_conf)
+
+    for t in range(n_pasos):
+        cons = consumo[t]
+        sol = np.maximum(solar[t], 0.0)
+        prec = precio_2d[t] if precio.ndim > 1 else precio[t]
+
+        # 1. Carga Solar (Prioridad Absoluta)
+        np.subtract(cap_bat, soc, out=espacio)
+        np.minimum(sol, espacio, out=carga_solar)
+        np.minimum(carga_solar, energia_max_paso, out=carga_solar)
+        soc += carga_solar * raiz_ef
+
+        # 2. Carga de Red solo si el sol no ha cargado nada en este paso
+        np.subtract(cap_bat, soc, out=espacio)
+        np.minimum(espacio, energia_max_paso, out=carga_red)
+        np.maximum(carga_red, 0.0, out=carga_red)
+        carga_red *= permite_red[t] & (carga_solar == 0)
+        soc += carga_red * raiz_ef
+
+        # 3. Descarga en horas no valle
+        np.multiply(soc, raiz_ef, out=descarga)
+        np.minimum(descarga, cons, out=descarga)
+        np.minimum(descarga, energia_max_paso, out=descarga)
+        np.maximum(descarga, 0.0, out=descarga)
+        descarga *= ~valle_2d[t]
+        soc -= descarga / raiz_ef
+
+        balance_total += descarga * prec - carga_solar * precio_venta_excedente - carga_red * prec
+        carga_solar_total += carga_solar
+        carga_red_total += carga_red
+        descarga_total += descarga
+        if guardar_soc:
+            soc_hist[t] = soc
+
+    resultado = {
+        'ahorro_total': balance_total,
+        'soc_final': soc,
+        'carga_solar_kwh': carga_solar_total,
+        'carga_red_kwh': carga_red_total,
+        'descarga_kwh': descarga_total,
+    }
+    if guardar_soc:
+        resultado['soc'] = soc_hist
+    return resultado
+
+
+def despachar(consumo, solar, precio, es_valle, cap_bat=100, pot_bat=50, eficiencia=0.90,
+              precio_venta_excedente=0.10, precio_punta=None, soc_inicial=0.0,
+              horas_paso=1.0, estrategia='heuristica', traza=None):
+    """
+    Punto de entrada común: ejecuta la estrategia elegida con los mismos argumentos.
+    'heuristica' -> simular_despacho | 'optima' -> optimo.despacho_optimo (ignora valle/punta).
+    """
+    if estrategia == 'heuristica':
+        return simular_despacho(consumo, solar, precio, es_valle, cap_bat, pot_bat, eficiencia,
+                                precio_venta_excedente, precio_punta, soc_inicial, horas_paso=horas_paso,
+                                traza=traza)
+    if estrategia == 'optima':
+        from optimo import despacho_optimo
+        return despacho_optimo(consumo, solar, precio, cap_bat, pot_bat, eficiencia,
+                               precio_venta_excedente, soc_inicial, horas_paso, traza=traza)
+    raise ValueError(f"Estrategia desconocida '{estrategia}'. Opciones: {', '.join(ESTRATEGIAS)}")
+
+
+def precios_mes(mes, hora_dia, dias=30, pasos_por_hora=1, consumo_kwh=None):
+    """
+    Precios de compra, máscara valle y precio de reventa por paso de un mes de factura.
+    Por defecto dos precios: 00-08h Valle (P6) | 08-00h Punta (precio_punta escalar).
+    Si el mes trae 'precios_periodo' (6 precios P1..P6, €/kWh) e 'inicio' ('aaaa-mm-dd'),
+    usa el calendario 3.0TD real (tarifas.py) con fines de semana y festivos en P6.
+    Si trae 'serie_precios' e 'inicio', usa el precio indexado de esa serie del almacén de
+    precios (precios.py; valle = horas más baratas de cada día).
+    """
+    if mes.get('serie_precios'):
+        precio = precios_desde(mes['serie_precios'], mes['inicio'], dias, pasos_por_hora,
+                               mes.get('almacen_precios', ALMACEN_POR_DEFECTO))
+        dia = np.arange(len(precio)) // (24 * pasos_por_hora)
+        return entradas_indexadas(precio, dia, consumo_kwh)
+
+    if mes.get('precios_periodo') is not None:
+        periodos = periodos_desde(mes['inicio'], dias, pasos_por_hora)
+        dia = np.arange(len(periodos)) // (24 * pasos_por_hora)
+        return precios_tarifa(periodos, mes['precios_periodo'], dia, consumo_kwh)
+
+    return precios_dos_tramos(hora_dia, mes['precio_valle'], mes['precio_punta'])
+
+
+def entradas_mes(mes, sector=SECTOR_POR_DEFECTO, dias=30, pasos_por_hora=1):
+    """
+    Entradas del motor para un mes de factura: perfil sintético del sector y precios (precios_mes).
+    Si el mes trae 'fotovoltaica' (instalación de fotovoltaica.py) e 'inicio', el excedente sale
+    de la producción modelada menos la demanda en lugar de la campana escalada a la factura.
+    Devuelve (hora_dia, consumo_kwh, solar_kwh, precio_compra, es_valle, precio_punta).
+    """
+    n_pasos = dias * 24 * pasos_por_hora
+    with etapa('perfil', n_pasos):
+        if mes.get('fotovoltaica'):
+            hora_dia, consumo_kwh, solar_kwh, _ = perfil_fotovoltaico(mes, dias, pasos_por_hora, sector)
+        else:
+            hora_dia, consumo_kwh, solar_kwh = perfil_mensual(
+                mes['consumo_total_kwh'], mes['excedente_total_kwh'], dias, pasos_por_hora, sector
+            )
+
+    with etapa('precios', n_pasos):
+        precio_compra, es_valle, precio_punta = precios_mes(mes, hora_dia, dias, pasos_por_hora, consumo_kwh)
+    return hora_dia, consumo_kwh, solar_kwh, precio_compra, es_valle, precio_punta
+
+
+def simular_mes(mes, cap_bat=100, pot_bat=50, eficiencia=0.90, sector=SECTOR_POR_DEFECTO,
+                estrategia='heuristica', dias=30, pasos_por_hora=1, soc_inicial=0.0, traza=None):
+    """
+    Simula un mes de factura (formato de datos_reales_cliente: 'mes', 'consumo_total_kwh',
+    'excedente_total_kwh', 'precio_valle', 'precio_punta', 'precio_venta_excedente').
+
+    Genera el perfil sintético del sector, los precios (valle/punta o los 6 periodos 3.0TD,
+    ver precios_mes) y ejecuta la estrategia elegida. Con estrategia distinta de 'heuristica' guarda también el ahorro de la
+    heurística para poder medir la brecha. soc_inicial permite encadenar meses arrastrando
+    la carga de la batería (resultado['soc_final'] del mes anterior). traza: vista del búfer
+    (ver traza.py) donde la estrategia elegida escribe el detalle paso a paso del mes.
+
+    Devuelve un dict con 'mes', 'ahorro', 'ahorro_heuristica', 'resultado' (salida del motor)
+    y los arrays de entrada por paso ('hora_dia', 'consumo_kwh', 'solar_kwh', 'precio_compra', 'es_valle').
+    """
+    horas_paso = 1 / pasos_por_hora
+    n_pasos = dias * 24 * pasos_por_hora
+    hora_dia, consumo_kwh, solar_kwh, precio_compra, es_valle, precio_punta = entradas_mes(
+        mes, sector, dias, pasos_por_hora
+    )
+
+    with etapa('despacho_heuristica', n_pasos):
+        resultado = simular_despacho(
+            consumo_kwh, solar_kwh, precio_compra, es_valle,
+            cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+            precio_venta_excedente=mes['precio_venta_excedente'],
+            precio_punta=precio_punta, soc_inicial=soc_inicial, horas_paso=horas_paso,
+            traza=traza if estrategia == 'heuristica' else None
+        )
+    ahorro_heuristica = resultado['ahorro_total']
+    if estrategia != 'heuristica':
+        with etapa(f'despacho_{estrategia}', n_pasos):
+            resultado = despachar(
+                consumo_kwh, solar_kwh, precio_compra, es_valle,
+                cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+                precio_venta_excedente=mes['precio_venta_excedente'], soc_inicial=soc_inicial,
+                horas_paso=horas_paso, estrategia=estrategia, traza=traza
+            )
+
+    return {
+        'mes': mes['mes'],
+        'ahorro': resultado['ahorro_total'],
+        'ahorro_heuristica': ahorro_heuristica,
+        'resultado': resultado,
+        'hora_dia': hora_dia,
+        'consumo_kwh': consumo_kwh,
+        'solar_kwh': solar_kwh,
+        'precio_compra': precio_compra,
+        'es_valle': es_valle,
+    }
+
+
+def simular_curva_meses(curva, contador=0, cap_bat=100, pot_bat=50, eficiencia=0.90, precio_venta_excedente=0.10,
+                        precio_valle=None, precio_punta=None, precios_periodo=None, serie_precios=None,
+                        almacen_precios=ALMACEN_POR_DEFECTO, traza=None):
+    """
+    Simula una curva real (curvas.cargar_curva) mes natural a mes natural con el motor heurístico.
+    Precio fijo: Valle/Punta (precio_valle, precio_punta) o, con precios_periodo (P1..P6), el
+    calendario 3.0TD de las fechas de la curva. Con serie_precios (almacén de precios.py) simula
+    además el mismo tramo con el contrato indexado. traza: búfer de traza.crear_traza para toda la
+    curva, donde escribe el despacho con precio fijo.
+
+    Devuelve una lista de dicts por mes con 'mes', 'consumo_kwh', 'excedente_kwh', 'ahorro' y,
+    con serie_precios, 'ahorro_indexado' y 'precio_medio_indexado'.
+    """
+    meses = []
+    inicio = 0
+    for trozo in curva_por_meses(curva, contador):
+        n_pasos = len(trozo['tiempo'])
+        if precios_periodo:
+            precio_compra, es_valle, precio_reventa = precios_curva(trozo['tiempo'], precios_periodo, trozo['consumo_kwh'])
+        else:
+            precio_compra, es_valle, precio_reventa = precios_dos_tramos(hora_de_marcas(trozo['tiempo']), precio_valle,
+                                                                         precio_punta)
+        resultado = simular_despacho(
+            trozo['consumo_kwh'], trozo['vertido_kwh'], precio_compra, es_valle,
+            cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+            precio_venta_excedente=precio_venta_excedente, precio_punta=precio_reventa,
+            horas_paso=curva['horas_paso'],
+            traza=ventana(traza, inicio, n_pasos) if traza is not None else None
+        )
+        inicio += n_pasos
+        mes = {
+            'mes': trozo['mes'],
+            'consumo_kwh': float(trozo['consumo_kwh'].sum()),
+            'excedente_kwh': float(trozo['vertido_kwh'].sum()),
+            'ahorro': resultado['ahorro_total'],
+        }
+        if serie_precios:
+            # Mismo tramo de curva con el contrato indexado (precios del almacén, sin releer CSV)
+            precio_ind, es_valle_ind, reventa_ind = precios_curva_indexada(
+                trozo['tiempo'], serie_precios, trozo['consumo_kwh'], almacen_precios)
+            resultado_ind = simular_despacho(
+                trozo['consumo_kwh'], trozo['vertido_kwh'], precio_ind, es_valle_ind,
+                cap_bat=cap_bat, pot_bat=pot_bat, eficiencia=eficiencia,
+                precio_venta_excedente=precio_venta_excedente, precio_punta=reventa_ind,
+                horas_paso=curva['horas_paso']
+            )
+            mes['ahorro_indexado'] = resultado_ind['ahorro_total']
+            mes['precio_medio_indexado'] = float(precio_ind.mean())
+        meses.append(mes)
+    return meses
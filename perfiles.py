@@ -0,0 +1,82 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# --- PLANTILLAS DE PERFIL SINTÉTICO (CONSUMO Y SOLAR) ---
+# La forma del día es siempre la misma: solo cambian los factores de escala de cada factura.
+# Las plantillas se calculan una vez, normalizadas (suma = 1), y se guardan en una caché LRU
+# acotada por (tramos, pesos, días, resolución). Cada mes cuesta entonces una multiplicación.
+
+TAMANO_CACHE = 64
+
+# Plantilla = forma normalizada del periodo + hora del día de cada paso (arrays de solo lectura)
+Plantilla = namedtuple('Plantilla', ['nombre', 'hora_dia', 'forma'])
+
+# Sectores: límites de los tramos horarios (horas) y peso relativo de cada tramo
+SECTORES = {
+    # Hostelería: alto al mediodía y por la noche (perfil original del simulador)
+    'hosteleria': {'cortes': (0, 8, 12, 17, 20, 24), 'pesos': (0.4, 0.8, 2.0, 0.8, 1.2)},
+    # Comercio: horario de apertura 09:00 - 21:00, pico de tarde
+    'comercio': {'cortes': (0, 9, 14, 17, 21, 24), 'pesos': (0.3, 1.2, 0.9, 1.3, 0.3)},
+    # Pequeña industria: dos turnos 06:00 - 22:00
+    'pequena_industria': {'cortes': (0, 6, 14, 22, 24), 'pesos': (0.3, 1.5, 1.2, 0.3)},
+    # Frío industrial 24/7: base alta con más carga de compresores en las horas de calor
+    'frio_24h': {'cortes': (0, 8, 12, 18, 24), 'pesos': (0.9, 1.0, 1.2, 1.0)},
+}
+SECTOR_POR_DEFECTO = 'hosteleria'
+
+
+def _solo_lectura(array):
+    array.setflags(write=False)
+    return array
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def hora_del_dia(dias, pasos_por_hora=1):
+    """Hora del día de cada paso (0, 1, ... o 0, 0.25, ... en cuarto-horario)."""
+    return _solo_lectura(np.arange(dias * 24 * pasos_por_hora) / pasos_por_hora % 24)
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def plantilla_consumo(cortes, pesos, dias=30, pasos_por_hora=1, nombre=''):
+    """Plantilla de consumo por tramos horarios, normalizada para que sume 1 en el periodo."""
+    hora_dia = hora_del_dia(dias, pasos_por_hora)
+    tramo = np.searchsorted(np.asarray(cortes[1:-1]), hora_dia, side='right')
+    forma = np.asarray(pesos, dtype=float)[tramo]
+    return Plantilla(nombre, hora_dia, _solo_lectura(forma / forma.sum()))
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def plantilla_solar(dias=30, pasos_por_hora=1, hora_inicio=7, duracion=13):
+    """Campana solar sin(·) entre hora_inicio y hora_inicio + duracion, normalizada (suma = 1)."""
+    hora_dia = hora_del_dia(dias, pasos_por_hora)
+    forma = np.where(
+        (hora_dia > hora_inicio) & (hora_dia < hora_inicio + duracion),
+        np.sin((hora_dia - hora_inicio) * np.pi / duracion),
+        0
+    )
+    suma = forma.sum()
+    forma = forma / suma if suma > 0 else forma
+    return Plantilla('solar', hora_dia, _solo_lectura(forma))
+
+
+def plantilla_sector(sector=SECTOR_POR_DEFECTO, dias=30, pasos_por_hora=1):
+    """Plantilla de consumo de uno de los SECTORES predefinidos."""
+    if sector not in SECTORES:
+        raise ValueError(f"Sector desconocido '{sector}'. Opciones: {', '.join(SECTORES)}")
+    definicion = SECTORES[sector]
+    return plantilla_consumo(definicion['cortes'], definicion['pesos'], dias, pasos_por_hora, sector)
+
+
+def perfil_mensual(consumo_total_kwh, excedente_total_kwh, dias=30, pasos_por_hora=1,
+                   sector=SECTOR_POR_DEFECTO):
+    """
+    Genera el perfil sintético de un mes (consumo del sector + campana solar)
+    escalado a los totales de la factura.
+    pasos_por_hora=1 da resolución horaria y pasos_por_hora=4 cuarto-horaria (96 pasos/día).
+    Devuelve (hora_dia, consumo_kwh, solar_kwh) como arrays de NumPy (kWh por paso).
+    """
+    consumo = plantilla_sector(sector, dias, pasos_por_hora)
+    solar = plantilla_solar(dias, pasos_por_hora)
+    return consumo.hora_dia, consumo.forma * consumo_total_kwh, solar.forma * excedente_total_kwh
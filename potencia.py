@@ -0,0 +1,198 @@
+import numpy as np
+
+from tarifas import periodos_en, termino_potencia, PERIODOS, PERIODO_VALLE
+
+# --- OPTIMIZACIÓN DE POTENCIA CONTRATADA 3.0TD (RECORTE DE PICOS) ---
+# Coste anual de potencia = término fijo sum(Pc_p * tp_p) + excesos. En 3.0TD con medida
+# cuarto-horaria el exceso de cada mes y periodo es tep * Kp * sqrt(sum((Pd_j - Pc_p)^2))
+# sobre los cuartos de hora con demanda por encima de la potencia contratada.
+#
+# La demanda de cada (periodo, mes) se ordena una vez y se guardan sumas acumuladas de d y d^2
+# desde arriba; sum((d - c)^2) para d > c es S2 - 2 c S1 + c^2 n, así que evaluar un candidato
+# cuesta una búsqueda binaria (O(log n)), sin re-simular. Las seis potencias se eligen sobre una
+# rejilla de kW con programación dinámica que respeta el orden P1 <= P2 <= ... <= P6.
+
+# Término de potencia 3.0TD (peajes + cargos, €/kW·año, valores orientativos 2025)
+PRECIOS_POTENCIA_30TD = (19.60, 10.17, 4.27, 3.69, 2.31, 1.38)
+TEP_30TD = 1.4064                                  # €/kW, término de excesos de potencia
+KP_30TD = (1.0, 0.5, 0.37, 0.37, 0.37, 0.17)        # Coeficiente de cada periodo
+POTENCIA_MINIMA_P6 = 15.001                         # 3.0TD: más de 15 kW en algún periodo (P6 es el mayor)
+PASO_KW = 0.1
+# Profundidades de recorte probadas con batería (fracción de la potencia del inversor)
+FRACCIONES_RECORTE = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+def demanda_por_periodo(consumo_kwh, tiempo, horas_paso):
+    """Demanda media de cada paso (kW), periodo 3.0TD y mes natural (índice 0..n_meses-1)."""
+    tiempo = np.asarray(tiempo, dtype='datetime64[m]')
+    demanda = np.nan_to_num(np.asarray(consumo_kwh, dtype=float)) / horas_paso
+    meses = tiempo.astype('datetime64[M]')
+    mes_id = np.unique(meses, return_inverse=True)[1]
+    return demanda, periodos_en(tiempo), mes_id, np.unique(meses)
+
+
+def preparar_demanda(demanda, periodos, mes_id):
+    """
+    Demanda ordenada de cada (periodo, mes) con sumas acumuladas desde el máximo:
+    {(p, m): (ordenada_desc, suma_d, suma_d2)} con suma_x[k] = suma de los k mayores.
+    """
+    tablas = {}
+    for p in range(len(PERIODOS)):
+        for m in range(int(mes_id.max()) + 1):
+            valores = np.sort(demanda[(periodos == p) & (mes_id == m)])[::-1]
+            if len(valores) == 0:
+                continue
+            tablas[(p, m)] = (valores,
+                              np.concatenate(([0.0], np.cumsum(valores))),
+                              np.concatenate(([0.0], np.cumsum(valores * valores))))
+    return tablas
+
+
+def maximos_mensuales(tablas, n_meses):
+    """Máximo de demanda (kW) de cada mes y periodo: array (n_meses, 6), NaN si el periodo no aparece."""
+    maximos = np.full((n_meses, len(PERIODOS)), np.nan)
+    for (p, m), (valores, _, _) in tablas.items():
+        maximos[m, p] = valores[0]
+    return maximos
+
+
+def coste_excesos(tablas, p, potencias, n_meses, tep=TEP_30TD, kp=KP_30TD):
+    """
+    Excesos del periodo p (€ sobre todo el intervalo de datos) para un array de potencias candidatas:
+    tep * Kp * sum_meses sqrt(sum((d - c)^2)). Una búsqueda binaria por mes y candidato.
+    """
+    potencias = np.asarray(potencias, dtype=float)
+    total = np.zeros(potencias.shape)
+    for m in range(n_meses):
+        if (p, m) not in tablas:
+            continue
+        valores, suma_d, suma_d2 = tablas[(p, m)]
+        # Número de cuartos de hora por encima de c (valores está en orden descendente)
+        n = len(valores) - np.searchsorted(valores[::-1], potencias, side='right')
+        cuadrado = suma_d2[n] - 2 * potencias * suma_d[n] + potencias * potencias * n
+        total += np.sqrt(np.maximum(cuadrado, 0.0))
+    return tep * kp[p] * total
+
+
+def coste_potencia(tablas, potencias, n_meses, precios_potencia=PRECIOS_POTENCIA_30TD):
+    """
+    Coste anual (€) de unas potencias contratadas P1..P6: término fijo + excesos anualizados.
+    Devuelve {'potencias', 'coste_fijo', 'coste_excesos', 'coste_total', 'excesos_periodo'}.
+    """
+    factor_anual = 12 / n_meses
+    potencias = [float(x) for x in potencias]
+    excesos = [float(coste_excesos(tablas, p, potencias[p], n_meses)) * factor_anual for p in range(len(PERIODOS))]
+    fijo = termino_potencia(potencias, precios_potencia, 365)
+    return {
+        'potencias': potencias,
+        'coste_fijo': fijo,
+        'coste_excesos': sum(excesos),
+        'coste_total': fijo + sum(excesos),
+        'excesos_periodo': excesos,
+    }
+
+
+def optimizar_potencias(tablas, n_meses, precios_potencia=PRECIOS_POTENCIA_30TD, paso_kw=PASO_KW,
+                        potencia_minima_p6=POTENCIA_MINIMA_P6):
+    """
+    Potencias P1..P6 de mínimo coste anual con P1 <= ... <= P6 (rejilla de paso_kw).
+    coste_p(c) se evalúa vectorizado sobre toda la rejilla y la cadena ordenada se resuelve con
+    mínimos acumulados: mejor_p(c) = coste_p(c) + min_{c' <= c} mejor_{p-1}(c').
+    """
+    factor_anual = 12 / n_meses
+    maximo = max(valores[0] for valores, _, _ in tablas.values()) if tablas else 0.0
+    rejilla = np.union1d(np.arange(0.0, max(maximo, potencia_minima_p6) + 2 * paso_kw, paso_kw), [potencia_minima_p6])
+
+    mejor = None
+    elegido = []
+    for p in range(len(PERIODOS)):
+        coste = rejilla * precios_potencia[p] + coste_excesos(tablas, p, rejilla, n_meses) * factor_anual
+        if p == PERIODO_VALLE:
+            coste = np.where(rejilla >= potencia_minima_p6 - 1e-9, coste, np.inf)
+        if mejor is None:
+            mejor = coste
+            elegido.append(None)
+            continue
+        # Mínimo acumulado del periodo anterior y dónde se alcanza (para reconstruir la solución)
+        indice_min = np.zeros(len(rejilla), dtype=np.int64)
+        nuevos_min = np.flatnonzero(np.concatenate(([True], mejor[1:] < np.minimum.accumulate(mejor)[:-1])))
+        indice_min[nuevos_min] = nuevos_min
+        indice_min = np.maximum.accumulate(indice_min)
+        elegido.append(indice_min)
+        mejor = coste + mejor[indice_min]
+
+    indices = [int(np.argmin(mejor))]
+    for p in range(len(PERIODOS) - 1, 0, -1):
+        indices.append(int(elegido[p][indices[-1]]))
+    potencias = np.round(rejilla[indices[::-1]], 3)
+    return coste_potencia(tablas, potencias, n_meses, precios_potencia)
+
+
+def recortar_picos(demanda, periodos, limites, cap_bat=100, pot_bat=50, eficiencia=0.90, horas_paso=0.25,
+                   soc_inicial=None):
+    """
+    Despacho de recorte de picos: descarga cuando la demanda supera el límite de su periodo y
+    recarga (sin pasar del límite) cuando hay margen. Devuelve la demanda neta de red (kW).
+    Bucle escalar sobre floats de Python, como motor.simular_despacho.
+    """
+    raiz_ef = float(np.sqrt(eficiencia))
+    limite_paso = np.asarray(limites, dtype=float)[periodos]
+    cap_bat = float(cap_bat)
+    pot_bat = float(pot_bat)
+    soc = cap_bat if soc_inicial is None else float(soc_inicial)
+
+    neta = np.empty(len(demanda))
+    for i, (d, limite) in enumerate(zip(np.asarray(demanda, dtype=float).tolist(), limite_paso.tolist())):
+        if d > limite:
+            descarga = min(d - limite, pot_bat, soc * raiz_ef / horas_paso)
+            soc -= descarga * horas_paso / raiz_ef
+            d -= descarga
+        elif soc < cap_bat:
+            carga = min(limite - d, pot_bat, (cap_bat - soc) / (raiz_ef * horas_paso))
+            soc += carga * horas_paso * raiz_ef
+            d += carga
+        neta[i] = d
+    return neta
+
+
+def optimizar_potencia_contratada(consumo_kwh, tiempo, horas_paso, cap_bat=100, pot_bat=50, eficiencia=0.90,
+                                  precios_potencia=PRECIOS_POTENCIA_30TD, potencias_actuales=None, paso_kw=PASO_KW):
+    """
+    Potencia contratada óptima P1..P6 sin batería y con la batería recortando picos.
+
+    Con batería: para cada profundidad f de FRACCIONES_RECORTE se toman como límites las
+    potencias óptimas de la demanda rebajada en f * pot_bat, se simula recortar_picos con esos
+    límites (la energía de la batería manda: los picos largos no se recortan enteros) y se vuelve
+    a optimizar sobre la demanda neta. Se queda la profundidad más barata: una simulación por
+    profundidad, ninguna por candidato de potencia.
+
+    Devuelve {'sin_bateria', 'con_bateria', 'actual' (si se indica), 'maximos', 'meses', 'ahorro_anual'}.
+    """
+    demanda, periodos, mes_id, meses = demanda_por_periodo(consumo_kwh, tiempo, horas_paso)
+    n_meses = len(meses)
+    tablas = preparar_demanda(demanda, periodos, mes_id)
+    sin_bateria = optimizar_potencias(tablas, n_meses, precios_potencia, paso_kw)
+
+    con_bateria, tablas_neta = sin_bateria, tablas
+    for fraccion in FRACCIONES_RECORTE:
+        objetivo = optimizar_potencias(preparar_demanda(np.maximum(demanda - fraccion * pot_bat, 0.0), periodos, mes_id),
+                                       n_meses, precios_potencia, paso_kw)
+        neta = recortar_picos(demanda, periodos, objetivo['potencias'], cap_bat, pot_bat, eficiencia, horas_paso)
+        tablas_fraccion = preparar_demanda(neta, periodos, mes_id)
+        candidato = optimizar_potencias(tablas_fraccion, n_meses, precios_potencia, paso_kw)
+        if candidato['coste_total'] < con_bateria['coste_total']:
+            con_bateria, tablas_neta = candidato, tablas_fraccion
+            con_bateria['fraccion_recorte'] = fraccion
+
+    resultado = {
+        'sin_bateria': sin_bateria,
+        'con_bateria': con_bateria,
+        'maximos': maximos_mensuales(tablas, n_meses),
+        'maximos_con_bateria': maximos_mensuales(tablas_neta, n_meses),
+        'meses': [str(m) for m in meses],
+        'ahorro_anual': sin_bateria['coste_total'] - con_bateria['coste_total'],
+    }
+    if potencias_actuales is not None:
+        resultado['actual'] = coste_potencia(tablas, potencias_actuales, n_meses, precios_potencia)
+        resultado['ahorro_optimizando'] = resultado['actual']['coste_total'] - sin_bateria['coste_total']
+    return resultado
@@ -0,0 +1,263 @@
+import os
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from curvas import buscar_columna, minutos_bloque, COLUMNAS_FECHA_HORA, COLUMNAS_FECHA, COLUMNAS_HORA
+from tarifas import precio_reventa, inicio_desde_etiqueta, dias_cambio_hora, PERIODO_VALLE
+
+# --- PRECIOS INDEXADOS (OMIE / PVPC) EN UN ALMACÉN LOCAL ---
+# Importa series horarias o cuarto-horarias de precio desde CSV (exportación genérica
+# fecha;precio o ficheros marginalpdbc de OMIE) a un almacén binario: un .npy float32 por
+# serie y año, alineado a la rejilla del año completo (NaN = hueco). El índice es la propia
+# marca de tiempo: la posición es (t - 1 de enero) / paso, así que cortar cualquier periodo
+# es aritmética + un indexado sobre un mmap, sin volver a leer el CSV.
+#
+#   precios/<serie>/meta.json   -> {'pasos_por_hora', 'anios', 'origen'}
+#   precios/<serie>/<anio>.npy  -> float32 (8760 ó 35.040 pasos; 8784 / 35.136 en bisiesto), €/kWh
+#
+# La rejilla es de hora civil sin saltos, como las curvas de consumo: el día de 23 horas de
+# marzo rellena la hora que no existe (02:00-03:00) con la media de sus vecinas y el de 25
+# horas de octubre promedia las dos 02:00-03:00 en un solo paso.
+
+ALMACEN_POR_DEFECTO = 'precios'
+TAMANO_CACHE = 32
+FRACCION_VALLE = 1 / 3      # Horas más baratas de cada día tratadas como "valle" (8 de 24, como P6)
+UMBRAL_EUR_MWH = 2.0        # Una mediana por encima de 2 solo puede ser €/MWh
+
+COLUMNAS_PRECIO = ('precio_eur_kwh', 'precio (€/kwh)', 'precio_eur_mwh', 'precio (€/mwh)', 'precio', 'pvpc',
+                   'value', 'valor', 'price')
+
+
+def _ruta_serie(serie, almacen):
+    return os.path.join(almacen, serie)
+
+
+def _leer_meta(serie, almacen):
+    ruta = os.path.join(_ruta_serie(serie, almacen), 'meta.json')
+    if not os.path.exists(ruta):
+        raise ValueError(f"No existe la serie de precios '{serie}' en {almacen}/ (importarla con importar_precios)")
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def series_disponibles(almacen=ALMACEN_POR_DEFECTO):
+    """Nombres de las series importadas en el almacén."""
+    if not os.path.isdir(almacen):
+        return []
+    return sorted(d for d in os.listdir(almacen) if os.path.exists(os.path.join(almacen, d, 'meta.json')))
+
+
+def firma_serie(serie, almacen=ALMACEN_POR_DEFECTO):
+    """Cambia cada vez que se reimporta la serie (para invalidar cachés de resultados)."""
+    ruta = os.path.join(_ruta_serie(serie, almacen), 'meta.json')
+    return os.stat(ruta).st_mtime_ns if os.path.exists(ruta) else None
+
+
+# --- LECTURA DE CSV ---
+
+def _periodos_a_hora_local(dias, indice, minutos_paso):
+    """
+    Minutos de inicio (hora civil) de los periodos numerados de cada día (`dias` en minutos desde
+    epoch, `indice` 0..n-1). En los días de cambio de hora con la numeración completa (23 ó 25
+    horas) los periodos posteriores al cambio se desplazan: en marzo el periodo 3 empieza a las
+    03:00 y en octubre el periodo 4 repite las 02:00.
+    """
+    minutos = dias + indice * minutos_paso
+    pasos_hora = 60 // minutos_paso
+    anios = dias.astype('datetime64[m]').astype('datetime64[Y]').astype(np.int64) + 1970
+    for anio in np.unique(anios).tolist():
+        dia_verano, dia_invierno = dias_cambio_hora(anio)
+        for dia, horas, desde, desplazamiento in ((dia_verano, 23, 2, 60), (dia_invierno, 25, 3, -60)):
+            seleccion = dias == dia.astype('datetime64[m]').astype(np.int64)
+            if seleccion.sum() != horas * pasos_hora:
+                continue
+            if not np.array_equal(np.sort(indice[seleccion]), np.arange(horas * pasos_hora)):
+                continue
+            minutos[seleccion & (indice >= desde * pasos_hora)] += desplazamiento
+    return minutos
+
+
+def _leer_omie(ruta):
+    """marginalpdbc de OMIE: 'aaaa;mm;dd;periodo;precio_pt;precio_es;' (€/MWh, periodo 1..24 ó 1..96)."""
+    filas = []
+    with open(ruta, 'r', encoding='latin-1') as f:
+        for linea in f:
+            campos = linea.strip().split(';')
+            if len(campos) >= 6 and campos[0].isdigit():
+                filas.append((int(campos[0]), int(campos[1]), int(campos[2]), int(campos[3]),
+                              float(campos[5].replace(',', '.'))))
+    if not filas:
+        raise ValueError(f"{ruta} no contiene precios OMIE")
+    datos = np.array(filas)
+    fechas = np.array([f"{int(a):04d}-{int(m):02d}-{int(d):02d}" for a, m, d in datos[:, :3]], dtype='datetime64[D]')
+    periodos = datos[:, 3].astype(np.int64)
+    minutos_paso = 15 if periodos.max() > 25 else 60
+    minutos = _periodos_a_hora_local(fechas.astype('datetime64[m]').astype(np.int64), periodos - 1, minutos_paso)
+    return minutos, datos[:, 4] / 1000, minutos_paso
+
+
+def _leer_csv(ruta):
+    """CSV genérico con fecha_hora (o fecha + hora) y una columna de precio en €/kWh o €/MWh."""
+    import csv
+    import pandas as pd
+
+    with open(ruta, 'r', encoding='utf-8-sig', errors='replace') as f:
+        muestra = f.read(4096)
+    try:
+        separador = csv.Sniffer().sniff(muestra, delimiters=';,\t').delimiter
+    except csv.Error:
+        separador = ','
+    tabla = pd.read_csv(ruta, sep=separador, decimal=',' if separador == ';' else '.', encoding='utf-8-sig')
+
+    columnas = {
+        'fecha_hora': buscar_columna(tabla.columns, COLUMNAS_FECHA_HORA),
+        'fecha': buscar_columna(tabla.columns, COLUMNAS_FECHA),
+        'hora': buscar_columna(tabla.columns, COLUMNAS_HORA),
+    }
+    columna_precio = buscar_columna(tabla.columns, COLUMNAS_PRECIO)
+    if columna_precio is None:
+        raise ValueError(f"No se encuentra la columna de precio en {ruta}: {list(tabla.columns)}")
+    if columnas['fecha_hora'] is None and (columnas['fecha'] is None or columnas['hora'] is None):
+        raise ValueError(f"No se encuentran las columnas de fecha/hora en {ruta}: {list(tabla.columns)}")
+
+    minutos, minuto_dia = minutos_bloque(tabla, columnas)
+    precio = pd.to_numeric(tabla[columna_precio].astype(str).str.replace(',', '.', regex=False),
+                           errors='coerce').to_numpy(float)
+    if 'mwh' in str(columna_precio).lower() or np.nanmedian(precio) > UMBRAL_EUR_MWH:
+        precio = precio / 1000
+
+    saltos = np.diff(np.unique(minutos % 1440))
+    minutos_paso = 15 if len(saltos) and saltos.min() < 60 else 60
+    if minuto_dia is not None:
+        # Marcas de fin de intervalo (Hora 1..24) -> inicio del intervalo, igual que en curvas.py;
+        # la numeración de los días de 23/25 horas se pasa a hora civil
+        fin_intervalo = minuto_dia.min() > 0 or minuto_dia.max() >= 1440
+        indice = (minuto_dia - (minutos_paso if fin_intervalo else 0)) // minutos_paso
+        minutos = _periodos_a_hora_local(minutos - minuto_dia, indice, minutos_paso)
+    return minutos, precio, minutos_paso
+
+
+def importar_precios(ruta, serie=None, almacen=ALMACEN_POR_DEFECTO):
+    """
+    Importa un CSV de precios al almacén (una serie por nombre, un .npy por año).
+    Si la serie ya existe se sustituyen los años que trae el fichero y se conservan los demás.
+    Devuelve el meta de la serie ({'pasos_por_hora', 'anios', 'origen'}).
+    """
+    serie = serie or os.path.splitext(os.path.basename(ruta))[0]
+    with open(ruta, 'r', encoding='latin-1') as f:
+        es_omie = f.readline().strip().upper().startswith('MARGINALPDBC')
+    minutos, precio, minutos_paso = _leer_omie(ruta) if es_omie else _leer_csv(ruta)
+    pasos_por_hora = 60 // minutos_paso
+
+    directorio = _ruta_serie(serie, almacen)
+    os.makedirs(directorio, exist_ok=True)
+    try:
+        meta = _leer_meta(serie, almacen)
+        if meta['pasos_por_hora'] != pasos_por_hora:
+            raise ValueError(f"La serie '{serie}' es de {meta['pasos_por_hora']} pasos/hora y {ruta} de {pasos_por_hora}")
+    except ValueError as error:
+        if 'pasos/hora' in str(error):
+            raise
+        meta = {'pasos_por_hora': pasos_por_hora, 'anios': [], 'origen': []}
+
+    tiempo = minutos.astype('datetime64[m]')
+    anios = tiempo.astype('datetime64[Y]').astype(np.int64) + 1970
+    for anio in np.unique(anios).tolist():
+        inicio = np.datetime64(f'{anio}-01-01T00:00')
+        n_pasos = int((np.datetime64(f'{anio + 1}-01-01T00:00') - inicio).astype(np.int64)) // minutos_paso
+        seleccion = (anios == anio) & np.isfinite(precio)
+        posicion = (tiempo[seleccion] - inicio).astype(np.int64) // minutos_paso
+        # Pasos repetidos (la hora doble de octubre) -> media
+        suma = np.bincount(posicion, weights=precio[seleccion], minlength=n_pasos)
+        cuenta = np.bincount(posicion, minlength=n_pasos)
+        rejilla = np.full(n_pasos, np.nan, dtype=np.float32)
+        rejilla[cuenta > 0] = suma[cuenta > 0] / cuenta[cuenta > 0]
+        # Hora inexistente de marzo (02:00-03:00) -> media del paso anterior y el posterior
+        hueco = (dias_cambio_hora(anio)[0] + np.timedelta64(2, 'h') - inicio).astype(np.int64) // minutos_paso
+        vecinos = rejilla[[hueco - 1, hueco + pasos_por_hora]]
+        if np.isnan(rejilla[hueco:hueco + pasos_por_hora]).all() and np.isfinite(vecinos).all():
+            rejilla[hueco:hueco + pasos_por_hora] = vecinos.mean()
+        np.save(os.path.join(directorio, f'{anio}.npy'), rejilla)
+        meta['anios'] = sorted(set(meta['anios']) | {anio})
+    meta['origen'] = sorted(set(meta['origen']) | {os.path.basename(ruta)})
+
+    with open(os.path.join(directorio, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    _serie_anio.cache_clear()
+    return meta
+
+
+# --- CONSULTA ---
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _serie_anio(almacen, serie, anio):
+    ruta = os.path.join(_ruta_serie(serie, almacen), f'{anio}.npy')
+    if not os.path.exists(ruta):
+        raise ValueError(f"La serie de precios '{serie}' no tiene datos de {anio}")
+    return np.load(ruta, mmap_mode='r')
+
+
+def precios_en(tiempo, serie, almacen=ALMACEN_POR_DEFECTO):
+    """
+    Precio (€/kWh) de la serie en cada marca datetime64 (inicio del paso).
+    Si la consulta es más gruesa que la serie (horaria sobre cuarto-horaria) se promedian los
+    sub-pasos; si es más fina, cada paso toma el precio del intervalo que lo contiene.
+    """
+    meta = _leer_meta(serie, almacen)
+    minutos_serie = 60 // meta['pasos_por_hora']
+    tiempo = np.asarray(tiempo, dtype='datetime64[m]')
+    minutos_consulta = int((tiempo[1] - tiempo[0]).astype(np.int64)) if len(tiempo) > 1 else minutos_serie
+    sub_pasos = max(minutos_consulta // minutos_serie, 1)
+
+    precio = np.empty(len(tiempo))
+    anios = tiempo.astype('datetime64[Y]').astype(np.int64) + 1970
+    for anio in np.unique(anios).tolist():
+        seleccion = anios == anio
+        datos = _serie_anio(almacen, serie, anio)
+        posicion = (tiempo[seleccion] - np.datetime64(f'{anio}-01-01T00:00')).astype(np.int64) // minutos_serie
+        precio[seleccion] = datos[posicion[:, None] + np.arange(sub_pasos)].mean(axis=1)
+
+    huecos = int(np.isnan(precio).sum())
+    if huecos:
+        raise ValueError(f"La serie de precios '{serie}' tiene {huecos} huecos entre {tiempo[0]} y {tiempo[-1]}")
+    return precio
+
+
+def precios_desde(serie, inicio, dias=30, pasos_por_hora=1, almacen=ALMACEN_POR_DEFECTO):
+    """Precios de `dias` días a partir de 'aaaa-mm-dd' en la resolución pedida."""
+    minutos_paso = 60 // pasos_por_hora
+    tiempo = np.datetime64(inicio, 'm') + np.arange(dias * 24 * pasos_por_hora) * np.timedelta64(minutos_paso, 'm')
+    return precios_en(tiempo, serie, almacen)
+
+
+def entradas_indexadas(precio, dia, consumo=None):
+    """
+    Entradas del motor con precio indexado: (precio_compra, es_valle, precio_punta) por paso.
+    Valle = la fracción FRACCION_VALLE de pasos más baratos de cada día; el precio de reventa
+    es la media del resto del día (ver tarifas.precio_reventa).
+    """
+    precio = np.asarray(precio, dtype=float)
+    dia = np.unique(np.asarray(dia), return_inverse=True)[1]
+    orden = np.lexsort((precio, dia))
+    pasos_dia = np.bincount(dia)
+    inicio_dia = np.concatenate(([0], np.cumsum(pasos_dia)[:-1]))
+    rango_en_dia = np.empty(len(precio), dtype=np.int64)
+    rango_en_dia[orden] = np.arange(len(precio)) - inicio_dia[dia[orden]]
+    es_valle = rango_en_dia < np.ceil(pasos_dia * FRACCION_VALLE)[dia]
+    periodos = np.where(es_valle, PERIODO_VALLE, 0)
+    return precio, es_valle, precio_reventa(periodos, precio, dia, consumo)
+
+
+def precios_curva_indexada(tiempo, serie, consumo=None, almacen=ALMACEN_POR_DEFECTO):
+    """entradas_indexadas para una curva real (los días salen de las marcas de tiempo)."""
+    tiempo = np.asarray(tiempo, dtype='datetime64[m]')
+    return entradas_indexadas(precios_en(tiempo, serie, almacen), tiempo.astype('datetime64[D]'), consumo)
+
+
+def con_precios_indexados(datos_facturas, serie, anio, almacen=ALMACEN_POR_DEFECTO):
+    """Copia de las facturas con precio indexado de la serie (fecha de inicio sacada de la etiqueta del mes)."""
+    return [{**mes, 'serie_precios': serie, 'almacen_precios': almacen,
+             'inicio': mes.get('inicio') or inicio_desde_etiqueta(mes['mes'], anio)}
+            for mes in datos_facturas]
@@ -0,0 +1,411 @@
+import os
+import math
+import json
+import time
+import hashlib
+import argparse
+import threading
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from motor import simular_mes, ESTRATEGIAS
+from perfiles import SECTORES, SECTOR_POR_DEFECTO
+from cartera import normalizar_meses
+from precios import series_disponibles, firma_serie
+from fotovoltaica import INSTALACION_POR_DEFECTO
+from linea_temporal import simular_linea_temporal
+
+# --- SERVICIO HTTP JSON DE SIMULACIÓN ---
+# Servidor local (solo biblioteca estándar + el motor) para que otras aplicaciones (CRM) pidan
+# ahorro y retorno sin pasar por los scripts ni por Streamlit:
+#   POST /simular   {"meses": [...], "cap_bat": 100, "pot_bat": 50, ...}  -> un resultado
+#   POST /lote      {"comunes": {...}, "configuraciones": [{...}, ...]}   -> una lista de resultados
+#   GET  /metricas  cola, caché y percentiles de latencia | GET /salud
+# Los meses usan el formato de datos_reales_cliente (o las columnas de la tabla de la app).
+#
+# Las simulaciones corren en un ProcessPoolExecutor acotado (como cartera.py); los hilos HTTP
+# solo validan, consultan la caché y esperan. Si la cola de trabajos pendientes supera
+# COLA_MAXIMA se responde 503 en lugar de acumular peticiones.
+# Caché LRU de resultados con clave = huella de la petición canónica (valores por defecto
+# rellenados, claves ordenadas): dos peticiones iguales escritas distinto comparten resultado, y
+# una petición idéntica a otra que aún se está calculando espera a esa en lugar de repetirla.
+# La clave incluye la firma de las series de precios indexados usadas, así que reimportar una
+# serie invalida sus resultados.
+# Los meses solo admiten las claves de CLAVES_MES: nada que sea una ruta del disco del servidor
+# (ni 'almacen_precios' ni 'fotovoltaica.tmy'); 'serie_precios' debe ser una serie ya importada
+# en el almacén por defecto.
+#
+#   python servicio.py --puerto 8000 --procesos 4
+#   curl -s localhost:8000/simular -d '{"meses": [...], "cap_bat": 150}'
+
+PUERTO_POR_DEFECTO = 8000
+COLA_MAXIMA = 256
+TAMANO_CACHE_RESULTADOS = 1024
+MAX_CONFIGURACIONES_LOTE = 500
+VENTANA_LATENCIAS = 2000  # Últimas peticiones por ruta para los percentiles
+TIEMPO_MAXIMO_S = 300
+PERCENTILES = (50, 90, 99)
+
+PARAMETROS_POR_DEFECTO = {
+    'cap_bat': 100.0,
+    'pot_bat': 50.0,
+    'eficiencia': 0.90,
+    'sector': SECTOR_POR_DEFECTO,
+    'estrategia': 'heuristica',
+    'precio_venta_excedente': 0.10,
+    'coste_kwh': 300.0,
+    'coste_kw': 0.0,
+    'inversion': None,   # None: cap_bat * coste_kwh + pot_bat * coste_kw (como cartera.py)
+    'continuo': False,   # Línea temporal continua (linea_temporal.py)
+    'anio': None,
+}
+
+CLAVES_MES = ('mes', 'consumo_total_kwh', 'excedente_total_kwh', 'precio_valle', 'precio_punta',
+              'precio_venta_excedente', 'autoconsumo_kwh', 'dias', 'inicio', 'precios_periodo',
+              'serie_precios', 'fotovoltaica')
+CLAVES_FOTOVOLTAICA = tuple(k for k in INSTALACION_POR_DEFECTO if k != 'tmy')
+
+
+def normalizar_solicitud(datos):
+    """
+    Petición canónica: parámetros por defecto, tipos numéricos y meses normalizados.
+    Lanza ValueError con un mensaje para el cliente si algo no es válido.
+    """
+    if not isinstance(datos, dict):
+        raise ValueError("La petición debe ser un objeto JSON")
+    desconocidos = set(datos) - set(PARAMETROS_POR_DEFECTO) - {'meses'}
+    if desconocidos:
+        raise ValueError(f"Parámetros desconocidos: {sorted(desconocidos)}")
+    if not isinstance(datos.get('meses'), list) or not all(isinstance(m, dict) for m in datos['meses']):
+        raise ValueError("Falta 'meses' (lista de objetos, un mes de factura cada uno)")
+
+    solicitud = {**PARAMETROS_POR_DEFECTO, **datos}
+    for clave in ('cap_bat', 'pot_bat', 'eficiencia', 'precio_venta_excedente', 'coste_kwh', 'coste_kw'):
+        solicitud[clave] = float(solicitud[clave])
+    if solicitud['inversion'] is not None:
+        solicitud['inversion'] = float(solicitud['inversion'])
+    # json acepta NaN e Infinity, que pasarían todas las comparaciones de rango de abajo
+    no_finitos = [clave for clave in ('cap_bat', 'pot_bat', 'eficiencia', 'precio_venta_excedente', 'coste_kwh',
+                                      'coste_kw', 'inversion')
+                  if solicitud[clave] is not None and not math.isfinite(solicitud[clave])]
+    if no_finitos:
+        raise ValueError(f"Parámetros que no son números finitos: {no_finitos}")
+    if solicitud['anio'] is not None:
+        solicitud['anio'] = int(solicitud['anio'])
+    solicitud['continuo'] = bool(solicitud['continuo'])
+    if solicitud['sector'] not in SECTORES:
+        raise ValueError(f"Sector desconocido '{solicitud['sector']}'. Opciones: {', '.join(SECTORES)}")
+    if solicitud['estrategia'] not in ESTRATEGIAS:
+        raise ValueError(f"Estrategia desconocida '{solicitud['estrategia']}'. Opciones: {', '.join(ESTRATEGIAS)}")
+    if solicitud['cap_bat'] <= 0 or solicitud['pot_bat'] <= 0 or not 0 < solicitud['eficiencia'] <= 1:
+        raise ValueError("cap_bat y pot_bat deben ser > 0 y eficiencia estar en (0, 1]")
+    solicitud['meses'] = normalizar_meses(solicitud['meses'], solicitud['precio_venta_excedente'], "'meses'")
+    for mes in solicitud['meses']:
+        validar_mes(mes)
+    return solicitud
+
+
+def validar_mes(mes):
+    """
+    Rechaza las claves de mes que el servicio no acepta (rutas del disco incluidas) y las series
+    de precios que no están en el almacén por defecto. Lanza ValueError.
+    """
+    desconocidas = set(mes) - set(CLAVES_MES)
+    if desconocidas:
+        raise ValueError(f"Claves de mes no admitidas en el mes {mes['mes']}: {sorted(desconocidas)}")
+    serie = mes.get('serie_precios')
+    if serie and serie not in series_disponibles():
+        raise ValueError(f"Serie de precios desconocida '{serie}'. Opciones: {', '.join(series_disponibles()) or 'ninguna'}")
+    if 'fotovoltaica' in mes:
+        if not isinstance(mes['fotovoltaica'], dict):
+            raise ValueError("'fotovoltaica' debe ser un objeto con los parámetros de la instalación")
+        desconocidas = set(mes['fotovoltaica']) - set(CLAVES_FOTOVOLTAICA)
+        if desconocidas:
+            raise ValueError(f"Parámetros de instalación no admitidos: {sorted(desconocidas)}")
+
+
+def clave_solicitud(solicitud):
+    """Huella de la petición canónica (JSON con claves ordenadas) y de las series de precios que usa."""
+    series = sorted({mes['serie_precios'] for mes in solicitud['meses'] if mes.get('serie_precios')})
+    firmas = {serie: firma_serie(serie) for serie in series}
+    contenido = json.dumps([solicitud, firmas], sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(contenido.encode(), digest_size=16).hexdigest()
+
+
+def simular_solicitud(solicitud):
+    """Trabajo de un proceso del pool: simula una petición canónica. Devuelve un dict JSON."""
+    inicio = time.perf_counter()
+    meses = solicitud['meses']
+    argumentos = (solicitud['cap_bat'], solicitud['pot_bat'], solicitud['eficiencia'], solicitud['sector'],
+                  solicitud['estrategia'])
+    if solicitud['continuo']:
+        linea = simular_linea_temporal(meses, *argumentos, anio=solicitud['anio'])
+        ahorros = [(p['ahorro'], p['ahorro_heuristica']) for p in linea['puntos_control']]
+        factor_anual = 365 * 24 / linea['pasos_totales']
+    else:
+        ahorros = []
+        for mes in meses:
+            res_mes = simular_mes(mes, *argumentos)
+            ahorros.append((res_mes['ahorro'], res_mes['ahorro_heuristica']))
+        factor_anual = 12 / len(meses)
+
+    ahorro_total = sum(a for a, _ in ahorros)
+    ahorro_anual = ahorro_total * factor_anual
+    inversion = solicitud['inversion']
+    if inversion is None:
+        inversion = solicitud['cap_bat'] * solicitud['coste_kwh'] + solicitud['pot_bat'] * solicitud['coste_kw']
+    return {
+        'cap_bat': solicitud['cap_bat'],
+        'pot_bat': solicitud['pot_bat'],
+        'estrategia': solicitud['estrategia'],
+        'meses': [{'mes': mes['mes'], 'ahorro': round(a, 2), 'ahorro_heuristica': round(h, 2)}
+                  for mes, (a, h) in zip(meses, ahorros)],
+        'ahorro_total': round(ahorro_total, 2),
+        'ahorro_heuristica_total': round(sum(h for _, h in ahorros), 2),
+        'ahorro_anual': round(ahorro_anual, 2),
+        'inversion': round(inversion, 2),
+        'retorno_anios': round(inversion / ahorro_anual, 2) if ahorro_anual > 0 else 999,
+        'tiempo_simulacion_s': round(time.perf_counter() - inicio, 4),
+    }
+
+
+def _nada():
+    return None
+
+
+def crear_estado(procesos=None, cola_maxima=COLA_MAXIMA, tamano_cache=TAMANO_CACHE_RESULTADOS):
+    """
+    Estado compartido por los hilos del servidor: pool, caché, trabajos en curso y métricas.
+    Los procesos del pool se arrancan aquí, antes de que existan los hilos HTTP.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=procesos)
+    for futuro in [pool.submit(_nada) for _ in range(procesos)]:
+        futuro.result()
+    return {
+        'pool': pool,
+        'procesos': procesos,
+        'cola_maxima': cola_maxima,
+        'tamano_cache': tamano_cache,
+        'cerrojo': threading.Lock(),
+        'cache': OrderedDict(),
+        'en_curso': {},
+        'pendientes': 0,
+        'aciertos': 0,
+        'fallos': 0,
+        'compartidos': 0,
+        'rechazadas': 0,
+        'errores': 0,
+        'peticiones': {},
+        'latencias': {},
+        'latencias_simulacion': deque(maxlen=VENTANA_LATENCIAS),
+        'inicio': time.time(),
+    }
+
+
+class ColaLlena(Exception):
+    """La cola de simulaciones pendientes ha llegado a COLA_MAXIMA."""
+
+
+def _terminado(estado, clave, futuro):
+    """Callback del futuro: guarda el resultado en la caché y libera el hueco de la cola."""
+    with estado['cerrojo']:
+        estado['pendientes'] -= 1
+        estado['en_curso'].pop(clave, None)
+        if futuro.cancelled() or futuro.exception() is not None:
+            return
+        resultado = futuro.result()
+        estado['latencias_simulacion'].append(resultado['tiempo_simulacion_s'] * 1000)
+        estado['cache'][clave] = resultado
+        while len(estado['cache']) > estado['tamano_cache']:
+            estado['cache'].popitem(last=False)
+
+
+def encolar(estado, solicitud):
+    """
+    Resultado de la caché o futuro de la simulación (compartido si ya hay una igual en curso).
+    Devuelve (resultado o None, futuro o None, origen) con origen 'cache', 'en_curso' o 'calculado'.
+    Lanza ColaLlena si no caben más trabajos.
+    """
+    clave = clave_solicitud(solicitud)
+    with estado['cerrojo']:
+        if clave in estado['cache']:
+            estado['cache'].move_to_end(clave)
+            estado['aciertos'] += 1
+            return estado['cache'][clave], None, 'cache'
+        if clave in estado['en_curso']:
+            estado['compartidos'] += 1
+            return None, estado['en_curso'][clave], 'en_curso'
+        if estado['pendientes'] >= estado['cola_maxima']:
+            estado['rechazadas'] += 1
+            raise ColaLlena(f"Cola llena ({estado['cola_maxima']} simulaciones pendientes)")
+        estado['fallos'] += 1
+        estado['pendientes'] += 1
+        try:
+            futuro = estado['pool'].submit(simular_solicitud, solicitud)
+        except BrokenProcessPool:
+            # Un proceso murió (p.ej. sin memoria): se rehace el pool para las siguientes peticiones
+            estado['pendientes'] -= 1
+            estado['pool'] = ProcessPoolExecutor(max_workers=estado['procesos'])
+            futuro = estado['pool'].submit(simular_solicitud, solicitud)
+            estado['pendientes'] += 1
+        estado['en_curso'][clave] = futuro
+    futuro.add_done_callback(lambda f: _terminado(estado, clave, f))
+    return None, futuro, 'calculado'
+
+
+def resolver(estado, solicitudes):
+    """Encola todas las solicitudes y espera sus resultados (en el mismo orden) con el campo 'origen'."""
+    encoladas = [encolar(estado, s) for s in solicitudes]
+    resultados = []
+    for resultado, futuro, origen in encoladas:
+        if futuro is not None:
+            resultado = futuro.result(timeout=TIEMPO_MAXIMO_S)
+        resultados.append({**resultado, 'origen': origen})
+    return resultados
+
+
+def percentiles(valores):
+    """Percentiles PERCENTILES (ms) y número de muestras de una ventana de latencias."""
+    if not valores:
+        return {'n': 0}
+    calculados = np.percentile(np.fromiter(valores, dtype=float), PERCENTILES)
+    return {'n': len(valores), **{f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, calculados)}}
+
+
+def metricas(estado):
+    """Resumen para GET /metricas."""
+    with estado['cerrojo']:
+        consultas = estado['aciertos'] + estado['fallos']
+        return {
+            'activo_s': round(time.time() - estado['inicio'], 1),
+            'cola': {
+                'pendientes': estado['pendientes'],
+                'en_ejecucion': min(estado['pendientes'], estado['procesos']),
+                'en_espera': max(estado['pendientes'] - estado['procesos'], 0),
+                'maxima': estado['cola_maxima'],
+                'procesos': estado['procesos'],
+            },
+            'cache': {
+                'entradas': len(estado['cache']),
+                'capacidad': estado['tamano_cache'],
+                'aciertos': estado['aciertos'],
+                'fallos': estado['fallos'],
+                'compartidos_en_curso': estado['compartidos'],
+                'tasa_acierto': round(estado['aciertos'] / consultas, 4) if consultas else None,
+            },
+            'peticiones': dict(estado['peticiones']),
+            'rechazadas': estado['rechazadas'],
+            'errores': estado['errores'],
+            'latencia_ms': {ruta: percentiles(list(v)) for ruta, v in estado['latencias'].items()},
+            'simulacion_ms': percentiles(list(estado['latencias_simulacion'])),
+        }
+
+
+def solicitudes_lote(datos):
+    """Peticiones de POST /lote: cada configuración se combina con los parámetros 'comunes'."""
+    if not isinstance(datos, dict) or not isinstance(datos.get('configuraciones'), list):
+        raise ValueError("El lote necesita 'configuraciones' (lista) y opcionalmente 'comunes'")
+    if len(datos['configuraciones']) > MAX_CONFIGURACIONES_LOTE:
+        raise ValueError(f"Como mucho {MAX_CONFIGURACIONES_LOTE} configuraciones por lote")
+    comunes = datos.get('comunes') or {}
+    return [normalizar_solicitud({**comunes, **configuracion}) for configuracion in datos['configuraciones']]
+
+
+class ManejadorSimulacion(BaseHTTPRequestHandler):
+    """Rutas del servicio; el estado compartido está en self.server.estado."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/salud':
+            self._responder(200, {'estado': 'ok'})
+        elif self.path == '/metricas':
+            self._responder(200, metricas(self.server.estado))
+        else:
+            self._responder(404, {'error': f"Ruta desconocida {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ('/simular', '/lote'):
+            self._responder(404, {'error': f"Ruta desconocida {self.path}"})
+            return
+        inicio = time.perf_counter()
+        estado = self.server.estado
+        try:
+            longitud = int(self.headers.get('Content-Length', 0))
+            datos = json.loads(self.rfile.read(longitud) or b'null')
+            if self.path == '/simular':
+                respuesta = resolver(estado, [normalizar_solicitud(datos)])[0]
+            else:
+                resultados = resolver(estado, solicitudes_lote(datos))
+                respuesta = {'resultados': resultados,
+                             'aciertos_cache': sum(r['origen'] == 'cache' for r in resultados)}
+            respuesta['tiempo_s'] = round(time.perf_counter() - inicio, 4)
+            codigo = 200
+        except (ValueError, TypeError) as error:  # JSON mal formado o datos inválidos
+            codigo, respuesta = 400, {'error': str(error)}
+        except ColaLlena as error:
+            codigo, respuesta = 503, {'error': str(error)}
+        except Exception as error:
+            codigo, respuesta = 500, {'error': f"{type(error).__name__}: {error}"}
+            traceback.print_exc()
+        with estado['cerrojo']:
+            estado['peticiones'][self.path] = estado['peticiones'].get(self.path, 0) + 1
+            if codigo == 500:
+                estado['errores'] += 1
+            estado['latencias'].setdefault(self.path, deque(maxlen=VENTANA_LATENCIAS)).append(
+                (time.perf_counter() - inicio) * 1000)
+        self._responder(codigo, respuesta, {'Retry-After': '1'} if codigo == 503 else None)
+
+    def _responder(self, codigo, cuerpo, cabeceras=None):
+        contenido = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(contenido)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, formato, *args):
+        if not self.server.silencioso:
+            super().log_message(formato, *args)
+
+
+def crear_servidor(host='127.0.0.1', puerto=PUERTO_POR_DEFECTO, procesos=None, cola_maxima=COLA_MAXIMA,
+                   tamano_cache=TAMANO_CACHE_RESULTADOS, silencioso=False):
+    """ThreadingHTTPServer listo para serve_forever() (cerrar con server_close() y estado['pool'].shutdown())."""
+    estado = crear_estado(procesos, cola_maxima, tamano_cache)
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorSimulacion)
+    servidor.daemon_threads = True
+    servidor.estado = estado
+    servidor.silencioso = silencioso
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP JSON de simulación Solar + Arbitraje")
+    parser.add_argument('--host', default='127.0.0.1', help="Interfaz de escucha (0.0.0.0 dentro de Docker)")
+    parser.add_argument('--puerto', type=int, default=PUERTO_POR_DEFECTO)
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos de simulación (por defecto, uno por núcleo)")
+    parser.add_argument('--cola-maxima', type=int, default=COLA_MAXIMA, help="Simulaciones pendientes antes de responder 503")
+    parser.add_argument('--tamano-cache', type=int, default=TAMANO_CACHE_RESULTADOS, help="Resultados en la caché LRU")
+    parser.add_argument('--silencioso', action='store_true', help="Sin registro de cada petición")
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.host, args.puerto, args.procesos, args.cola_maxima, args.tamano_cache, args.silencioso)
+    print(f"\n--- SERVICIO DE SIMULACIÓN: http://{args.host}:{args.puerto} | {servidor.estado['procesos']} procesos ---")
+    print("POST /simular | POST /lote | GET /metricas | GET /salud")
+    print("-" * 60)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.estado['pool'].shutdown(cancel_futures=True)
@@ -0,0 +1,166 @@
+from functools import lru_cache
+
+import numpy as np
+
+# --- CALENDARIO TARIFARIO 3.0TD (PERIODOS P1 - P6) ---
+# Periodo de cada paso según temporada eléctrica, día laborable / fin de semana / festivo
+# nacional y hora (Circular CNMC 3/2020, península). El calendario de un año se calcula una vez
+# por resolución como array int8 de solo lectura (0 = P1 ... 5 = P6) y se guarda en una caché LRU;
+# a partir de ahí precios de energía, términos de potencia o excesos son un simple indexado
+# precios[periodos] sobre todos los pasos a la vez.
+
+TAMANO_CACHE = 16
+PERIODOS = ('P1', 'P2', 'P3', 'P4', 'P5', 'P6')
+PERIODO_VALLE = 5  # P6: 00-08h laborables y todo el día en fines de semana y festivos
+HORA_FIN_VALLE = 8  # Tarifa de dos precios de las facturas: 00-08h Valle | 08-00h Punta
+
+# Temporada eléctrica de cada mes (enero ... diciembre): 0 alta, 1 media alta, 2 media, 3 baja
+TEMPORADAS = ('alta', 'media_alta', 'media', 'baja')
+TEMPORADA_MES = np.array([0, 0, 1, 3, 3, 2, 0, 2, 2, 3, 1, 0], dtype=np.int8)
+
+# Periodo de cada hora en días laborables, por temporada (índices 0..5 = P1..P6)
+_TRAMOS_LABORABLE = (
+    # 00-08, 08-09, 09-14, 14-18, 18-22, 22-24
+    (5, 1, 0, 1, 0, 1),   # Alta:       P6 P2 P1 P2 P1 P2
+    (5, 2, 1, 2, 1, 2),   # Media alta: P6 P3 P2 P3 P2 P3
+    (5, 3, 2, 3, 2, 3),   # Media:      P6 P4 P3 P4 P3 P4
+    (5, 4, 3, 4, 3, 4),   # Baja:       P6 P5 P4 P5 P4 P5
+)
+_HORAS_TRAMO = (8, 1, 5, 4, 4, 2)
+HORARIO_LABORABLE = np.array([np.repeat(t, _HORAS_TRAMO) for t in _TRAMOS_LABORABLE], dtype=np.int8)  # (4, 24)
+
+# Festivos nacionales de fecha fija (los sustituibles y los de fecha variable no cuentan)
+FESTIVOS_NACIONALES = ((1, 1), (1, 6), (5, 1), (8, 15), (10, 12), (11, 1), (12, 6), (12, 8), (12, 25))
+
+# Abreviaturas de mes de las facturas ('Mar-Abr' -> marzo)
+MESES_ES = ('ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic')
+
+
+def _solo_lectura(array):
+    array.setflags(write=False)
+    return array
+
+
+def dias_cambio_hora(anio):
+    """Días del cambio de hora europeo (último domingo de marzo y de octubre) como datetime64[D]."""
+    dias = []
+    for mes_siguiente in ('04', '11'):
+        ultimo = np.datetime64(f'{anio}-{mes_siguiente}-01') - np.timedelta64(1, 'D')
+        dia_semana = (ultimo.astype(np.int64) + 3) % 7  # lunes = 0, domingo = 6
+        dias.append(ultimo - np.timedelta64((dia_semana + 1) % 7, 'D'))
+    return tuple(dias)
+
+
+def periodos_en(tiempo):
+    """
+    Periodo 3.0TD (0..5) de cada instante de un array datetime64 (cualquier resolución).
+    La marca es el inicio del intervalo (como la rejilla de curvas.cargar_curva).
+    """
+    tiempo = np.asarray(tiempo, dtype='datetime64[m]')
+    dias = tiempo.astype('datetime64[D]')
+    hora = ((tiempo - dias).astype(np.int64) // 60).astype(np.int64)
+    mes = dias.astype('datetime64[M]').astype(np.int64) % 12
+    dia_mes = (dias - dias.astype('datetime64[M]')).astype(np.int64) + 1
+    dia_semana = (dias.astype(np.int64) + 3) % 7  # 1970-01-01 fue jueves -> lunes = 0
+
+    clave = (mes + 1) * 100 + dia_mes
+    festivo = np.isin(clave, [m * 100 + d for m, d in FESTIVOS_NACIONALES])
+    laborable = (dia_semana < 5) & ~festivo
+
+    periodos = HORARIO_LABORABLE[TEMPORADA_MES[mes], hora]
+    return np.where(laborable, periodos, PERIODO_VALLE).astype(np.int8)
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def calendario_periodos(anio, pasos_por_hora=1):
+    """
+    Calendario 3.0TD de un año completo: int8 de solo lectura con 8760 (8784) horas
+    o 35.040 (35.136) cuartos de hora.
+    """
+    minutos_paso = 60 // pasos_por_hora
+    tiempo = np.arange(np.datetime64(f'{anio}-01-01T00:00'), np.datetime64(f'{anio + 1}-01-01T00:00'),
+                       np.timedelta64(minutos_paso, 'm'))
+    return _solo_lectura(periodos_en(tiempo))
+
+
+def periodos_desde(inicio, dias=30, pasos_por_hora=1):
+    """Periodos de `dias` días a partir de la fecha `inicio` ('aaaa-mm-dd'), usando los calendarios cacheados."""
+    inicio = np.datetime64(inicio, 'D')
+    anio = int(str(inicio)[:4])
+    pasos_dia = 24 * pasos_por_hora
+    desplazamiento = int((inicio - np.datetime64(f'{anio}-01-01', 'D')).astype(np.int64)) * pasos_dia
+    n_pasos = dias * pasos_dia
+
+    trozos = []
+    while n_pasos > 0:
+        calendario = calendario_periodos(anio, pasos_por_hora)
+        trozo = calendario[desplazamiento:desplazamiento + n_pasos]
+        trozos.append(trozo)
+        n_pasos -= len(trozo)
+        anio += 1
+        desplazamiento = 0
+    return trozos[0] if len(trozos) == 1 else np.concatenate(trozos)
+
+
+def inicio_desde_etiqueta(etiqueta, anio):
+    """Fecha de inicio aproximada de una factura a partir de su etiqueta ('Mar-Abr' -> 'aaaa-03-01')."""
+    mes = MESES_ES.index(str(etiqueta).strip()[:3].lower()) + 1
+    return f'{anio}-{mes:02d}-01'
+
+
+def precios_por_periodo(periodos, precios):
+    """Precio de cada paso: precios (6 valores, P1..P6) indexados por el array de periodos."""
+    return np.asarray(precios, dtype=float)[periodos]
+
+
+def precio_reventa(periodos, precio, dia, consumo=None):
+    """
+    Precio al que se "revende" la energía cargada de red en valle: media (ponderada por consumo
+    si se indica) del precio de los pasos no valle del mismo día (dia = identificador de día de
+    cada paso). 0 en días sin horas no valle (fines de semana y festivos): esos días no compensa
+    cargar de red. Devuelve un array por paso, listo para el argumento precio_punta del motor.
+    """
+    dia = np.unique(np.asarray(dia), return_inverse=True)[1]
+    peso = (np.asarray(periodos) != PERIODO_VALLE).astype(float)
+    if consumo is not None:
+        peso = peso * np.asarray(consumo, dtype=float)
+    suma_peso = np.bincount(dia, weights=peso)
+    suma_precio = np.bincount(dia, weights=peso * np.asarray(precio, dtype=float))
+    media = np.divide(suma_precio, suma_peso, out=np.zeros(len(suma_peso)), where=suma_peso > 0)
+    return media[dia]
+
+
+def precios_dos_tramos(hora, precio_valle, precio_punta):
+    """
+    Entradas del motor con la tarifa de dos precios de las facturas (00-08h Valle | 08-00h Punta)
+    para un array de horas del día: (precio_compra, es_valle, precio_punta).
+    """
+    es_valle = np.asarray(hora) < HORA_FIN_VALLE
+    return np.where(es_valle, precio_valle, precio_punta), es_valle, precio_punta
+
+
+def precios_tarifa(periodos, precios_periodo, dia, consumo=None):
+    """
+    Entradas del motor con tarifa de 6 periodos: (precio_compra, es_valle, precio_punta) por paso.
+    Valle = P6; el umbral de arbitraje usa el precio real de reventa de cada día (precio_reventa).
+    """
+    precio_compra = precios_por_periodo(periodos, precios_periodo)
+    es_valle = np.asarray(periodos) == PERIODO_VALLE
+    return precio_compra, es_valle, precio_reventa(periodos, precio_compra, dia, consumo)
+
+
+def precios_curva(tiempo, precios_periodo, consumo=None):
+    """precios_tarifa para una curva real: periodos y días salen de las marcas de tiempo."""
+    tiempo = np.asarray(tiempo, dtype='datetime64[m]')
+    return precios_tarifa(periodos_en(tiempo), precios_periodo, tiempo.astype('datetime64[D]'), consumo)
+
+
+def con_tarifa(datos_facturas, precios_periodo, anio):
+    """Copia de las facturas con los 6 precios P1..P6 y la fecha de inicio sacada de la etiqueta del mes."""
+    return [{**mes, 'precios_periodo': list(precios_periodo), 'inicio': mes.get('inicio') or inicio_desde_etiqueta(mes['mes'], anio)}
+            for mes in datos_facturas]
+
+
+def termino_potencia(potencias_contratadas, precios_potencia, dias):
+    """Término fijo de potencia (€): sum(kW contratados x €/kW·año) prorrateado por días."""
+    return float(np.dot(potencias_contratadas, precios_potencia)) * dias / 365
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+# --- TRAZA PASO A PASO (BÚFER COLUMNAR FLOAT32) ---
+# Una sola matriz float32 de forma (n_columnas, n_pasos) reservada de antemano para todo el
+# periodo simulado: cada columna (SOC, carga, descarga, compra de red, balance) es una fila
+# contigua, así que cualquier ventana de cualquier mes es un corte sin copia.
+# El motor escribe directamente en la vista del mes que le toca (argumento traza=).
+# Para simulaciones de varios años la matriz puede vivir en un .npy mapeado en memoria
+# (np.lib.format.open_memmap) en lugar de en RAM; abrir_traza la vuelve a abrir sin leerla.
+
+COLUMNAS_TRAZA = ('soc', 'carga', 'descarga', 'red', 'balance')
+SOC, CARGA, DESCARGA, RED, BALANCE = range(len(COLUMNAS_TRAZA))
+TIPO_TRAZA = np.float32
+
+
+def crear_traza(n_pasos, ruta=None):
+    """
+    Búfer (n_columnas, n_pasos) a ceros. Con ruta, un .npy mapeado en memoria (el SO va
+    volcando a disco lo que no cabe); sin ruta, un array en RAM.
+    """
+    forma = (len(COLUMNAS_TRAZA), int(n_pasos))
+    if ruta is None:
+        return np.zeros(forma, dtype=TIPO_TRAZA)
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    return np.lib.format.open_memmap(ruta, mode='w+', dtype=TIPO_TRAZA, shape=forma)
+
+
+def abrir_traza(ruta):
+    """Abre una traza guardada en modo solo lectura sin cargarla (mmap)."""
+    return np.load(ruta, mmap_mode='r')
+
+
+def escribir_traza(traza, consumo, soc, balance, carga, carga_red, descarga):
+    """
+    Rellena una vista (n_columnas, n_pasos) con la salida de un despacho.
+    carga es la carga total (solar + red) y carga_red la parte comprada para arbitraje:
+    la compra de red del paso es el consumo no cubierto por la batería más esa carga.
+    """
+    traza[SOC] = soc
+    traza[CARGA] = carga
+    traza[DESCARGA] = descarga
+    traza[RED] = np.maximum(np.asarray(consumo, dtype=float) - descarga, 0.0) + carga_red
+    traza[BALANCE] = balance
+
+
+def ventana(traza, inicio, n_pasos):
+    """Corte sin copia de todas las columnas entre inicio e inicio + n_pasos."""
+    return traza[:, inicio:inicio + n_pasos]
+
+
+def columnas(traza):
+    """Dict nombre -> fila de la traza (vistas, sin copia)."""
+    return {nombre: traza[i] for i, nombre in enumerate(COLUMNAS_TRAZA)}